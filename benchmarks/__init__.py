@@ -0,0 +1,6 @@
+"""
+Stellator benchmarks
+
+Synthetic VMware Fusion fleets with fake vmrun and arp commands, and scenarios
+timing stellator commands against them
+"""
@@ -0,0 +1,382 @@
+"""
+Synthetic VMware Fusion fleet
+
+Generates a home directory with VMware Fusion application directory, .vmx bundles,
+vmInventory file and stellator configuration, and fake vmrun and arp commands with
+configurable latency.
+"""
+
+import os
+import random
+import shutil
+import stat
+
+# Fake vmrun. Running VMs are stored in running file next to it. Starting a VM creates
+# .lck directory and removes .vmss file, suspend creates .vmss file.
+FAKE_VMRUN = '''#!/bin/sh
+STATE="{state}"
+LOCK="$STATE.lock"
+sleep {latency}
+touch "$STATE"
+lock() {{
+    while ! mkdir "$LOCK" 2>/dev/null; do sleep 0.01; done
+}}
+unlock() {{
+    rmdir "$LOCK"
+}}
+case "$1" in
+list)
+    echo "Total running VMs: $(wc -l < "$STATE" | tr -d ' ')"
+    cat "$STATE"
+    ;;
+start)
+    lock
+    grep -qxF "$2" "$STATE" || echo "$2" >> "$STATE"
+    unlock
+    mkdir -p "$2.lck"
+    rm -f "${{2%.vmx}}.vmss"
+    ;;
+stop|suspend)
+    lock
+    grep -vxF "$2" "$STATE" > "$STATE.$$"
+    mv "$STATE.$$" "$STATE"
+    unlock
+    rm -rf "$2.lck"
+    if [ "$1" = suspend ]; then touch "${{2%.vmx}}.vmss"; fi
+    ;;
+*)
+    echo "Unknown command: $1" >&2
+    exit 1
+    ;;
+esac
+'''
+
+# Fake arp printing table generated with the fleet, in arp -an format
+FAKE_ARP = '''#!/bin/sh
+sleep {latency}
+cat "{table}"
+'''
+
+GUEST_OS_TYPES = (
+    'ubuntu-64',
+    'debian10-64',
+    'centos8-64',
+    'windows9-64',
+    'darwin19-64',
+)
+
+VMX_HEADER = (
+    ('.encoding', 'UTF-8'),
+    ('config.version', '8'),
+    ('virtualHW.version', '16'),
+    ('pciBridge0.present', 'TRUE'),
+    ('tools.upgrade.policy', 'upgradeAtPowerCycle'),
+    ('mks.enable3d', 'TRUE'),
+    ('sound.present', 'TRUE'),
+    ('sound.virtualDev', 'hdaudio'),
+    ('sound.fileName', '-1'),
+    ('sound.autodetect', 'TRUE'),
+    ('vmci0.present', 'TRUE'),
+    ('hpet0.present', 'TRUE'),
+    ('nvram', 'vm.nvram'),
+    ('powerType.powerOff', 'soft'),
+    ('powerType.powerOn', 'soft'),
+    ('powerType.suspend', 'soft'),
+    ('powerType.reset', 'soft'),
+    ('floppy0.present', 'FALSE'),
+    ('cleanShutdown', 'TRUE'),
+    ('softPowerOff', 'FALSE'),
+    ('checkpoint.vmState', ''),
+    ('isolation.tools.hgfs.disable', 'FALSE'),
+    ('hgfs.mapRootShare', 'TRUE'),
+    ('hgfs.linkRootShare', 'TRUE'),
+)
+
+
+def format_uuid(value):
+    return ' '.join(value[index:index + 2] for index in range(0, 32, 2))
+
+
+class FleetGenerator(object):
+    """Generate synthetic fleet
+
+    Creates count VMs in root, which is used as HOME for stellator. VMs have
+    interfaces network interfaces, shares shared folders, usb_ports USB devices and
+    pci_bridges PCI bridges. All VMs are added to vmInventory, in folders virtual
+    folders. Generated content is same for same seed.
+    """
+    def __init__(self, root, count=500, seed=1, interfaces=4, shares=3, usb_ports=4, pci_bridges=8,
+                 folders=20, vmrun_latency=0.0, arp_latency=0.0):
+        self.root = os.path.abspath(root)
+        self.count = count
+        self.seed = seed
+        self.interfaces = interfaces
+        self.shares = shares
+        self.usb_ports = usb_ports
+        self.pci_bridges = pci_bridges
+        self.folders = folders
+        self.vmrun_latency = vmrun_latency
+        self.arp_latency = arp_latency
+
+        self.application_path = os.path.join(self.root, 'Applications', 'VMware Fusion.app')
+        self.vmrun_path = os.path.join(self.application_path, 'Contents', 'Library', 'vmrun')
+        self.arp_path = os.path.join(self.root, 'bin', 'arp')
+        self.arp_table_path = os.path.join(self.root, 'arp-table.txt')
+        self.running_path = os.path.join(self.root, 'running')
+        self.virtualmachines_path = os.path.join(self.root, 'Documents', 'Virtual Machines.localized')
+        self.inventory_path = os.path.join(
+            self.root, 'Library', 'Application Support', 'VMware Fusion', 'vmInventory'
+        )
+        self.config_directory = os.path.join(self.root, 'Library', 'Application Support', 'Stellator')
+        self.config_path = os.path.join(self.config_directory, 'stellator.conf')
+        self.vmx_paths = []
+
+    def __repr__(self):
+        return '{} VMs in {}'.format(self.count, self.root)
+
+    @property
+    def env(self):
+        """Environment for running stellator with the fleet
+
+        """
+        env = dict(os.environ)
+        env.pop('VMWARE_INVENTORY', None)
+        env.pop('VMWARE_DIRECTORY', None)
+        env['HOME'] = self.root
+        env['STELLATOR_SOCKET'] = os.path.join(self.root, 'stellator.sock')
+        return env
+
+    def name(self, index):
+        return 'vm{:04d}'.format(index)
+
+    def mac_address(self, index, interface):
+        return '00:0c:29:{:02x}:{:02x}:{:02x}'.format(index >> 8 & 0xff, index & 0xff, interface)
+
+    def ip_address(self, index, interface):
+        return '10.{}.{}.{}'.format(interface, index >> 8 & 0xff, (index & 0xff) + 1)
+
+    def __write_executable__(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fd:
+            fd.write(content)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def __vmx_lines__(self, rng, index, uuid):
+        lines = list(VMX_HEADER)
+        lines.extend((
+            ('displayName', self.name(index)),
+            ('guestOS', rng.choice(GUEST_OS_TYPES)),
+            ('numvcpus', '{}'.format(rng.choice((1, 2, 4, 8)))),
+            ('cpuid.coresPerSocket', '1'),
+            ('memsize', '{}'.format(rng.choice((1024, 2048, 4096, 8192, 16384)))),
+            ('annotation', 'Benchmark VM {}|0ACreated by stellator benchmarks'.format(index)),
+            ('uuid.bios', format_uuid(uuid)),
+            ('uuid.location', format_uuid(uuid)),
+            ('vc.uuid', ''),
+            ('extendedConfigFile', '{}.vmxf'.format(self.name(index))),
+        ))
+
+        for bridge in range(self.pci_bridges):
+            prefix = 'pciBridge{}'.format(bridge + 4)
+            lines.extend((
+                ('{}.present'.format(prefix), 'TRUE'),
+                ('{}.virtualDev'.format(prefix), 'pcieRootPort'),
+                ('{}.functions'.format(prefix), '8'),
+                ('{}.pciSlotNumber'.format(prefix), '{}'.format(21 + bridge)),
+            ))
+
+        for interface in range(self.interfaces):
+            prefix = 'ethernet{}'.format(interface)
+            lines.extend((
+                ('{}.present'.format(prefix), 'TRUE'),
+                ('{}.connectionType'.format(prefix), rng.choice(('nat', 'bridged', 'hostonly'))),
+                ('{}.virtualDev'.format(prefix), rng.choice(('e1000', 'e1000e', 'vmxnet3'))),
+                ('{}.wakeOnPcktRcv'.format(prefix), 'FALSE'),
+                ('{}.addressType'.format(prefix), 'generated'),
+                ('{}.generatedAddress'.format(prefix), self.mac_address(index, interface)),
+                ('{}.generatedAddressOffset'.format(prefix), '{}'.format(interface * 10)),
+                ('{}.pciSlotNumber'.format(prefix), '{}'.format(160 + interface * 32)),
+                ('{}.linkStatePropagation.enable'.format(prefix), 'TRUE'),
+            ))
+
+        lines.extend((
+            ('sharedFolder.maxNum', '{}'.format(self.shares)),
+            ('isolation.tools.hgfs.disable', 'FALSE'),
+        ))
+        for share in range(self.shares):
+            prefix = 'sharedFolder{}'.format(share)
+            lines.extend((
+                ('{}.present'.format(prefix), 'TRUE'),
+                ('{}.enabled'.format(prefix), 'TRUE'),
+                ('{}.readAccess'.format(prefix), 'TRUE'),
+                ('{}.writeAccess'.format(prefix), rng.choice(('TRUE', 'FALSE'))),
+                ('{}.hostPath'.format(prefix), '/Users/benchmark/share{}'.format(share)),
+                ('{}.guestName'.format(prefix), 'share{}'.format(share)),
+                ('{}.expiration'.format(prefix), 'never'),
+            ))
+
+        lines.extend((
+            ('usb.present', 'TRUE'),
+            ('ehci.present', 'TRUE'),
+            ('usb_xhci.present', 'TRUE'),
+            ('usb.pciSlotNumber', '32'),
+            ('usb.vbluetooth.startConnected', 'TRUE'),
+        ))
+        for port in range(self.usb_ports):
+            prefix = 'usb:{}'.format(port)
+            lines.extend((
+                ('{}.present'.format(prefix), 'TRUE'),
+                ('{}.deviceType'.format(prefix), 'hid' if port == 0 else 'hub'),
+                ('{}.port'.format(prefix), '{}'.format(port)),
+                ('{}.parent'.format(prefix), '-1'),
+            ))
+
+        lines.extend((
+            ('sata0.present', 'TRUE'),
+            ('sata0:1.present', 'TRUE'),
+            ('sata0:1.deviceType', 'cdrom-raw'),
+            ('sata0:1.fileName', 'auto detect'),
+            ('nvme0.present', 'TRUE'),
+            ('nvme0:0.present', 'TRUE'),
+            ('nvme0:0.fileName', 'Virtual Disk.vmdk'),
+            ('nvme0:0.redo', ''),
+            ('svga.graphicsMemoryKB', '786432'),
+            ('toolsInstallManager.updateCounter', '{}'.format(rng.randint(1, 10))),
+        ))
+        return lines
+
+    def __write_vmx__(self, rng, index, uuid):
+        directory = os.path.join(self.virtualmachines_path, '{}.vmwarevm'.format(self.name(index)))
+        os.makedirs(directory, exist_ok=True)
+        for filename in ('Virtual Disk.vmdk', 'vm.nvram', '{}.vmxf'.format(self.name(index)), 'vmware.log'):
+            with open(os.path.join(directory, filename), 'w') as fd:
+                fd.write('')
+
+        path = os.path.join(directory, '{}.vmx'.format(self.name(index)))
+        with open(path, 'w') as fd:
+            for key, value in self.__vmx_lines__(rng, index, uuid):
+                fd.write('{} = "{}"\n'.format(key, value))
+        return path
+
+    def __write_inventory__(self, uuids):
+        lines = ['.encoding = "UTF-8"']
+        item = 0
+        for folder in range(self.folders):
+            item += 1
+            prefix = 'vmlist{}'.format(item)
+            lines.extend((
+                '{}.Type = "2"'.format(prefix),
+                '{}.DisplayName = "Folder {}"'.format(prefix, folder),
+                '{}.ParentID = "0"'.format(prefix),
+                '{}.ItemID = "{}"'.format(prefix, item),
+                '{}.SeqID = "{}"'.format(prefix, item),
+                '{}.IsFavorite = "FALSE"'.format(prefix),
+                '{}.UUID = "folder{}"'.format(prefix, folder),
+                '{}.Expanded = "TRUE"'.format(prefix),
+            ))
+
+        for index, path in enumerate(self.vmx_paths):
+            item += 1
+            prefix = 'vmlist{}'.format(item)
+            lines.extend((
+                '{}.config = "{}"'.format(prefix, path),
+                '{}.DisplayName = "{}"'.format(prefix, self.name(index)),
+                '{}.ParentID = "{}"'.format(prefix, index % self.folders + 1 if self.folders else 0),
+                '{}.ItemID = "{}"'.format(prefix, item),
+                '{}.SeqID = "{}"'.format(prefix, item),
+                '{}.IsFavorite = "FALSE"'.format(prefix),
+                '{}.IsClone = "FALSE"'.format(prefix),
+                '{}.CfgVersion = "8"'.format(prefix),
+                '{}.State = "normal"'.format(prefix),
+                '{}.UUID = "{}"'.format(prefix, format_uuid(uuids[index])),
+                '{}.IsCfgPathNormalized = "TRUE"'.format(prefix),
+            ))
+
+        for index, path in enumerate(self.vmx_paths):
+            prefix = 'index{}'.format(index)
+            lines.extend((
+                '{}.field0.name = "guest"'.format(prefix),
+                '{}.field0.value = "{}"'.format(prefix, GUEST_OS_TYPES[index % len(GUEST_OS_TYPES)]),
+                '{}.field0.default = "TRUE"'.format(prefix),
+                '{}.hostID = "localhost"'.format(prefix),
+                '{}.id = "{}"'.format(prefix, path),
+                '{}.field.count = "1"'.format(prefix),
+            ))
+        lines.append('index.count = "{}"'.format(len(self.vmx_paths)))
+
+        os.makedirs(os.path.dirname(self.inventory_path), exist_ok=True)
+        with open(self.inventory_path, 'w') as fd:
+            fd.write('\n'.join(lines) + '\n')
+
+    def __write_arp_table__(self):
+        with open(self.arp_table_path, 'w') as fd:
+            for index in range(self.count):
+                for interface in range(self.interfaces):
+                    fd.write('? ({}) at {} on vmnet{} ifscope [ethernet]\n'.format(
+                        self.ip_address(index, interface),
+                        self.mac_address(index, interface),
+                        interface + 1,
+                    ))
+
+    def __write_config__(self):
+        config = (
+            ('inventory', self.inventory_path),
+            ('application_path', self.application_path),
+            ('virtualmachines_path', self.virtualmachines_path),
+            ('vmx_cache', os.path.join(self.config_directory, 'vmx-cache.json')),
+            ('suspend_history', os.path.join(self.config_directory, 'suspend-history.json')),
+            ('arp_command', self.arp_path),
+        )
+        os.makedirs(self.config_directory, exist_ok=True)
+        with open(self.config_path, 'w') as fd:
+            for key, value in config:
+                fd.write('{} = "{}"\n'.format(key, value))
+
+    def generate(self):
+        """Generate fleet
+
+        Removes existing fleet in root
+        """
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(self.virtualmachines_path)
+
+        rng = random.Random(self.seed)
+        uuids = ['{:032x}'.format(rng.getrandbits(128)) for _ in range(self.count)]
+        self.vmx_paths = [self.__write_vmx__(rng, index, uuids[index]) for index in range(self.count)]
+
+        self.__write_inventory__(uuids)
+        self.__write_arp_table__()
+        self.__write_config__()
+        self.__write_executable__(
+            self.vmrun_path,
+            FAKE_VMRUN.format(state=self.running_path, latency=self.vmrun_latency),
+        )
+        self.__write_executable__(
+            self.arp_path,
+            FAKE_ARP.format(table=self.arp_table_path, latency=self.arp_latency),
+        )
+        self.set_running(())
+        return self
+
+    def set_running(self, vmx_paths):
+        """Set running VMs
+
+        Updates fake vmrun state, .lck directories and removes .vmss files of running VMs
+        """
+        running = set(vmx_paths)
+        for path in self.vmx_paths:
+            lock = '{}.lck'.format(path)
+            if path in running:
+                os.makedirs(lock, exist_ok=True)
+                try:
+                    os.unlink('{}.vmss'.format(os.path.splitext(path)[0]))
+                except OSError:
+                    pass
+            elif os.path.isdir(lock):
+                os.rmdir(lock)
+
+        with open(self.running_path, 'w') as fd:
+            for path in self.vmx_paths:
+                if path in running:
+                    fd.write('{}\n'.format(path))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Check stellator import time budget
+
+Imports stellator modules with python -X importtime in a temporary home directory
+without vmware fusion and fails if a module imports something it should not load
+at startup, or if cumulative import time exceeds the budget.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported when stellator command starts, cumulative import time budgets in
+# milliseconds and modules they must not import
+IMPORT_BUDGETS = (
+    (
+        'stellator.bin.stellator',
+        40,
+        (
+            'asyncio',
+            'configobj',
+            'concurrent.futures',
+            'stellator.bin.commands',
+            'stellator.daemon',
+            'stellator.inventory',
+            'systematic',
+        ),
+    ),
+    (
+        'stellator.inventory',
+        100,
+        (
+            'asyncio',
+            'configobj',
+            'stellator.daemon',
+            'systematic',
+        ),
+    ),
+)
+
+
+def importtime(module, home):
+    """Import module with -X importtime
+
+    Returns dictionary of imported module names to cumulative import time in
+    microseconds
+    """
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    env.pop('VMWARE_INVENTORY', None)
+    env.pop('VMWARE_DIRECTORY', None)
+    p = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stderr = str(p.stderr, 'utf-8')
+    if p.returncode != 0:
+        raise RuntimeError('Error importing {}:\n{}'.format(module, stderr))
+
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def forbidden_imports(modules, forbidden):
+    """Find forbidden imports
+
+    Returns sorted names of imported modules matching forbidden module names or
+    their submodules
+    """
+    return sorted(
+        name for name in modules
+        if any(name == prefix or name.startswith(prefix + '.') for prefix in forbidden)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply time budgets for slow hosts')
+    parser.add_argument('--rounds', type=int, default=3, help='Import rounds, fastest is used')
+    args = parser.parse_args()
+
+    errors = 0
+    with tempfile.TemporaryDirectory() as home:
+        for module, budget, forbidden in IMPORT_BUDGETS:
+            budget = budget * args.scale
+            rounds = [importtime(module, home) for _ in range(max(1, args.rounds))]
+            duration = min(modules[module] for modules in rounds) / 1000.0
+
+            unexpected = forbidden_imports(rounds[0], forbidden)
+            status = 'ok'
+            if unexpected or duration > budget:
+                status = 'FAIL'
+                errors += 1
+            print('{:30} {:8.1f}ms / {:.0f}ms {}'.format(module, duration, budget, status))
+            for name in unexpected:
+                print('    imports {}'.format(name))
+
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Measure memory used by loaded virtual machines
+
+Generates a synthetic fleet and measures memory allocated by loading all VMs with
+full configuration, with tracemalloc. VMs are loaded both by parsing .vmx files and
+from the .vmx cache.
+
+    python -m benchmarks.memory
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from .fleet import FleetGenerator
+
+
+def measure(config, use_cache):
+    """Load fleet
+
+    Returns tuple of number of VMs and bytes allocated by the loaded VMs
+    """
+    from stellator.inventory import VirtualMachineFinder
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        finder = VirtualMachineFinder(config, use_cache=use_cache)
+        # Cache is not needed after loading
+        finder.inventory.cache = None
+        gc.collect()
+        allocated, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    count = len(finder)
+    del finder
+    return count, allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--count', type=int, default=500, help='Number of VMs')
+    parser.add_argument('--interfaces', type=int, default=4, help='Network interfaces per VM')
+    parser.add_argument('--shares', type=int, default=3, help='Shared folders per VM')
+    parser.add_argument('--usb-ports', type=int, default=4, help='USB devices per VM')
+    parser.add_argument('--pci-bridges', type=int, default=8, help='PCI bridges per VM')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fleet = FleetGenerator(
+            os.path.join(tmpdir, 'fleet'),
+            count=args.count,
+            interfaces=args.interfaces,
+            shares=args.shares,
+            usb_ports=args.usb_ports,
+            pci_bridges=args.pci_bridges,
+        ).generate()
+
+        # stellator reads paths from environment when imported
+        os.environ.update(fleet.env)
+        from stellator.config import StellatorConfig
+        config = StellatorConfig()
+
+        print('{:12} {:>8} {:>12} {:>10}'.format('Load', 'VMs', 'Total', 'Per VM'))
+        for name, use_cache in (('parse', False), ('cache', True)):
+            if use_cache:
+                # Write .vmx cache before measuring loading from it
+                measure(config, use_cache)
+            count, allocated = measure(config, use_cache)
+            print('{:12} {:8d} {:10.1f}kB {:8.1f}kB'.format(
+                name, count, allocated / 1024.0, allocated / 1024.0 / max(1, count),
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Run stellator benchmarks
+
+Generates a synthetic fleet and times stellator commands against it. Results are
+compared to stored baseline and the run fails if the median time of a scenario
+exceeds its baseline by more than the threshold.
+
+Baseline stores times relative to a fixed calibration workload timed on each run,
+so a baseline saved on one host is comparable on another.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --save
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .fleet import FleetGenerator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# Allowed slowdown compared to baseline, 0.25 is 25 percent
+DEFAULT_THRESHOLD = 0.25
+
+# Fixed Python workload timed with each run. Baseline stores scenario times divided
+# by the time of this workload.
+CALIBRATION_CODE = 'sum(index * index for index in range(2000000))'
+
+# Fleet settings stored with baseline. Baseline is only comparable with same settings.
+FLEET_SETTINGS = (
+    'count',
+    'interfaces',
+    'shares',
+    'usb_ports',
+    'pci_bridges',
+    'folders',
+    'vmrun_latency',
+    'arp_latency',
+)
+
+
+class Scenario(object):
+    """Benchmark scenario
+
+    Runs stellator with arguments. Running VMs are set before each round to all VMs if
+    running is True or no VMs if it's False, and are left as they are if None.
+    """
+    def __init__(self, name, args, running=None):
+        self.name = name
+        self.args = args
+        self.running = running
+
+    def __repr__(self):
+        return self.name
+
+    def setup(self, fleet):
+        """Prepare fleet for a round
+
+        Returns fleet to run stellator with
+        """
+        if self.running is True:
+            fleet.set_running(fleet.vmx_paths)
+        elif self.running is False:
+            fleet.set_running(())
+        return fleet
+
+    def run(self, fleet):
+        """Run scenario once
+
+        Returns duration in seconds
+        """
+        fleet = self.setup(fleet)
+        command = [sys.executable, '-c', 'from stellator.bin.stellator import main; main()', '--no-daemon']
+        started = time.monotonic()
+        p = subprocess.run(
+            command + list(self.args),
+            cwd=ROOT,
+            env=fleet.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        duration = time.monotonic() - started
+        if p.returncode != 0:
+            raise RuntimeError('Error running {}: {}{}'.format(
+                ' '.join(self.args),
+                str(p.stdout, 'utf-8')[-1000:],
+                str(p.stderr, 'utf-8')[-1000:],
+            ))
+        return duration
+
+
+class LargeVMXScenario(Scenario):
+    """Scenario with one large .vmx file
+
+    Runs stellator with a separate fleet of one VM, with devices of the benchmark
+    fleet multiplied by scale, so that parsing the .vmx file dominates the run time.
+    The fleet is generated in the benchmark fleet root on first run.
+    """
+    def __init__(self, name, args, scale):
+        super(LargeVMXScenario, self).__init__(name, args)
+        self.scale = scale
+        self.fleets = {}
+
+    def setup(self, fleet):
+        if fleet.root not in self.fleets:
+            self.fleets[fleet.root] = FleetGenerator(
+                os.path.join(fleet.root, self.name),
+                count=1,
+                interfaces=fleet.interfaces * self.scale,
+                shares=fleet.shares * self.scale,
+                usb_ports=fleet.usb_ports * self.scale,
+                pci_bridges=fleet.pci_bridges * self.scale,
+                folders=0,
+            ).generate()
+        return self.fleets[fleet.root]
+
+
+SCENARIOS = (
+    Scenario('list-cold', ('--no-cache', 'list')),
+    Scenario('list', ('list',)),
+    Scenario('status', ('status', '*'), running=True),
+    Scenario('details', ('details', '*'), running=True),
+    Scenario('details-ndjson', ('details', '--format', 'ndjson', '*'), running=True),
+    Scenario('details-one', ('details', 'vm0042'), running=True),
+    LargeVMXScenario('details-large', ('--no-cache', 'details', 'vm0000'), scale=500),
+    Scenario('start', ('start', '*'), running=False),
+    Scenario('start-one', ('start', 'vm0042'), running=False),
+    Scenario('suspend', ('suspend', '*'), running=True),
+    Scenario('stop', ('stop', '*'), running=True),
+)
+
+
+def calibrate(rounds):
+    """Time calibration workload
+
+    Returns median duration in seconds
+    """
+    durations = []
+    for _ in range(rounds):
+        started = time.monotonic()
+        subprocess.run([sys.executable, '-c', CALIBRATION_CODE], check=True)
+        durations.append(time.monotonic() - started)
+    return statistics.median(durations)
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r') as fd:
+            return json.load(fd)
+    except OSError:
+        return None
+
+
+def save_baseline(path, fleet, calibration, results):
+    baseline = {
+        'fleet': dict((key, getattr(fleet, key)) for key in FLEET_SETTINGS),
+        'calibration': round(calibration, 4),
+        'results': results,
+    }
+    with open(path, 'w') as fd:
+        json.dump(baseline, fd, indent=2, sort_keys=True)
+        fd.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--count', type=int, default=500, help='Number of VMs')
+    parser.add_argument('--interfaces', type=int, default=4, help='Network interfaces per VM')
+    parser.add_argument('--shares', type=int, default=3, help='Shared folders per VM')
+    parser.add_argument('--usb-ports', type=int, default=4, help='USB devices per VM')
+    parser.add_argument('--pci-bridges', type=int, default=8, help='PCI bridges per VM')
+    parser.add_argument('--folders', type=int, default=20, help='Virtual folders in inventory')
+    parser.add_argument('--vmrun-latency', type=float, default=0.0, help='Fake vmrun latency in seconds')
+    parser.add_argument('--arp-latency', type=float, default=0.0, help='Fake arp latency in seconds')
+    parser.add_argument('--rounds', type=int, default=3, help='Timed rounds for each scenario')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed slowdown')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='Baseline file')
+    parser.add_argument('--save', action='store_true', help='Save results as baseline')
+    parser.add_argument('--fleet', help='Fleet directory, default is temporary directory')
+    parser.add_argument('scenarios', nargs='*', help='Scenarios to run')
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenarios or scenario.name in args.scenarios]
+    if not scenarios:
+        parser.error('Unknown scenarios: {}'.format(' '.join(args.scenarios)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fleet = FleetGenerator(
+            args.fleet if args.fleet else os.path.join(tmpdir, 'fleet'),
+            count=args.count,
+            interfaces=args.interfaces,
+            shares=args.shares,
+            usb_ports=args.usb_ports,
+            pci_bridges=args.pci_bridges,
+            folders=args.folders,
+            vmrun_latency=args.vmrun_latency,
+            arp_latency=args.arp_latency,
+        ).generate()
+
+        baseline = load_baseline(args.baseline)
+        if baseline is not None and baseline.get('fleet', None) != dict(
+                (key, getattr(fleet, key)) for key in FLEET_SETTINGS):
+            print('Baseline {} uses different fleet settings, not comparing'.format(args.baseline))
+            baseline = None
+        elif baseline is not None and 'calibration' not in baseline:
+            print('Baseline {} has no calibration, not comparing'.format(args.baseline))
+            baseline = None
+
+        calibration = calibrate(max(1, args.rounds))
+        print('Calibration {:.3f}s'.format(calibration))
+
+        results = {}
+        regressions = []
+        print('{:14} {:>9} {:>9} {:>9} {:>8}'.format('Scenario', 'Median', 'Min', 'Baseline', 'Change'))
+        for scenario in scenarios:
+            # First round warms the cache and page cache
+            scenario.run(fleet)
+            durations = [scenario.run(fleet) for _ in range(max(1, args.rounds))]
+            median = statistics.median(durations)
+            results[scenario.name] = round(median / calibration, 4)
+
+            # Baseline time scaled to the speed of this host
+            expected = baseline['results'].get(scenario.name, None) if baseline is not None else None
+            if expected:
+                expected *= calibration
+                change = median / expected - 1
+                if change > args.threshold:
+                    regressions.append(scenario)
+                print('{:14} {:8.3f}s {:8.3f}s {:8.3f}s {:+7.1%}'.format(
+                    scenario.name, median, min(durations), expected, change
+                ))
+            else:
+                print('{:14} {:8.3f}s {:8.3f}s {:>9} {:>8}'.format(
+                    scenario.name, median, min(durations), '-', '-'
+                ))
+
+        if args.save:
+            if baseline is not None:
+                results = dict(baseline['results'], **results)
+            save_baseline(args.baseline, fleet, calibration, results)
+            print('Saved baseline to {}'.format(args.baseline))
+
+    if regressions:
+        print('Slower than baseline by more than {:.0%}: {}'.format(
+            args.threshold,
+            ' '.join(scenario.name for scenario in regressions),
+        ))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,7 +11,7 @@ setup(
     url='https://github.com/hile/stellator/',
     version=__version__,
     license='PSF',
-    packages=find_packages(),
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
     entry_points={
         'console_scripts': [
             'stellator=stellator.bin.stellator:main',
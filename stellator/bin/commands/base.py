@@ -1,20 +1,145 @@
 
+import sys
+
 from systematic.shell import ScriptCommand
-from stellator.config import StellatorConfig
+from stellator.config import StellatorConfig, StellatorConfigError
 from stellator.inventory import VirtualMachineFinder
+from stellator.power import PowerOperationEngine, PowerOperationError
+from stellator.records import RECORD_FORMATS, format_records
+from stellator.scheduler import StartScheduler
+from stellator.timing import TIMINGS
 
 
 class VMWareCommand(ScriptCommand):
+    # Load only VM summary details initially, see VirtualMachine
+    summary = False
+
+    def __register_format_argument__(self, parser):
+        parser.add_argument('--format', choices=RECORD_FORMATS, default='text', help='Output format')
+
+    def load_summary(self, args):
+        """Load VMs as summary
+
+        Details of summary VMs are loaded when they are used
+        """
+        return self.summary
+
+    def stream_virtualmachines(self, args):
+        """Run command while VMs are loaded
+
+        If True, args.virtualmachines is a generator yielding matched VMs in the order
+        the finder loads them, instead of the order of the patterns. With ndjson output
+        records are written as VMs are loaded.
+        """
+        return 'format' in args and args.format == 'ndjson'
+
+    def write_records(self, args, records):
+        """Write records in args.format
+
+        Records are written as they are generated. With ndjson output is flushed after
+        each record.
+        """
+        for line in format_records(records, args.format):
+            self.message(line)
+            if args.format == 'ndjson':
+                sys.stdout.flush()
+
     def parse_args(self, args):
-        self.config = StellatorConfig(args.config)
-        self.finder = VirtualMachineFinder(self.config)
+        # Script calls parse_args before run(), which calls it again
+        if getattr(self, 'finder', None) is not None:
+            return args
 
-        if 'patterns' in args:
-            if args.patterns:
-                args.virtualmachines = self.finder.match_vm_names(
-                    [pattern for arg in args.patterns for pattern in arg.split(',')]
+        patterns = None
+        if 'patterns' in args and args.patterns:
+            patterns = [pattern for arg in args.patterns for pattern in arg.split(',')]
+
+        # Commands run in daemon use the VMs loaded by daemon
+        finder = getattr(self.script, 'finder', None)
+        stream = False
+        if finder is not None:
+            self.config = finder.config
+            self.finder = finder
+        else:
+            if args.timings or args.trace:
+                TIMINGS.enable(summary=args.timings, trace_path=args.trace)
+            stream = self.stream_virtualmachines(args)
+            try:
+                self.config = StellatorConfig(args.config)
+                self.finder = VirtualMachineFinder(
+                    self.config,
+                    use_cache=not args.no_cache,
+                    summary=self.load_summary(args),
+                    patterns=patterns,
+                    lazy=stream,
                 )
+            except StellatorConfigError as e:
+                self.exit(1, e)
+
+        if stream:
+            args.virtualmachines = self.finder.iter_load()
+        elif 'patterns' in args:
+            if patterns:
+                args.virtualmachines = self.finder.match_vm_names(patterns)
             else:
                 args.virtualmachines = [vm for vm in self.finder]
 
         return args
+
+
+class PowerOperationCommand(VMWareCommand):
+    """Power operation command
+
+    Runs power operation for matched VMs with PowerOperationEngine
+    """
+    summary = True
+
+    def stream_virtualmachines(self, args):
+        # Operations are started as matching VMs are loaded
+        return True
+
+    def __register_jobs_argument__(self, parser):
+        parser.add_argument('-j', '--jobs', type=int, help='Number of parallel operations')
+
+    def __message_operation__(self, result):
+        self.message('{} {}'.format(self.name, result.virtualmachine))
+
+    def run_power_operation(self, args, operation, virtualmachines, **kwargs):
+        """Run power operation for VMs
+
+        Shows summary table and exits with error if any operation failed
+        """
+        try:
+            engine = PowerOperationEngine(args.jobs, callback=self.__message_operation__)
+            results = engine.run(operation, virtualmachines, **kwargs)
+        except PowerOperationError as e:
+            self.exit(1, e)
+
+        return self.report_results(results)
+
+    def run_start_scheduler(self, args, virtualmachines, **kwargs):
+        """Start VMs with StartScheduler
+
+        Shows summary table and exits with error if any VM failed to start
+        """
+        try:
+            scheduler = StartScheduler(self.config, jobs=args.jobs, callback=self.__message_operation__)
+        except PowerOperationError as e:
+            self.exit(1, e)
+
+        return self.report_results(scheduler.run(virtualmachines, **kwargs))
+
+    def report_results(self, results):
+        """Report power operation results
+
+        Shows summary table and exits with error if any operation failed
+        """
+        for line in results.format_summary():
+            self.message(line)
+
+        errors = results.errors
+        for result in errors:
+            self.error('{}'.format(result.error).rstrip())
+        if errors:
+            self.exit(1)
+
+        return results
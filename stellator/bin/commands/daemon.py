@@ -0,0 +1,198 @@
+
+import argparse
+import io
+import os
+import signal
+import sys
+import threading
+
+from systematic.log import Logger
+from systematic.shell import Script
+
+from stellator.client import get_daemon_socket_path
+from stellator.config import StellatorConfig, StellatorConfigError
+from stellator.daemon import DAEMON_WATCHERS, DaemonError, StellatorDaemon
+
+from .base import VMWareCommand
+
+# Output of command run in current request thread
+REQUEST_OUTPUT = threading.local()
+
+
+class DaemonCommandExit(Exception):
+    def __init__(self, status):
+        self.status = status
+
+
+class DaemonSignalExit(Exception):
+    def __init__(self, status):
+        self.status = status
+
+
+class DaemonArgumentParser(argparse.ArgumentParser):
+    """Argument parser for commands run in daemon
+
+    Usage and error messages are written to the request output, and exit does not
+    exit the daemon.
+    """
+    def _print_message(self, message, file=None):
+        if not message:
+            return
+        if file is sys.stderr:
+            REQUEST_OUTPUT.stderr.write(message)
+        else:
+            REQUEST_OUTPUT.stdout.write(message)
+
+    def exit(self, status=0, message=None):
+        if message:
+            self._print_message(message, sys.stderr)
+        raise DaemonCommandExit(status)
+
+
+class DaemonRequestScript(Script):
+    """Script running a command in daemon
+
+    Commands use the VirtualMachineFinder of the daemon. Output is collected to
+    stdout and stderr buffers.
+
+    If template is given, its argument parser is used and the subcommand is run with
+    a new instance of the template subcommand class, so requests do not share
+    command state.
+    """
+    def __init__(self, finder, template=None):
+        # Script.__init__ installs signal handler, which is only possible in main thread
+        self.name = 'stellator'
+        self.silent = False
+        self.logger = Logger(self.name)
+        self.log = self.logger.default_stream
+        self.template = template
+        if template is not None:
+            self.parser = template.parser
+            self.subcommand_parser = template.subcommand_parser
+        else:
+            self.parser = DaemonArgumentParser(
+                prog=self.name,
+                formatter_class=argparse.RawTextHelpFormatter,
+                add_help=True,
+                conflict_handler='resolve',
+            )
+            self.parser.add_argument('--debug', action='store_true', help='Show debug messages')
+            self.subcommand_parser = None
+
+        self.finder = finder
+        self.stdout = io.StringIO()
+        self.stderr = io.StringIO()
+
+    def message(self, message):
+        if self.silent:
+            return
+        self.stdout.write('{}\n'.format(message))
+
+    def error(self, message):
+        self.stderr.write('{}\n'.format(message))
+
+    def exit(self, value=0, message=None):
+        if message is not None:
+            self.message(message)
+        if isinstance(value, bool):
+            value = 0 if value else 1
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            value = 1
+        raise DaemonCommandExit(value)
+
+    def run(self, args):
+        """Run command
+
+        Returns tuple of exit status, stdout and stderr
+        """
+        REQUEST_OUTPUT.stdout = self.stdout
+        REQUEST_OUTPUT.stderr = self.stderr
+        try:
+            args = self.parser.parse_args(args)
+            if self.template is not None and args.command is not None:
+                command = self.template.subcommands[args.command].__class__()
+                command.script = self
+                self.subcommands = {args.command: command}
+            self.__process_args__(args)
+            status = 0
+        except DaemonCommandExit as e:
+            status = e.status
+        return status, self.stdout.getvalue(), self.stderr.getvalue()
+
+
+class DaemonCommandRunner(object):
+    """Run stellator commands in daemon
+
+    Argument parser with all subcommands is built once and shared by requests.
+    Returns tuple of exit status, stdout and stderr when called.
+    """
+    def __init__(self):
+        # Imported here because stellator script imports this command
+        from stellator.bin.stellator import configure_script
+        self.template = configure_script(DaemonRequestScript(None))
+
+    def __call__(self, args, finder):
+        return DaemonRequestScript(finder, self.template).run(args)
+
+
+def run_daemon_command(args, finder):
+    """Run stellator command in daemon
+
+    Only the subcommand in args is imported, daemon uses DaemonCommandRunner
+    """
+    from stellator.bin.stellator import configure_script
+    return configure_script(DaemonRequestScript(finder), args).run(args)
+
+
+class DaemonCommand(VMWareCommand):
+    name = 'daemon'
+    short_description = 'Run daemon serving other commands'
+
+    def __register_arguments__(self, parser):
+        parser.add_argument('--socket', help='Unix socket path')
+        parser.add_argument('--watcher', choices=DAEMON_WATCHERS, help='File change watcher')
+
+    def SIGINT(self, signum, frame):
+        """Stop daemon
+
+        Exits with status 1 like other commands
+        """
+        raise DaemonSignalExit(1)
+
+    def SIGTERM(self, signum, frame):
+        """Stop daemon
+
+        SIGTERM is a normal shutdown and exits with status 0. Raising DaemonSignalExit
+        stops serve(), which closes the server, stops the watcher and removes the
+        socket. Script.exit() is not used, it waits for request threads to finish.
+        """
+        raise DaemonSignalExit(0)
+
+    def run(self, args):
+        try:
+            self.config = StellatorConfig(args.config)
+            daemon = StellatorDaemon(
+                self.config,
+                args.socket if args.socket else get_daemon_socket_path(),
+                DaemonCommandRunner(),
+                use_cache=not args.no_cache,
+                watcher=args.watcher,
+            )
+        except (StellatorConfigError, DaemonError) as e:
+            self.exit(1, e)
+
+        signal.signal(signal.SIGINT, self.SIGINT)
+        signal.signal(signal.SIGTERM, self.SIGTERM)
+        self.message('stellator daemon listening on {}'.format(daemon.path))
+        try:
+            daemon.serve()
+        except DaemonSignalExit as e:
+            # Socket is removed and watcher stopped. Interpreter exit would wait for
+            # vmrun calls of requests in progress, their results are not needed.
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(e.status)
+        except DaemonError as e:
+            self.exit(1, e)
@@ -1,6 +1,7 @@
 
 from .base import VMWareCommand
 from ...constants import VMX_DETAILS_DESCRIPTIONS
+from ...records import virtualmachine_details_record
 
 
 class DetailsCommand(VMWareCommand):
@@ -8,11 +9,22 @@ class DetailsCommand(VMWareCommand):
     short_description = 'Show VM details'
 
     def __register_arguments__(self, parser):
+        self.__register_format_argument__(parser)
         parser.add_argument('patterns', nargs='*', help='VM name patterns to stop')
 
+    def load_summary(self, args):
+        # With ndjson details are loaded for each VM when its record is written
+        return args.format == 'ndjson'
+
     def run(self, args):
         args = self.parse_args(args)
 
+        if args.format != 'text':
+            self.write_records(args, (
+                virtualmachine_details_record(virtualmachine) for virtualmachine in args.virtualmachines
+            ))
+            return
+
         # Add empty before first VM
         self.message('')
 
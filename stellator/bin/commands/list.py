@@ -1,14 +1,28 @@
 
+from stellator.records import LIST_RECORD_FIELDS, virtualmachine_record
+
 from .base import VMWareCommand
 
 
 class ListCommand(VMWareCommand):
     name = 'list'
     short_description = 'List virtual machines'
+    summary = True
+
+    def __register_arguments__(self, parser):
+        self.__register_format_argument__(parser)
 
     def run(self, args):
         args = self.parse_args(args)
 
+        if args.format != 'text':
+            # VMs are loaded while records are written with ndjson, see stream_virtualmachines()
+            virtualmachines = args.virtualmachines if 'virtualmachines' in args else self.finder
+            self.write_records(args, (
+                virtualmachine_record(virtualmachine, LIST_RECORD_FIELDS) for virtualmachine in virtualmachines
+            ))
+            return
+
         for virtualmachine in self.finder:
             self.message('{:20} {:32} {}'.format(
                 virtualmachine.name,
@@ -1,21 +1,28 @@
 
-from .base import VMWareCommand
+from stellator.virtualmachine import AUTORESUME_MODE_STOP
 
+from .base import PowerOperationCommand
 
-class ResumeCommand(VMWareCommand):
+
+class ResumeCommand(PowerOperationCommand):
     name = 'resume'
     short_description = 'Resume virtual machines'
 
     def __register_arguments__(self, parser):
+        self.__register_jobs_argument__(parser)
         parser.add_argument('patterns', nargs='*', help='VM name patterns to resume')
 
+    def __message_operation__(self, result):
+        if result.virtualmachine.autoresume_mode == AUTORESUME_MODE_STOP:
+            self.message('{} {} (stopped)'.format(self.name, result.virtualmachine))
+        else:
+            self.message('{} {}'.format(self.name, result.virtualmachine))
+
     def run(self, args):
         args = self.parse_args(args)
 
-        for virtualmachine in args.virtualmachines:
-            if not virtualmachine.headless or not virtualmachine.autoresume:
-                continue
-
-            if not self.finder.is_running(virtualmachine):
-                self.message('resume {}'.format(virtualmachine))
-                virtualmachine.start()
+        virtualmachines = (
+            vm for vm in args.virtualmachines
+            if vm.headless and vm.autoresume and not self.finder.is_running(vm)
+        )
+        self.run_start_scheduler(args, virtualmachines)
@@ -0,0 +1,57 @@
+import time
+
+from .base import PowerOperationCommand
+
+
+class SetCommand(PowerOperationCommand):
+    name = 'set'
+    short_description = 'Set .vmx values of stopped VMs'
+
+    def __register_arguments__(self, parser):
+        self.__register_jobs_argument__(parser)
+        parser.add_argument('-s', '--set', dest='values', action='append', metavar='KEY=VALUE',
+                            help='.vmx value to set, may be given multiple times')
+        parser.add_argument('patterns', nargs='+', metavar='PATTERN|KEY=VALUE',
+                            help='VM name patterns and .vmx values to set, arguments with = are values')
+
+    def parse_args(self, args):
+        if not isinstance(args.values, dict):
+            assignments = list(args.values or [])
+            assignments.extend(arg for arg in args.patterns if '=' in arg)
+            args.patterns = [arg for arg in args.patterns if '=' not in arg]
+
+            values = {}
+            for value in assignments:
+                if '=' not in value:
+                    self.exit(1, 'Invalid value {}, expected KEY=VALUE'.format(value))
+                key, value = value.split('=', 1)
+                values[key] = value
+            args.values = values
+
+            if not args.patterns:
+                self.exit(1, 'No VM patterns given')
+        return super().parse_args(args)
+
+    def run(self, args):
+        args = self.parse_args(args)
+
+        if not args.values:
+            self.exit(1, 'No values to set, use --set KEY=VALUE')
+
+        if args.jobs is None:
+            # Files are rewritten in parallel like they are parsed
+            args.jobs = int(self.config['scan_workers'])
+
+        try:
+            self.run_power_operation(
+                args,
+                'set_values',
+                args.virtualmachines,
+                values=args.values,
+                since=time.monotonic(),
+            )
+        finally:
+            # Names and UUIDs may have changed
+            self.finder.invalidate_index()
+            if self.finder.inventory.cache is not None:
+                self.finder.inventory.cache.save()
@@ -1,19 +1,18 @@
 
-from .base import VMWareCommand
+from .base import PowerOperationCommand
 
 
-class StartCommand(VMWareCommand):
+class StartCommand(PowerOperationCommand):
     name = 'start'
     short_description = 'Stop virtualmachines'
 
     def __register_arguments__(self, parser):
         parser.add_argument('--headless', action='store_true', help='Start VMs in headless mode')
+        self.__register_jobs_argument__(parser)
         parser.add_argument('patterns', nargs='*', help='VM name patterns to start')
 
     def run(self, args):
         args = self.parse_args(args)
 
-        for virtualmachine in args.virtualmachines:
-            if not self.finder.is_running(virtualmachine):
-                self.message('start {}'.format(virtualmachine))
-                virtualmachine.start(headless=args.headless)
+        virtualmachines = (vm for vm in args.virtualmachines if not self.finder.is_running(vm))
+        self.run_start_scheduler(args, virtualmachines, headless=args.headless)
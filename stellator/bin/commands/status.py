@@ -1,17 +1,53 @@
 
+from stellator.records import virtualmachine_record
+from stellator.running import compare_running_detectors
+from stellator.util import normalize_path
+
 from .base import VMWareCommand
 
 
 class StatusCommand(VMWareCommand):
     name = 'status'
     short_description = 'Show VM status'
+    summary = True
 
     def __register_arguments__(self, parser):
+        parser.add_argument('--check-running', action='store_true',
+                            help='Compare running state detectors and show disagreements')
+        self.__register_format_argument__(parser)
         parser.add_argument('patterns', nargs='*', help='VM name patterns to show')
 
+    def check_running(self, args):
+        disagreements = compare_running_detectors(self.finder.inventory)
+        errors = False
+        for virtualmachine in args.virtualmachines:
+            states = disagreements.get(normalize_path(virtualmachine.path), None)
+            if states is None:
+                continue
+            errors = True
+            self.message('{:20} {}'.format(
+                virtualmachine.name,
+                ' '.join('{}={}'.format(
+                    name,
+                    'running' if running else 'stopped'
+                ) for name, running in sorted(states.items())),
+            ))
+        if errors:
+            self.exit(1)
+
     def run(self, args):
         args = self.parse_args(args)
 
+        if args.check_running:
+            self.check_running(args)
+            return
+
+        if args.format != 'text':
+            self.write_records(args, (
+                virtualmachine_record(virtualmachine) for virtualmachine in args.virtualmachines
+            ))
+            return
+
         for virtualmachine in args.virtualmachines:
             self.message('{:20} {:32} {:9} {:3} CPUs {:5} MB memory {}'.format(
                 virtualmachine.name,
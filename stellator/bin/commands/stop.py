@@ -1,18 +1,17 @@
 
-from .base import VMWareCommand
+from .base import PowerOperationCommand
 
 
-class StopCommand(VMWareCommand):
+class StopCommand(PowerOperationCommand):
     name = 'stop'
     short_description = 'Stop virtualmachines'
 
     def __register_arguments__(self, parser):
+        self.__register_jobs_argument__(parser)
         parser.add_argument('patterns', nargs='*', help='VM name patterns to stop')
 
     def run(self, args):
         args = self.parse_args(args)
 
-        for virtualmachine in args.virtualmachines:
-            if self.finder.is_running(virtualmachine):
-                self.message('stop {}'.format(virtualmachine))
-                virtualmachine.stop()
+        virtualmachines = (vm for vm in args.virtualmachines if self.finder.is_running(vm))
+        self.run_power_operation(args, 'stop', virtualmachines)
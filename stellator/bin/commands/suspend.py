@@ -1,22 +1,48 @@
 
-from .base import VMWareCommand
+from stellator.power import PowerOperationError
+from stellator.scheduler import DeadlineSuspendScheduler
 
+from .base import PowerOperationCommand
 
-class SuspendCommand(VMWareCommand):
+
+class SuspendCommand(PowerOperationCommand):
     name = 'suspend'
     short_description = 'Suspend VM'
 
     def __register_arguments__(self, parser):
         parser.add_argument('--autoresume', action='store_true', help='Set autoresume flag')
+        parser.add_argument('--deadline', type=float,
+                            help='Seconds to finish in, stop VMs that would not suspend in time')
+        self.__register_jobs_argument__(parser)
         parser.add_argument('patterns', nargs='*', help='VM name patterns to suspend')
 
+    def stream_virtualmachines(self, args):
+        # Deadline plan needs all VMs
+        return args.deadline is None
+
+    def __message_operation__(self, result):
+        self.message('{} {}'.format(result.operation, result.virtualmachine))
+
     def run(self, args):
         args = self.parse_args(args)
 
         if not args.patterns and args.autoresume:
-            args.virtualmachines = [vm for vm in args.virtualmachines if vm.headless]
+            args.virtualmachines = (vm for vm in args.virtualmachines if vm.headless)
+
+        virtualmachines = (vm for vm in args.virtualmachines if self.finder.is_running(vm))
+
+        if args.deadline is None:
+            self.run_power_operation(args, 'suspend', virtualmachines, autoresume=args.autoresume)
+            return
+
+        try:
+            scheduler = DeadlineSuspendScheduler(
+                self.config,
+                args.deadline,
+                jobs=args.jobs,
+                callback=self.__message_operation__
+            )
+        except (PowerOperationError, ValueError) as e:
+            self.exit(1, e)
 
-        for virtualmachine in args.virtualmachines:
-            if self.finder.is_running(virtualmachine):
-                self.message('suspend {}'.format(virtualmachine))
-                virtualmachine.suspend(autoresume=args.autoresume)
+        self.report_results(scheduler.run(virtualmachines, autoresume=args.autoresume))
@@ -1,30 +1,145 @@
 #!/usr/bin/env python
 
-from systematic.shell import Script
+import importlib
+import os
+import sys
 
+from ..client import DaemonClient, DaemonClientError, DaemonNotRunning, DaemonRequestRejected
 from ..config import DEFAULT_CONFIG_PATH
-from .commands.list import ListCommand
-from .commands.details import DetailsCommand
-from .commands.start import StartCommand
-from .commands.stop import StopCommand
-from .commands.resume import ResumeCommand
-from .commands.status import StatusCommand
-from .commands.suspend import SuspendCommand
+from ..timing import TIMINGS
 
+# Subcommand names and classes. Command class is in module with same name in commands
+SUBCOMMANDS = (
+    ('list', 'ListCommand'),
+    ('status', 'StatusCommand'),
+    ('start', 'StartCommand'),
+    ('stop', 'StopCommand'),
+    ('resume', 'ResumeCommand'),
+    ('suspend', 'SuspendCommand'),
+    ('details', 'DetailsCommand'),
+    ('set', 'SetCommand'),
+    ('daemon', 'DaemonCommand'),
+)
 
-def main():
-    script = Script()
+# Options with a value before the subcommand name
+SCRIPT_VALUE_ARGUMENTS = (
+    '--config',
+    '--trace',
+)
+
+# Subcommands never run in daemon
+DAEMON_BYPASS_COMMANDS = (
+    'daemon',
+)
+
+# Arguments that prevent running the command in daemon
+DAEMON_BYPASS_ARGUMENTS = (
+    '--no-daemon',
+    '--no-cache',
+    '--timings',
+    '--trace',
+)
+
+
+def get_subcommand_name(argv):
+    """Subcommand name from arguments
+
+    Returns first argument that is not an option or option value, or None
+    """
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in SCRIPT_VALUE_ARGUMENTS:
+            skip = True
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def load_subcommands(argv=None):
+    """Import subcommands
+
+    Only the subcommand named in argv is imported. All subcommands are imported if
+    argv does not name a known subcommand, for usage and error messages. Returns
+    list of command objects.
+    """
+    name = get_subcommand_name(argv) if argv is not None else None
+    subcommands = [item for item in SUBCOMMANDS if item[0] == name] or SUBCOMMANDS
+    return [
+        getattr(importlib.import_module('.commands.{}'.format(module), __package__), command)()
+        for module, command in subcommands
+    ]
+
+
+def configure_script(script, argv=None):
+    """Add arguments and subcommands to script
+
+    If argv is given, subcommands not used by the arguments are not imported
+    """
     script.add_argument('--config', default=DEFAULT_CONFIG_PATH, help='Virtual machine directory')
+    script.add_argument('--no-cache', action='store_true', help='Do not use cache of parsed .vmx files')
+    script.add_argument('--no-daemon', action='store_true', help='Do not run command in stellator daemon')
+    script.add_argument('--timings', action='store_true', help='Show timings of loading and running command')
+    script.add_argument('--trace', help='Write timings to file as Chrome trace JSON')
 
-    script.add_subcommand(ListCommand())
-    script.add_subcommand(StatusCommand())
-    script.add_subcommand(StartCommand())
-    script.add_subcommand(StopCommand())
-    script.add_subcommand(ResumeCommand())
-    script.add_subcommand(SuspendCommand())
-    script.add_subcommand(DetailsCommand())
+    for command in load_subcommands(argv):
+        script.add_subcommand(command)
+    return script
+
+
+def get_config_path(argv):
+    """Configuration file path from arguments
+
+    """
+    path = DEFAULT_CONFIG_PATH
+    for index, arg in enumerate(argv):
+        if arg == '--config' and index + 1 < len(argv):
+            path = argv[index + 1]
+        elif arg.startswith('--config='):
+            path = arg[len('--config='):]
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def run_in_daemon(argv):
+    """Run command in stellator daemon
+
+    Returns exit status, or None if daemon is not running or can't run the command
+    """
+    if get_subcommand_name(argv) in DAEMON_BYPASS_COMMANDS:
+        return None
+    if any(arg.split('=', 1)[0] in DAEMON_BYPASS_ARGUMENTS for arg in argv):
+        return None
+
+    client = DaemonClient()
+    if not os.path.exists(client.path):
+        return None
+
+    try:
+        status, stdout, stderr = client.run_command(argv, get_config_path(argv))
+    except (DaemonNotRunning, DaemonRequestRejected):
+        return None
+    except DaemonClientError as e:
+        sys.stderr.write('{}\n'.format(e))
+        return 1
+
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return status
+
+
+def main():
+    status = run_in_daemon(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
 
-    script.parse_args()
+    # systematic is not needed for commands run in daemon
+    from systematic.shell import Script
+    script = configure_script(Script(), sys.argv[1:])
+    try:
+        script.parse_args()
+    finally:
+        TIMINGS.report()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+"""
+Persistent cache for parsed .vmx files
+"""
+
+import json
+import os
+import threading
+
+from . import __version__
+
+# Increase when the parsed state stored for virtual machines changes
+CACHE_FORMAT = 3
+CACHE_VERSION = '{}-{}'.format(__version__, CACHE_FORMAT)
+
+
+def file_signature(path):
+    """Return file signature
+
+    Returns [mtime_ns, size, inode] for path or None if the file can't be accessed
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+class VirtualMachineCache(object):
+    """Parsed .vmx file cache
+
+    Stores parsed state of virtual machines keyed by .vmx path. Entries are valid
+    as long as the file signature (mtime, size and inode) is not changed. Whole
+    cache is discarded if it was written by different parser version.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.modified = False
+
+        self.__lock = threading.Lock()
+        self.__seen = set()
+
+        self.load()
+
+    def __repr__(self):
+        return self.path
+
+    def load(self):
+        """Load cache file
+
+        Missing, unreadable or outdated cache files are ignored.
+        """
+        try:
+            with open(self.path, 'r') as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return
+
+        if not isinstance(data, dict) or data.get('version', None) != CACHE_VERSION:
+            self.modified = True
+            return
+
+        self.entries = data.get('entries', {})
+
+    def save(self):
+        """Save cache file
+
+        Cache is written only if entries were modified. Entries for removed .vmx files are
+        dropped when saving. Errors writing the cache are ignored.
+        """
+        if not self.modified:
+            return
+
+        with self.__lock:
+            for path in list(self.entries.keys()):
+                if path not in self.__seen and not os.path.isfile(path):
+                    del self.entries[path]
+
+            data = {
+                'version': CACHE_VERSION,
+                'entries': self.entries,
+            }
+            tmpfile = '{}.{}.tmp'.format(self.path, os.getpid())
+            try:
+                with open(tmpfile, 'w') as fd:
+                    json.dump(data, fd)
+                os.replace(tmpfile, self.path)
+            except OSError:
+                try:
+                    os.unlink(tmpfile)
+                except OSError:
+                    pass
+                return
+
+            self.modified = False
+
+    def get(self, path, signature):
+        """Get cached state
+
+        Returns cached state for path if signature matches or None
+        """
+        self.__seen.add(path)
+        entry = self.entries.get(path, None)
+        if entry is None or entry['signature'] != signature:
+            return None
+        return entry['state']
+
+    def set(self, path, signature, state):
+        """Store parsed state
+
+        """
+        with self.__lock:
+            self.__seen.add(path)
+            self.entries[path] = {
+                'signature': signature,
+                'state': state,
+            }
+            self.modified = True
@@ -0,0 +1,102 @@
+"""
+Client for stellator daemon
+"""
+
+import json
+import os
+import socket
+
+from .config import DEFAULT_DAEMON_SOCKET
+from .records import VirtualMachineRecord
+
+# Seconds to wait for daemon to accept connection
+DAEMON_CONNECT_TIMEOUT = 1
+
+
+class DaemonClientError(Exception):
+    pass
+
+
+class DaemonNotRunning(DaemonClientError):
+    pass
+
+
+class DaemonRequestRejected(DaemonClientError):
+    pass
+
+
+def get_daemon_socket_path():
+    """Daemon socket path
+
+    Path from STELLATOR_SOCKET environment variable or DEFAULT_DAEMON_SOCKET
+    """
+    return os.environ.get('STELLATOR_SOCKET', None) or DEFAULT_DAEMON_SOCKET
+
+
+class DaemonClient(object):
+    """Stellator daemon client
+
+    Sends JSON requests to stellator daemon over unix socket, one request per
+    connection. Raises DaemonNotRunning if daemon can't be connected.
+    """
+    def __init__(self, path=None):
+        self.path = path if path is not None else get_daemon_socket_path()
+
+    def __repr__(self):
+        return self.path
+
+    def request(self, method, **kwargs):
+        """Send request
+
+        Returns response dictionary. Raises DaemonRequestRejected if daemon returned error.
+        """
+        kwargs['method'] = method
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        except (AttributeError, OSError) as e:
+            raise DaemonNotRunning(e)
+
+        try:
+            sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                raise DaemonNotRunning('Error connecting {}: {}'.format(self.path, e))
+
+            # Power operations may take a long time
+            sock.settimeout(None)
+            with sock.makefile('rwb') as fd:
+                fd.write(json.dumps(kwargs).encode('utf-8') + b'\n')
+                fd.flush()
+                line = fd.readline()
+        except OSError as e:
+            raise DaemonClientError('Error communicating with {}: {}'.format(self.path, e))
+        finally:
+            sock.close()
+
+        try:
+            response = json.loads(str(line, 'utf-8'))
+        except ValueError:
+            raise DaemonClientError('Invalid response from {}'.format(self.path))
+        if 'error' in response:
+            raise DaemonRequestRejected(response['error'])
+        return response
+
+    def ping(self):
+        return self.request('ping')
+
+    def run_command(self, args, config_path):
+        """Run stellator command in daemon
+
+        Returns tuple of exit status, stdout and stderr
+        """
+        response = self.request('command', args=list(args), config=config_path)
+        return response['status'], response['stdout'], response['stderr']
+
+    def virtualmachines(self, patterns=None):
+        """Virtual machine records
+
+        Returns VirtualMachineRecord objects for VMs matching patterns
+        """
+        response = self.request('records', patterns=patterns or [])
+        return [VirtualMachineRecord(record) for record in response['records']]
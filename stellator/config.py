@@ -2,11 +2,15 @@
 Stellator configuration file parsing
 """
 
-import configobj
 import os
 
+from .timing import span
+
 CONFIG_DIRECTORY = os.path.expanduser('~/Library/Application Support/Stellator')
 DEFAULT_CONFIG_PATH = os.path.join(CONFIG_DIRECTORY, 'stellator.conf')
+DEFAULT_CACHE_PATH = os.path.join(CONFIG_DIRECTORY, 'vmx-cache.json')
+DEFAULT_SUSPEND_HISTORY_PATH = os.path.join(CONFIG_DIRECTORY, 'suspend-history.json')
+DEFAULT_DAEMON_SOCKET = os.path.join(CONFIG_DIRECTORY, 'stellator.sock')
 
 
 # Paths to vmware fusion install locations
@@ -17,17 +21,50 @@ VMWARE_FUSION_PATHS = (
 
 
 def detect_vmware_fusion():
+    """Detect vmware fusion install location
+
+    Raises StellatorConfigError if vmware fusion is not installed
+    """
     for path in VMWARE_FUSION_PATHS:
         if os.path.isdir(path):
             return path
     raise StellatorConfigError('Could not detect installed vmware fusion')
 
 
+# Names of running state detectors in running.RUNNING_DETECTORS
+RUNNING_DETECTOR_NAMES = (
+    'vmrun',
+    'lockfile',
+    'process',
+)
+
+
 DEFAULT_CONFIG = {
     'inventory': os.path.expanduser('~/Library/Application Support/VMware Fusion/vmInventory'),
-    'application_path': detect_vmware_fusion(),
+    # Detected on first use, see StellatorConfig
+    'application_path': None,
     'autoresume_filename': 'autoresume.stellator',
     'virtualmachines_path': os.path.expanduser('~/Documents/Virtual Machines.localized'),
+    'vmx_cache': DEFAULT_CACHE_PATH,
+    'scan_max_depth': 4,
+    'scan_workers': 4,
+    'running_state_ttl': 5,
+    'running_detector': 'vmrun',
+    'arp_table_ttl': 30,
+    # arp command used instead of /proc/net/arp and /usr/sbin/arp, run with -an
+    'arp_command': None,
+    'suspend_history': DEFAULT_SUSPEND_HISTORY_PATH,
+    'suspend_jobs': 4,
+    'suspend_seconds_per_mb': 0.005,
+    'suspend_overhead': 2,
+    # Seconds planned for stopping a VM that does not fit the suspend deadline
+    'suspend_stop_estimate': 10,
+    'max_concurrent_starts': 2,
+    'start_memory_budget': 0,
+    'start_cores_budget': 0,
+    'start_priorities': {},
+    'daemon_watcher': 'auto',
+    'daemon_poll_interval': 2,
 }
 
 
@@ -47,6 +84,10 @@ class StellatorConfig(dict):
         VMWARE_INVENTORY: inventory
         VMWARE_DIRECTORY: virtualmachines_path
 
+    If application_path is not configured, vmware fusion install location is detected
+    when the setting is first used.
+
+    Raises StellatorConfigError if the configuration is invalid.
     """
     def __init__(self, path=DEFAULT_CONFIG_PATH):
         self.path = path
@@ -63,19 +104,42 @@ class StellatorConfig(dict):
         if vm_directory:
             self['virtualmachines_path'] = vm_directory
 
+        self.validate()
+
+    def __getitem__(self, key):
+        value = super(StellatorConfig, self).__getitem__(key)
+        if key == 'application_path' and value is None:
+            value = detect_vmware_fusion()
+            self[key] = value
+        return value
+
     def load(self):
         """Load user configuration
 
         """
-        if not os.path.isdir(CONFIG_DIRECTORY):
-            try:
-                os.makedirs(CONFIG_DIRECTORY)
-            except OSError as e:
-                raise StellatorConfigError('Error creating directory {}: {}'.format(CONFIG_DIRECTORY, e))
-            except IOError as e:
-                raise StellatorConfigError('Error creating directory {}: {}'.format(CONFIG_DIRECTORY, e))
-
-        config = configobj.ConfigObj(self.path)
-        for key in DEFAULT_CONFIG.keys():
-            if key in config:
-                self[key] = config[key]
+        with span('config.load'):
+            if not os.path.isdir(CONFIG_DIRECTORY):
+                try:
+                    os.makedirs(CONFIG_DIRECTORY)
+                except OSError as e:
+                    raise StellatorConfigError('Error creating directory {}: {}'.format(CONFIG_DIRECTORY, e))
+                except IOError as e:
+                    raise StellatorConfigError('Error creating directory {}: {}'.format(CONFIG_DIRECTORY, e))
+
+            # configobj is only needed when configuration is loaded
+            import configobj
+            config = configobj.ConfigObj(self.path)
+            for key in DEFAULT_CONFIG.keys():
+                if key in config:
+                    self[key] = config[key]
+
+    def validate(self):
+        """Validate configuration
+
+        Raises StellatorConfigError for invalid settings
+        """
+        if self['running_detector'] not in RUNNING_DETECTOR_NAMES:
+            raise StellatorConfigError('Unknown running_detector {}, expected one of {}'.format(
+                self['running_detector'],
+                ', '.join(RUNNING_DETECTOR_NAMES),
+            ))
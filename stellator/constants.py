@@ -140,6 +140,29 @@ VMX_KEY_MAP = {
     'vhv.enable': 'virtual_hypervisor_enable',
 }
 
+# Keys with enum-like string values, interned when parsed
+VMX_INTERNED_KEYS = (
+    'config.version',
+    'guestOS',
+    'guestos',
+    'gui.lastPoweredViewMode',
+    'gui.perVMWindowAutofitMode',
+    'gui.viewModeAtPowerOn',
+    'tools.upgrade.policy',
+    'virtualHW.productCompatibility',
+    'virtualHW.version',
+    'virtualhw.version',
+)
+
+# Attributes parsed for VM summary (list and status commands)
+VMX_SUMMARY_ATTRIBUTES = (
+    'name',
+    'uuid_bios',
+    'uuid_location',
+    'cores',
+    'memory',
+)
+
 # Labels for fields to show in 'details' command
 VMX_DETAILS_DESCRIPTIONS = (
     ('uuid',                       'UUID'),
@@ -161,6 +184,10 @@ VMX_DEVICE_BOOLEAN_KEYS = (
 VMX_DEVICE_INTEGER_KEYS = (
     'pciSlotNumber',
 )
+VMX_DEVICE_INTERNED_KEYS = (
+    'deviceType',
+    'virtualDev',
+)
 VMX_DEVICE_KEY_MAP = {
     'deviceType': 'device_type',
     'fileName': 'filename',
@@ -0,0 +1,419 @@
+"""
+Stellator daemon
+
+Keeps virtual machines in memory, refreshes them on file changes and serves
+requests over unix socket
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import socketserver
+import struct
+import sys
+import threading
+
+from . import __version__
+from .fileparser import FileParserError
+from .inventory import VirtualMachineFinder
+from .records import virtualmachine_record
+from .util import normalize_path
+
+# inotify event flags, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+INOTIFY_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# Seconds to wait for more file change events before handling them
+CHANGE_SETTLE_DELAY = 0.1
+
+# Seconds to wait for file watcher to stop when daemon exits
+WATCHER_STOP_TIMEOUT = 1
+
+DAEMON_WATCHERS = (
+    'auto',
+    'inotify',
+    'poll',
+)
+
+
+class DaemonError(Exception):
+    pass
+
+
+class FleetModel(object):
+    """In-memory virtual machines
+
+    VirtualMachineFinder loaded with VM summaries. Changes to .vmx files, the inventory
+    or VM directory tree reload the VMs. Only changed .vmx files are parsed again and
+    the inventory is reloaded incrementally. Other changes in VM directories refresh the
+    directory state of the VM. New or removed .lck locks invalidate running VMs
+    snapshot.
+    """
+    def __init__(self, config, use_cache=True):
+        self.config = config
+        self.use_cache = use_cache
+        self.finder = None
+        self.directories = {}
+        self.tree_directories = set()
+
+        self.__lock = threading.RLock()
+
+        self.refresh()
+
+    def refresh(self, vmx_paths=()):
+        """Reload virtual machines
+
+        VMs for vmx_paths are parsed again, other loaded VMs are reused. If the
+        inventory file can't be parsed, the error is logged and previously loaded VMs
+        are kept.
+        """
+        with self.__lock:
+            if self.finder is None:
+                finder = VirtualMachineFinder(self.config, use_cache=self.use_cache, summary=True)
+            else:
+                inventory = self.finder.inventory
+                try:
+                    inventory.reload()
+                except FileParserError as e:
+                    print('Error reloading {}: {}'.format(inventory.path, e), file=sys.stderr)
+                    return
+                for path in vmx_paths:
+                    inventory.registry.discard(path)
+                finder = VirtualMachineFinder(self.config, summary=True, inventory=inventory)
+            self.directories = dict((normalize_path(vm.directory), vm) for vm in finder)
+            self.tree_directories = set(
+                normalize_path(path) for path in finder.scanned_directories
+            ) - set(self.directories.keys())
+            self.finder = finder
+
+    def get_finder(self):
+        with self.__lock:
+            return self.finder
+
+    @property
+    def inventory_path(self):
+        return self.finder.inventory.path
+
+    def watch_paths(self):
+        """Paths to watch for changes
+
+        Returns tuple of sets of directories and files
+        """
+        with self.__lock:
+            directories = set(self.tree_directories)
+            directories.update(self.directories.keys())
+            files = set([self.inventory_path])
+            files.update(vm.path for vm in self.finder)
+        return directories, files
+
+    def handle_changes(self, paths):
+        """Handle changed paths
+
+        Paths are changed files, or directories if the changed file is not known
+        """
+        with self.__lock:
+            inventory_path = normalize_path(self.inventory_path)
+            reload = False
+            vmx_paths = []
+            for path in paths:
+                path = normalize_path(path)
+                if path.endswith('.vmx'):
+                    vmx_paths.append(path)
+                    reload = True
+                    continue
+                if path == inventory_path or path in self.tree_directories:
+                    reload = True
+                    continue
+
+                virtualmachine = self.directories.get(path, None)
+                if virtualmachine is None:
+                    virtualmachine = self.directories.get(os.path.dirname(path), None)
+                if virtualmachine is not None:
+                    virtualmachine.refresh_directory_state()
+                    if path.endswith('.lck') or path in self.directories:
+                        self.finder.inventory.running.invalidate()
+                elif os.path.dirname(path) in self.tree_directories:
+                    reload = True
+
+            if reload:
+                self.refresh(vmx_paths)
+            return reload
+
+
+class PollingWatcher(threading.Thread):
+    """Watch files by polling
+
+    Compares modification times of watched directories and files every interval
+    seconds.
+    """
+    def __init__(self, model, interval):
+        super(PollingWatcher, self).__init__(daemon=True)
+        self.model = model
+        self.interval = float(interval)
+        self.__stopped = threading.Event()
+        self.__signatures = {}
+
+    def __signature__(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def poll(self):
+        """Poll for changes
+
+        Returns list of changed paths. Paths not seen before are not changed.
+        """
+        directories, files = self.model.watch_paths()
+        signatures = dict((path, self.__signature__(path)) for path in directories | files)
+        changed = [
+            path for path, signature in signatures.items()
+            if path in self.__signatures and self.__signatures[path] != signature
+        ]
+        self.__signatures = signatures
+        return changed
+
+    def stop(self):
+        self.__stopped.set()
+
+    def run(self):
+        self.poll()
+        while not self.__stopped.wait(self.interval):
+            changed = self.poll()
+            if changed and self.model.handle_changes(changed):
+                self.poll()
+
+
+class InotifyWatcher(threading.Thread):
+    """Watch files with inotify
+
+    Linux only. Watches directories with VMs and the inventory file directory.
+    """
+    def __init__(self, model):
+        super(InotifyWatcher, self).__init__(daemon=True)
+        self.model = model
+        self.watches = {}
+        self.__stopped = threading.Event()
+
+        library = ctypes.util.find_library('c')
+        try:
+            self.libc = ctypes.CDLL(library, use_errno=True)
+            self.libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise DaemonError('inotify is not available: {}'.format(e))
+
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise DaemonError('Error initializing inotify: {}'.format(os.strerror(ctypes.get_errno())))
+
+        self.update_watches()
+
+    def update_watches(self):
+        """Update watched directories
+
+        """
+        directories, files = self.model.watch_paths()
+        directories.update(os.path.dirname(path) for path in files)
+
+        for wd, path in list(self.watches.items()):
+            if path not in directories:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+        watched = set(self.watches.values())
+        for path in directories:
+            if path in watched:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = path
+
+    def read_events(self):
+        """Read pending events
+
+        Returns list of changed paths
+        """
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                directory = self.watches.get(wd, None)
+                if mask & IN_Q_OVERFLOW:
+                    changed.append(self.model.inventory_path)
+                elif directory is None:
+                    continue
+                elif mask & IN_IGNORED:
+                    del self.watches[wd]
+                    changed.append(directory)
+                elif name:
+                    changed.append(os.path.join(directory, os.fsdecode(name)))
+                else:
+                    changed.append(directory)
+        return changed
+
+    def stop(self):
+        self.__stopped.set()
+
+    def run(self):
+        try:
+            while not self.__stopped.is_set():
+                readable, _, _ = select.select([self.fd], [], [], 0.5)
+                if not readable:
+                    continue
+                self.__stopped.wait(CHANGE_SETTLE_DELAY)
+                changed = self.read_events()
+                if changed and self.model.handle_changes(changed):
+                    self.update_watches()
+        finally:
+            os.close(self.fd)
+
+
+def get_watcher(model, name, interval):
+    """Get file watcher
+
+    With 'auto', inotify is used on linux if available and polling elsewhere
+    """
+    if name not in DAEMON_WATCHERS:
+        raise DaemonError('Unknown watcher: {}'.format(name))
+
+    if name == 'inotify' or (name == 'auto' and sys.platform.startswith('linux')):
+        try:
+            return InotifyWatcher(model)
+        except DaemonError:
+            if name == 'inotify':
+                raise
+    return PollingWatcher(model, interval)
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """Daemon request handler
+
+    Reads one JSON request line and writes one JSON response line
+    """
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(str(line, 'utf-8'))
+            method = request.pop('method')
+            response = self.server.daemon.handle_request(method, **request)
+        except (ValueError, KeyError, TypeError) as e:
+            response = {'error': 'Invalid request: {}'.format(e)}
+        except DaemonError as e:
+            response = {'error': '{}'.format(e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        socketserver.UnixStreamServer.__init__(self, path, DaemonRequestHandler)
+
+
+class StellatorDaemon(object):
+    """Stellator daemon
+
+    Serves requests for VMs in FleetModel. Commands are run with command_runner
+    callable, called with arguments and the VirtualMachineFinder and returning tuple
+    of exit status, stdout and stderr.
+    """
+    def __init__(self, config, path, command_runner, use_cache=True, watcher=None):
+        self.config = config
+        self.path = path
+        self.command_runner = command_runner
+        self.model = FleetModel(config, use_cache=use_cache)
+        self.watcher = get_watcher(
+            self.model,
+            watcher if watcher is not None else config['daemon_watcher'],
+            config['daemon_poll_interval'],
+        )
+        self.server = None
+
+    def __repr__(self):
+        return self.path
+
+    def handle_request(self, method, **kwargs):
+        """Handle request
+
+        Returns response dictionary
+        """
+        if method == 'ping':
+            return {'status': 0, 'version': __version__, 'pid': os.getpid()}
+
+        if method == 'command':
+            if kwargs.get('config', None) != os.path.abspath(os.path.expanduser(self.config.path)):
+                raise DaemonError('Daemon uses configuration {}'.format(self.config.path))
+            status, stdout, stderr = self.command_runner(kwargs['args'], self.model.get_finder())
+            return {'status': status, 'stdout': stdout, 'stderr': stderr}
+
+        if method == 'records':
+            finder = self.model.get_finder()
+            patterns = kwargs.get('patterns', None)
+            virtualmachines = finder.match_vm_names(patterns) if patterns else list(finder)
+            return {
+                'status': 0,
+                'records': [virtualmachine_record(vm) for vm in virtualmachines],
+            }
+
+        raise DaemonError('Unknown method: {}'.format(method))
+
+    def __remove_stale_socket__(self):
+        if not os.path.exists(self.path):
+            return
+        from .client import DaemonClient, DaemonNotRunning
+        try:
+            DaemonClient(self.path).ping()
+        except DaemonNotRunning:
+            os.unlink(self.path)
+            return
+        raise DaemonError('Daemon is already running: {}'.format(self.path))
+
+    def serve(self):
+        """Serve requests
+
+        Runs until interrupted
+        """
+        self.__remove_stale_socket__()
+        self.server = DaemonServer(self.path, self)
+        os.chmod(self.path, 0o600)
+        self.watcher.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.watcher.stop()
+            self.server.server_close()
+            self.watcher.join(WATCHER_STOP_TIMEOUT)
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
@@ -2,21 +2,98 @@
 Generic parsers for vmware configuration text files
 """
 
+import codecs
+import io
 import numbers
+import os
+import re
+import shutil
+import sys
 
 from .constants import CONFIG_META_KEYS
 
+# Encoding used until .encoding is seen in file
+DEFAULT_ENCODING = 'utf-8'
+
+# Valid configuration keys for updated values
+CONFIG_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.:-]*$')
+
+# Escapes for characters in quoted values, | must be escaped first
+CONFIG_VALUE_ESCAPES = (
+    ('|', '|7C'),
+    ('"', '|22'),
+    ('\n', '|0A'),
+)
+
+# Escaped characters in quoted values
+CONFIG_VALUE_ESCAPE_PATTERN = re.compile(r'\|([0-9A-Fa-f]{2})')
+
 
 class FileParserError(Exception):
     pass
 
 
+def parse_boolean(value):
+    """Parse boolean value
+
+    """
+    return value == 'TRUE'
+
+
+def compile_key_table(key_map, integer_keys=(), boolean_keys=(), converters=None, interned_keys=()):
+    """Compile key dispatch table
+
+    Returns dictionary mapping configuration keys to (attribute, converter) tuples.
+    Keys not in key_map are stored to attribute with the key name. Converter is None
+    for string values. Values of interned_keys are enum-like strings, interned so
+    that VMs share one copy of each value.
+    """
+    if converters is None:
+        converters = {}
+
+    table = {}
+    keys = set(key_map) | set(integer_keys) | set(boolean_keys) | set(converters) | set(interned_keys)
+    for key in keys:
+        if key in converters:
+            converter = converters[key]
+        elif key in boolean_keys:
+            converter = parse_boolean
+        elif key in integer_keys:
+            converter = int
+        elif key in interned_keys:
+            converter = sys.intern
+        else:
+            converter = None
+        table[key] = (key_map.get(key, key), converter)
+    return table
+
+
+def split_indexed_key(key):
+    """Split indexed key
+
+    Splits keys like ethernet0.present to prefix, index and rest of the key, i.e.
+    ('ethernet', 0, 'present'). Index is None if the first part of the key has no
+    index number.
+    """
+    head, _separator, rest = key.partition('.')
+    try:
+        prefix, index = INDEXED_KEY_PREFIXES[head]
+    except KeyError:
+        prefix = head.rstrip('0123456789')
+        index = int(head[len(prefix):]) if len(prefix) < len(head) else None
+        INDEXED_KEY_PREFIXES[head] = (prefix, index)
+    return prefix, index, rest
+
+
+# Cache of split key prefixes for split_indexed_key
+INDEXED_KEY_PREFIXES = {}
+
+
 class IndexedConfigEntry(object):
     """Indexed object
 
     Sortable parent class for indexed objects.
     """
-
     def __init__(self, index):
         self.index = int(index)
 
@@ -47,25 +124,228 @@ class IndexedConfigEntry(object):
         return self.index >= self.__get_index_value__(other)
 
 
+class IndexedConfigEntries(object):
+    """Indexed config entries
+
+    Container for IndexedConfigEntry objects keyed by index. Entries are created
+    on demand with get() and iterated in index order, like a sorted list.
+    """
+    def __init__(self, entry_class, parent):
+        self.entry_class = entry_class
+        self.parent = parent
+        self.__entries = {}
+        self.__sorted_entries = None
+
+    def __repr__(self):
+        return repr(self.__get_sorted_entries__())
+
+    def __get_sorted_entries__(self):
+        if self.__sorted_entries is None:
+            self.__sorted_entries = [self.__entries[index] for index in sorted(self.__entries.keys())]
+        return self.__sorted_entries
+
+    def __get_index_value__(self, item):
+        if isinstance(item, IndexedConfigEntry):
+            return item.index
+        return int(item)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __iter__(self):
+        return iter(self.__get_sorted_entries__())
+
+    def __getitem__(self, item):
+        return self.__get_sorted_entries__()[item]
+
+    def __contains__(self, item):
+        return self.__get_index_value__(item) in self.__entries
+
+    def get(self, index):
+        """Get entry by index
+
+        Returns existing entry with index or creates a new one
+        """
+        index = int(index)
+        try:
+            return self.__entries[index]
+        except KeyError:
+            entry = self.entry_class(self.parent, index)
+            self.append(entry)
+            return entry
+
+    def append(self, entry):
+        self.__entries[entry.index] = entry
+        self.__sorted_entries = None
+
+    def remove(self, entry):
+        del self.__entries[self.__get_index_value__(entry)]
+        self.__sorted_entries = None
+
+    def sort(self):
+        """Sort entries
+
+        Entries are always iterated in index order: this is for list compatibility.
+        """
+        pass
+
+
+def encode_value(value):
+    """Encode value
+
+    Returns value with characters not allowed in quoted values escaped
+    """
+    value = '{}'.format(value)
+    for character, escape in CONFIG_VALUE_ESCAPES:
+        value = value.replace(character, escape)
+    return value
+
+
+def decode_value(value):
+    """Decode value
+
+    Returns value with escaped characters decoded
+    """
+    return CONFIG_VALUE_ESCAPE_PATTERN.sub(lambda match: chr(int(match.group(1), 16)), value)
+
+
 class VMWareConfigFileParser(object):
     """Configuration parser
 
-    Parser for vmware text configuration files, like .vmx or library inventory
+    Parser for vmware text configuration files, like .vmx or library inventory.
+
+    Lines are parsed in a single pass as they are read from the file. VMware writes
+    the .encoding key on first line of the files: rest of the file is decoded with
+    that encoding, defaulting to UTF-8.
     """
     def __init__(self, path):
         self.path = path
         self.meta = {}
+        self.encoding = DEFAULT_ENCODING
+
+    def __iter_lines__(self, fd):
+        """Iterate lines in file
+
+        Yields stripped lines decoded with detected encoding
+        """
+        yield fd.readline().decode(self.encoding).strip()
+        for line in io.TextIOWrapper(fd, encoding=self.encoding):
+            yield line.strip()
 
     def load(self):
         try:
-            with open(self.path, 'r') as fd:
-                for line in sorted(line.strip() for line in fd.readlines()):
-                    self.parse_line(line)
+            with open(self.path, 'rb') as fd:
+                self.parse_lines(self.__iter_lines__(fd))
+        except UnicodeDecodeError as e:
+            raise FileParserError('Error decoding {}: {}'.format(self.path, e))
         except OSError as e:
             raise FileParserError('Error reading {}: {}'.format(self.path, e))
         except IOError as e:
             raise FileParserError('Error reading {}: {}'.format(self.path, e))
 
+    def update_values(self, values):
+        """Update values in file
+
+        Values of existing keys are replaced on their lines, keys are matched case
+        insensitively. New keys are appended to the end of the file. Other lines,
+        comments and order of the lines are not changed, and the file is written with
+        its original encoding and line endings. Updated file is written to temporary
+        file, which is renamed over the file.
+
+        Returns list of changed lines, file is not written if nothing changed.
+        """
+        pending = {}
+        for key, value in values.items():
+            if not CONFIG_KEY_PATTERN.match(key):
+                raise FileParserError('Invalid key: {}'.format(key))
+            pending[key.lower()] = (key, encode_value(value))
+
+        try:
+            with open(self.path, 'rb') as fd:
+                data = fd.read()
+        except OSError as e:
+            raise FileParserError('Error reading {}: {}'.format(self.path, e))
+
+        encoding = DEFAULT_ENCODING
+        key, _separator, value = data.split(b'\n', 1)[0].decode(DEFAULT_ENCODING, 'replace').partition('=')
+        if key.strip() in CONFIG_META_KEYS and CONFIG_META_KEYS[key.strip()] == 'encoding':
+            try:
+                encoding = codecs.lookup(value.strip().strip('"')).name
+            except LookupError:
+                pass
+        try:
+            lines = data.decode(encoding).split('\n')
+        except UnicodeDecodeError as e:
+            raise FileParserError('Error decoding {}: {}'.format(self.path, e))
+
+        changed = []
+        found = set()
+        for index, line in enumerate(lines):
+            body = line.rstrip('\r')
+            key, separator, value = body.partition('=')
+            name = key.strip().lower()
+            if not separator or name not in pending:
+                continue
+            found.add(name)
+            quoted = '"{}"'.format(pending[name][1])
+            if value.strip() == quoted:
+                continue
+            # Keep the key and spacing of the line as they were
+            updated = '{}={}{}'.format(key, value[:len(value) - len(value.lstrip())], quoted)
+            lines[index] = '{}{}'.format(updated, line[len(body):])
+            changed.append(updated)
+
+        line_ending = '\r' if lines[0].endswith('\r') else ''
+        added = [
+            '{} = "{}"'.format(key, value) for name, (key, value) in pending.items() if name not in found
+        ]
+        if added:
+            if lines[-1] == '':
+                lines.pop()
+            lines.extend('{}{}'.format(line, line_ending) for line in added)
+            lines.append('')
+            changed.extend(added)
+
+        if not changed:
+            return changed
+
+        tmpfile = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(tmpfile, 'wb') as fd:
+                fd.write('\n'.join(lines).encode(encoding))
+                fd.flush()
+                os.fsync(fd.fileno())
+            shutil.copymode(self.path, tmpfile)
+            os.replace(tmpfile, self.path)
+        except (OSError, UnicodeEncodeError) as e:
+            try:
+                os.unlink(tmpfile)
+            except OSError:
+                pass
+            raise FileParserError('Error writing {}: {}'.format(self.path, e))
+
+        return changed
+
+    def set_encoding(self, value):
+        """Set file encoding
+
+        Sets encoding used to decode the rest of the file when .encoding is on the first
+        line. The loader does not switch encoding later in the file. Unknown encodings
+        are ignored.
+        """
+        try:
+            self.encoding = codecs.lookup(value).name
+        except LookupError:
+            pass
+
+    def parse_lines(self, lines):
+        """Parse lines
+
+        Parses lines read from the file with self.parse_line
+        """
+        for line in lines:
+            self.parse_line(line)
+
     def parse_line(self, line):
         """Split key, value line
 
@@ -86,6 +366,8 @@ class VMWareConfigFileParser(object):
         """
         if key in CONFIG_META_KEYS:
             self.meta[CONFIG_META_KEYS[key]] = value
+            if CONFIG_META_KEYS[key] == 'encoding':
+                self.set_encoding(value)
             return True
 
         return False
@@ -2,18 +2,98 @@
 Parser for user's vmware fusion virtual machine inventory
 """
 
-import fnmatch
 import os
 
-from .config import StellatorConfig
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import VirtualMachineCache, file_signature
+from .config import StellatorConfig, StellatorConfigError
 from .constants import (
     INVENTORY_VM_BOOLEAN_FLAG_KEYS,
     INVENTORY_VM_INTEGER_KEYS,
     INVENTORY_VM_KEY_MAP,
 )
-from .fileparser import VMWareConfigFileParser, IndexedConfigEntry
-from .virtualmachine import VirtualMachine, VirtualMachineError
-from .vmrun import VMRunWrapper
+from .fileparser import (
+    VMWareConfigFileParser,
+    IndexedConfigEntry,
+    IndexedConfigEntries,
+    FileParserError,
+    compile_key_table,
+    split_indexed_key,
+)
+from .matcher import VirtualMachineIndex, VirtualMachinePatterns
+from .running import RunningStateDetectorError, RunningStateSnapshot, VMRunDetector, get_running_detector
+from .timing import span
+from .util import ARPTable, normalize_path
+from .virtualmachine import VirtualMachine, VirtualMachineError, VirtualMachineName
+from .vmrun import AsyncVMRunWrapper, VMRunWrapper
+
+# Extension of VMware Fusion VM bundle directories
+VMWARE_BUNDLE_EXTENSION = '.vmwarevm'
+
+# Dispatch table for inventory VM keys
+INVENTORY_VM_KEY_TABLE = compile_key_table(
+    INVENTORY_VM_KEY_MAP,
+    integer_keys=INVENTORY_VM_INTEGER_KEYS,
+    boolean_keys=INVENTORY_VM_BOOLEAN_FLAG_KEYS,
+    converters={
+        'UUID': lambda value: value.replace(' ', ''),
+    }
+)
+
+
+def get_bundle_name(path):
+    """Name of VM bundle
+
+    Returns name of the VMware Fusion bundle directory of .vmx file without the
+    extension, or None if the file is not in a bundle
+    """
+    directory = os.path.basename(os.path.dirname(path))
+    if not directory.endswith(VMWARE_BUNDLE_EXTENSION):
+        return None
+    return directory[:-len(VMWARE_BUNDLE_EXTENSION)]
+
+
+def find_vmx_files(path, max_depth, scanned=None):
+    """Find .vmx files
+
+    Returns sorted list of .vmx files in path, descending max_depth levels of
+    subdirectories. Subdirectories of VMware bundles are not scanned when the
+    bundle contains .vmx files.
+
+    If scanned is a list, scanned directories are appended to it.
+    """
+    vmx_files = []
+    directories = [(path, 0)]
+
+    while directories:
+        directory, depth = directories.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        if scanned is not None:
+            scanned.append(directory)
+
+        subdirectories = []
+        found = False
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif os.path.splitext(entry.name)[1] == '.vmx':
+                    vmx_files.append(entry.path)
+                    found = True
+            except OSError:
+                continue
+
+        if found and os.path.splitext(directory)[1] == VMWARE_BUNDLE_EXTENSION:
+            continue
+
+        if depth < max_depth:
+            directories.extend((subdirectory, depth + 1) for subdirectory in subdirectories)
+
+    return sorted(vmx_files)
 
 
 class InventoryIndexField(IndexedConfigEntry):
@@ -32,6 +112,14 @@ class InventoryIndexField(IndexedConfigEntry):
     def __repr__(self):
         return '{} {} {}'.format(self.inventory_index, self.name, self.value)
 
+    def serialize(self):
+        return {
+            'index': self.index,
+            'default': self.default,
+            'name': self.name,
+            'value': self.value,
+        }
+
     def set(self, key, value):
         if key == 'default':
             self.default = value == 'True'
@@ -52,19 +140,47 @@ class InventoryIndex(IndexedConfigEntry):
         self.vmx_path = None
 
         self.field_count = 0
-        self.fields = []
+        self.fields = IndexedConfigEntries(InventoryIndexField, self)
 
     def __repr__(self):
         return '{} {} {}'.format(self.index, self.host_id, self.vmx_path)
 
     def __get_field__(self, index):
-        for instance in self.fields:
-            if instance == index:
-                return instance
+        return self.fields.get(index)
+
+    @property
+    def entry_key(self):
+        """Key to match entries when inventory is reloaded
+
+        """
+        return normalize_path(self.vmx_path) if self.vmx_path is not None else None
+
+    def serialize(self):
+        """Serialize index
 
-        instance = InventoryIndexField(self, index)
-        self.fields.append(instance)
-        return instance
+        Returns values of the index, excluding the index number
+        """
+        return {
+            'host_id': self.host_id,
+            'vmx_path': self.vmx_path,
+            'field_count': self.field_count,
+            'fields': [field.serialize() for field in self.fields],
+        }
+
+    def restore(self, state):
+        """Restore index
+
+        Restores values from dictionary returned by serialize()
+        """
+        self.host_id = state['host_id']
+        self.vmx_path = state['vmx_path']
+        self.field_count = state['field_count']
+        self.fields = IndexedConfigEntries(InventoryIndexField, self)
+        for item in state['fields']:
+            field = self.__get_field__(item['index'])
+            field.default = item['default']
+            field.name = item['name']
+            field.value = item['value']
 
     @property
     def vmx_config(self):
@@ -73,24 +189,22 @@ class InventoryIndex(IndexedConfigEntry):
         """
         return self.inventory.find_vmx(self.vmx_path)
 
-    def set(self, parts, value):
-        if parts == ['id']:
+    def set(self, key, value):
+        if key == 'id':
             self.vmx_path = value
 
-        elif parts == ['hostID']:
+        elif key == 'hostID':
             self.host_id = value
 
-        elif parts == ['field', 'count']:
+        elif key == 'field.count':
             self.field_count = int(value)
 
-        elif parts[0][:5] == 'field':
-            field_index = int(parts[0][5:])
-            key = '.'.join(parts[1:])
-            field = self.__get_field__(field_index)
-            field.set(key, value)
-
         else:
-            print(self, parts, value)
+            prefix, index, field_key = split_indexed_key(key)
+            if prefix == 'field' and index is not None:
+                self.__get_field__(index).set(field_key, value)
+            else:
+                print(self, key, value)
 
 
 class InventoryVirtualMachine(IndexedConfigEntry):
@@ -115,27 +229,51 @@ class InventoryVirtualMachine(IndexedConfigEntry):
 
     @property
     def virtualmachine(self):
-        return VirtualMachine(self.inventory, self.vmx_path)
+        return self.get_virtualmachine()
+
+    @property
+    def entry_key(self):
+        """Key to match entries when inventory is reloaded
+
+        """
+        return normalize_path(self.vmx_path) if self.vmx_path is not None else None
 
-    def set(self, parts, value):
-        key = '.'.join(parts)
+    def serialize(self):
+        """Serialize VM config
 
-        if key in INVENTORY_VM_BOOLEAN_FLAG_KEYS:
-            value = value == 'TRUE'
+        Returns values of the config, excluding the index number
+        """
+        return {
+            'vmx_path': self.vmx_path,
+            'virtual_folder': self.virtual_folder,
+            'config': dict(self.config),
+        }
 
-        if key in INVENTORY_VM_INTEGER_KEYS:
-            value = int(value)
+    def restore(self, state):
+        """Restore VM config
 
-        if key == 'UUID':
-            value = value.replace(' ', '')
+        Restores values from dictionary returned by serialize()
+        """
+        self.vmx_path = state['vmx_path']
+        self.virtual_folder = state['virtual_folder']
+        self.config = dict(state['config'])
+
+    def get_virtualmachine(self, summary=False):
+        """Return virtualmachine
+
+        Returns VirtualMachine for the config. See VirtualMachine for summary flag.
+        """
+        return self.inventory.registry.get_virtualmachine(self.vmx_path, summary=summary)
 
-        if key == 'config':
+    def set(self, key, value):
+        if key in INVENTORY_VM_KEY_TABLE:
+            attribute, converter = INVENTORY_VM_KEY_TABLE[key]
+            self.config[attribute] = converter(value) if converter is not None else value
+
+        elif key == 'config':
             if value != '':
                 self.vmx_path = value
 
-        elif key in INVENTORY_VM_KEY_MAP:
-            self.config[INVENTORY_VM_KEY_MAP[key]] = value
-
         elif key == 'Type' and value == '2':
             self.virtual_folder = True
 
@@ -147,53 +285,120 @@ class InventoryVirtualMachine(IndexedConfigEntry):
             print('unknown key', self, key, value)
 
 
+class VirtualMachineRegistry(dict):
+    """Loaded virtual machines
+
+    Identity map of VirtualMachine objects keyed by normalized .vmx path, used to
+    parse each .vmx file only once.
+    """
+    def __init__(self, inventory):
+        self.inventory = inventory
+
+    def get_virtualmachine(self, path, summary=False):
+        """Get virtual machine
+
+        Returns existing VirtualMachine for path or loads it. See VirtualMachine for
+        summary flag.
+        """
+        key = normalize_path(path)
+        try:
+            virtualmachine = self[key]
+        except KeyError:
+            virtualmachine = VirtualMachine(self.inventory, path, summary=summary)
+            self[key] = virtualmachine
+            return virtualmachine
+
+        if not summary:
+            virtualmachine.load_details()
+        return virtualmachine
+
+    def discard(self, path):
+        """Remove virtual machine
+
+        VM is loaded again on next get_virtualmachine() call
+        """
+        self.pop(normalize_path(path), None)
+
+
+class InventoryDiff(object):
+    """Inventory changes
+
+    Entries added, removed and changed by Inventory.reload(). Entries are
+    InventoryVirtualMachine and InventoryIndex objects.
+    """
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.changed = []
+
+    def __repr__(self):
+        return 'added {} removed {} changed {}'.format(len(self.added), len(self.removed), len(self.changed))
+
+    def __bool__(self):
+        return len(self.added) > 0 or len(self.removed) > 0 or len(self.changed) > 0
+
+    @property
+    def vmx_paths(self):
+        """Paths of .vmx files with changed entries
+
+        """
+        return sorted(set(
+            entry.vmx_path for entry in self.added + self.removed + self.changed
+            if entry.vmx_path is not None
+        ))
+
+
 class Inventory(VMWareConfigFileParser):
     """VM inventory
 
-    Inventory used by the GUI
+    Inventory used by the GUI. Parsed .vmx files are cached in file configured
+    in vmx_cache setting unless use_cache is False.
     """
-    def __init__(self, config):
+    def __init__(self, config, use_cache=True):
         super(Inventory, self).__init__(config['inventory'])
         self.config = config
-        self.vmrun = VMRunWrapper(self.config)
+        self.__vmrun = None
+        self.cache = VirtualMachineCache(self.config['vmx_cache']) if use_cache else None
         self.index_count = 0
-
-        self.indexes = []
-        self.vmx_configs = []
-
-        self.running_vms = []
-        self.__running_vms_loaded = False
+        self.signature = None
+
+        self.indexes = IndexedConfigEntries(InventoryIndex, self)
+        self.vmx_configs = IndexedConfigEntries(InventoryVirtualMachine, self)
+        self.vmx_paths = {}
+        self.registry = VirtualMachineRegistry(self)
+
+        try:
+            detector = get_running_detector(self, self.config['running_detector'])
+        except RunningStateDetectorError as e:
+            raise StellatorConfigError(e)
+        self.running = RunningStateSnapshot(
+            detector,
+            ttl=float(self.config['running_state_ttl']),
+            fallback=VMRunDetector(self),
+        )
+        self.__async_vmrun = None
+        self.__arp_table = None
 
         self.load()
 
     def __get_index__(self, index):
-        for instance in self.indexes:
-            if instance == index:
-                return instance
-
-        instance = InventoryIndex(self, index)
-        self.indexes.append(instance)
-        return instance
+        return self.indexes.get(index)
 
     def __get_virtualmachine__(self, index):
-        for instance in self.vmx_configs:
-            if instance == index:
-                return instance
-
-        instance = InventoryVirtualMachine(self, index)
-        self.vmx_configs.append(instance)
-        return instance
+        return self.vmx_configs.get(index)
 
     def __cleanup__vms__(self):
         for vm in [vm for vm in self.vmx_configs]:
-            if vm.vmx_path is None:
+            if vm.vmx_path is None or vm.virtual_folder:
                 self.vmx_configs.remove(vm)
-            if vm.virtual_folder:
-                self.vmx_configs.remove(vm)
-        self.vmx_configs.sort()
+
+        self.vmx_paths = dict((normalize_path(vm.vmx_path), vm) for vm in self.vmx_configs)
 
     @property
     def virtualmachines(self):
+        return self.get_virtualmachines()
+
+    def get_virtualmachines(self, summary=False):
         """Return virtualmachines
 
         Return VMs matching the inventory config
@@ -201,39 +406,167 @@ class Inventory(VMWareConfigFileParser):
         virtualmachines = []
         for config in self.vmx_configs:
             try:
-                virtualmachines.append(config.virtualmachine)
+                virtualmachines.append(config.get_virtualmachine(summary=summary))
             except VirtualMachineError as e:
                 print('Error loading {}: {}'.format(config, e))
 
         return virtualmachines
 
+    @property
+    def known_vmx_paths(self):
+        """Known .vmx paths
+
+        Returns paths of loaded VMs and VMs in inventory file
+        """
+        paths = dict((key, vm.path) for key, vm in list(self.registry.items()))
+        for key, config in self.vmx_paths.items():
+            paths.setdefault(key, config.vmx_path)
+        return sorted(paths.values())
+
+    @property
+    def running_vms(self):
+        """Return running VM paths
+
+        """
+        return sorted(self.running.paths)
+
     def update_running_vmx(self):
         """Update list of running VMs
 
-        Update running VMs list
+        Refresh the running VMs snapshot
         """
-        self.running_vms = self.vmrun.running_vms()
-        self.__running_vms_loaded = True
+        self.running.refresh()
 
     def is_running(self, virtualmachine):
         """Check if VM is running
 
-        This uses cached .running_vms - to update, run update_running_vmx() first.
+        This uses running VMs snapshot, refreshed when older than running_state_ttl
+        seconds. To force update, run update_running_vmx() first.
         """
-        if not self.__running_vms_loaded:
-            self.update_running_vmx()
-        return virtualmachine.path in self.running_vms
+        return self.running.is_running(virtualmachine.path)
+
+    @property
+    def vmrun(self):
+        """VMRunWrapper for power operations
+
+        Created on first use, so vmrun is not required for commands that don't run it
+        """
+        if self.__vmrun is None:
+            self.__vmrun = VMRunWrapper(self.config)
+        return self.__vmrun
+
+    @property
+    def async_vmrun(self):
+        """AsyncVMRunWrapper for coroutine power operations
+
+        """
+        if self.__async_vmrun is None:
+            self.__async_vmrun = AsyncVMRunWrapper(self.config)
+        return self.__async_vmrun
+
+    @property
+    def arp_table(self):
+        """ARP table to resolve IP addresses of VMs
+
+        Created on first use. Table is loaded again when it's older than arp_table_ttl
+        seconds. If arp_command is configured, it's run with -an instead of reading
+        /proc/net/arp or running /usr/sbin/arp.
+        """
+        if self.__arp_table is None:
+            ttl = float(self.config['arp_table_ttl'])
+            command = self.config['arp_command']
+            if command:
+                self.__arp_table = ARPTable(ttl=ttl, path=None, command=(command, '-an'))
+            else:
+                self.__arp_table = ARPTable(ttl=ttl)
+        return self.__arp_table
+
+    async def async_is_running(self, virtualmachine, timeout=None):
+        """Check if VM is running
+
+        Like is_running, but expired snapshot is refreshed with async_vmrun
+        """
+        return await self.running.async_is_running(virtualmachine.path, self.async_vmrun, timeout=timeout)
 
     def load(self):
         """Load inventory
 
         """
-        rv = super(Inventory, self).load()
-        self.indexes.sort()
-        self.__cleanup__vms__()
+        with span('inventory.load', path=self.path):
+            signature = file_signature(self.path)
+            rv = super(Inventory, self).load()
+            self.__cleanup__vms__()
+            self.signature = signature
 
         return rv
 
+    def __merge_entries__(self, entries, loaded, diff):
+        """Merge reloaded entries
+
+        Returns entries from loaded, reusing matching entries from previous entries.
+        Entries are matched by entry_key and order of entries with same key.
+        """
+        def keyed(items):
+            counts = {}
+            for entry in items:
+                key = entry.entry_key
+                counts[key] = counts.get(key, 0) + 1
+                yield (key, counts[key]), entry
+
+        previous = dict((key, entry) for key, entry in keyed(entries) if key[0] is not None)
+        merged = IndexedConfigEntries(loaded.entry_class, self)
+        for key, entry in keyed(loaded):
+            existing = previous.pop(key, None)
+            if existing is None:
+                diff.added.append(entry)
+                merged.append(entry)
+                continue
+
+            state = entry.serialize()
+            if existing.serialize() != state:
+                existing.restore(state)
+                diff.changed.append(existing)
+            existing.index = entry.index
+            merged.append(existing)
+
+        diff.removed.extend(entry for entry in entries if entry.entry_key is None)
+        diff.removed.extend(previous.values())
+        return merged
+
+    def reload(self):
+        """Reload inventory
+
+        Inventory file is parsed again if its modification time, size or inode have
+        changed. Entries with unchanged values are kept and changed entries are updated
+        in place, so loaded VirtualMachine objects are kept. Returns InventoryDiff.
+        """
+        diff = InventoryDiff()
+        signature = file_signature(self.path)
+        if signature is not None and signature == self.signature:
+            return diff
+
+        indexes = self.indexes
+        vmx_configs = self.vmx_configs
+        index_count = self.index_count
+
+        self.indexes = IndexedConfigEntries(InventoryIndex, self)
+        self.vmx_configs = IndexedConfigEntries(InventoryVirtualMachine, self)
+        self.index_count = 0
+        try:
+            self.load()
+        except FileParserError:
+            self.indexes = indexes
+            self.vmx_configs = vmx_configs
+            self.index_count = index_count
+            self.__cleanup__vms__()
+            raise
+
+        self.indexes = self.__merge_entries__(indexes, self.indexes, diff)
+        self.vmx_configs = self.__merge_entries__(vmx_configs, self.vmx_configs, diff)
+        self.__cleanup__vms__()
+
+        return diff
+
     def parse_value(self, key, value):
         """Parse values
 
@@ -247,29 +580,22 @@ class Inventory(VMWareConfigFileParser):
             return
 
         # Parse key prefix and index
-        parts = key.split('.')
+        prefix, index, key = split_indexed_key(key)
+        if index is None:
+            return
 
-        if parts[0][:5] == 'index':
-            index = int(parts[0][5:])
-            parts = parts[1:]
-            index = self.__get_index__(index)
-            index.set(parts, value)
+        if prefix == 'index':
+            self.__get_index__(index).set(key, value)
 
-        if parts[0][:6] == 'vmlist':
-            index = int(parts[0][6:])
-            parts = parts[1:]
-            virtualmachine = self.__get_virtualmachine__(index)
-            virtualmachine.set(parts, value)
+        elif prefix == 'vmlist':
+            self.__get_virtualmachine__(index).set(key, value)
 
     def find_vmx(self, vmx_path):
         """Find vmx from inventory
 
         Returns vmx_config that matches path or None
         """
-        for config in self.vmx_configs:
-            if config.vmx_path == vmx_path:
-                return config
-        return None
+        return self.vmx_paths.get(normalize_path(vmx_path), None)
 
 
 class VirtualMachineFinder(list):
@@ -280,16 +606,37 @@ class VirtualMachineFinder(list):
     Path defaults to DEFAULT_VMWARE_DIRECTORY, which either is taken from
     VMWARE_DIRECTORY environment variable or defaults to user's default
     VM location ~/Documents/Virtual Machines.localized.
+
+    If summary is True, VMs are loaded as summary: see VirtualMachine.
+
+    If inventory is given, it's used instead of loading the inventory. Loaded VMs in
+    the inventory registry are reused.
+
+    If patterns are given, only VMs that may match the patterns are loaded. VMs are
+    matched by the name in inventory and the VM bundle directory name first, and then
+    by name and UUID read with VirtualMachineName. Use match_vm_names() to select the
+    matching VMs from loaded VMs.
+
+    Directory is scanned to depth configured in scan_max_depth and .vmx files are
+    parsed with scan_workers threads.
+
+    If lazy is True, VMs are not loaded when the finder is created. Use iter_load() to
+    load them and use each VM as soon as it's loaded.
     """
 
-    def __init__(self, config=None):
+    def __init__(self, config=None, use_cache=True, summary=False, inventory=None, patterns=None, lazy=False):
         if config is None:
             config = StellatorConfig()
         self.config = config
+        self.summary = summary
+        self.patterns = VirtualMachinePatterns(patterns) if patterns else None
 
-        self.inventory = Inventory(config)
+        self.inventory = inventory if inventory is not None else Inventory(config, use_cache=use_cache)
         self.path = config['virtualmachines_path']
-        self.load()
+        self.scanned_directories = []
+        self.__index = None
+        if not lazy:
+            self.load()
 
     def is_running(self, virtualmachine):
         """Check if VM is running
@@ -297,49 +644,122 @@ class VirtualMachineFinder(list):
         """
         return self.inventory.is_running(virtualmachine)
 
-    def match_vm_names(self, patterns, case_sensitive=False):
-        """Match VM names to patterns
+    @property
+    def index(self):
+        """Index of VM names and UUIDs
+
+        Built when first used, after loading the VMs
+        """
+        if self.__index is None:
+            self.__index = VirtualMachineIndex(self)
+        return self.__index
 
-        Return virtual machines that match the specified glob patterns.
+    def invalidate_index(self):
+        """Invalidate index
 
-        The match is case insensitive.
+        Index is built again on next use. Call this after changing names or UUIDs of
+        loaded VMs.
         """
+        self.__index = None
+
+    def match_vm_names(self, patterns, case_sensitive=False):
+        """Match VM names to patterns
 
-        matches = []
+        Return virtual machines that match the specified glob patterns by name or
+        UUID, in the order of the patterns. Patterns without glob characters are
+        exact names or UUID prefixes, see VirtualMachinePatterns.
 
-        for virtualmachine in self:
+        The match is case insensitive unless case_sensitive is True.
+        """
+        return VirtualMachinePatterns(patterns, case_sensitive=case_sensitive).match(self.index)
 
-            for pattern in patterns:
-                if case_sensitive:
-                    if fnmatch.fnmatch(virtualname.uuid, pattern):
-                        matches.append(virtualmachine)
-                        break
-                    if fnmatch.fnmatch(virtualmachine.name, pattern):
-                        matches.append(virtualmachine)
-                        break
-                else:
-                    if fnmatch.fnmatch(virtualmachine.uuid.lower(), pattern.lower()):
-                        matches.append(virtualmachine)
-                        break
-                    if fnmatch.fnmatch(virtualmachine.name.lower(), pattern.lower()):
-                        matches.append(virtualmachine)
-                        break
+    def __match_patterns__(self, path):
+        """Check if VM may match patterns
 
-        return matches
+        VMs that can't be read are matched, to report the error when loading
+        """
+        config = self.inventory.find_vmx(path)
+        if config is not None and self.patterns.match_values(
+                config.config.get('name', None), config.config.get('uuid', None)):
+            return True
+
+        if self.patterns.match_values(get_bundle_name(path)):
+            return True
+
+        try:
+            vmx_name = VirtualMachineName(self.inventory, path, uuid=self.patterns.matches_uuid)
+        except VirtualMachineError:
+            return True
+        return vmx_name.truncated or self.patterns.match_values(vmx_name.name, vmx_name.uuid)
+
+    def __load_virtualmachine__(self, path):
+        if self.patterns is not None and not self.__match_patterns__(path):
+            return None
+        try:
+            return self.inventory.registry.get_virtualmachine(path, summary=self.summary)
+        except VirtualMachineError as e:
+            print('Error loading {}: {}'.format(path, e))
+            return None
 
     def load(self):
         """Load virtual machines
 
-        Load virtual machines from directory and inventory
+        Load virtual machines from directory and inventory, see iter_load(). Returns
+        list of loaded VMs.
         """
+        for _virtualmachine in self.iter_load():
+            pass
+        return [vm for vm in self]
 
-        for root, _dirs, files in os.walk(self.path):
-            for filename in files:
-                if os.path.splitext(filename)[1] == '.vmx':
-                    self.append(VirtualMachine(self.inventory, os.path.join(root, filename)))
+    def iter_load(self):
+        """Load virtual machines
 
-        for vm in self.inventory.virtualmachines:
-            if vm not in self:
-                self.append(vm)
+        Load virtual machines from directory and inventory. Each .vmx file is loaded
+        only once, also when it's both in the directory and the inventory. VMs from
+        directory are sorted by path, followed by rest of the VMs in inventory.
 
-        return [vm for vm in self]
+        With patterns, the VMs are matched in the loading threads: matching VMs are
+        parsed while rest of the VMs are still matched.
+
+        Yields VMs in this order as the loading threads finish them, while later VMs
+        are still loaded. Loaded VMs are added to the finder. With patterns, only VMs
+        matching the patterns are yielded, in the order they are loaded instead of the
+        order of the patterns, see match_vm_names().
+        """
+        with span('finder.load', path=self.path):
+            paths = []
+            keys = set()
+
+            self.scanned_directories = []
+            with span('finder.scan', path=self.path):
+                vmx_files = find_vmx_files(self.path, int(self.config['scan_max_depth']), self.scanned_directories)
+            vmx_files.extend(config.vmx_path for config in self.inventory.vmx_configs)
+            for path in vmx_files:
+                key = normalize_path(path)
+                if key not in keys:
+                    keys.add(key)
+                    paths.append(path)
+
+            workers = int(self.config['scan_workers'])
+            executor = None
+            if workers > 1 and len(paths) > 1:
+                executor = ThreadPoolExecutor(max_workers=workers)
+                virtualmachines = executor.map(self.__load_virtualmachine__, paths)
+            else:
+                virtualmachines = map(self.__load_virtualmachine__, paths)
+
+            try:
+                for virtualmachine in virtualmachines:
+                    if virtualmachine is None:
+                        continue
+                    self.append(virtualmachine)
+                    self.__index = None
+                    if self.patterns is None or self.patterns.match_values(
+                            virtualmachine.name, virtualmachine.uuid):
+                        yield virtualmachine
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            if self.inventory.cache is not None:
+                self.inventory.cache.save()
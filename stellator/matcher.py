@@ -0,0 +1,194 @@
+"""
+Virtual machine selection
+
+Match virtual machines to name and UUID patterns given on command line
+"""
+
+import fnmatch
+import re
+import string
+
+# Characters making a pattern a glob pattern
+GLOB_CHARACTERS = frozenset('*?[')
+
+# Minimum length of UUID prefix matching VM UUID
+UUID_PREFIX_MIN_LENGTH = 8
+
+UUID_CHARACTERS = frozenset(string.hexdigits)
+
+# Bracket expressions in glob patterns
+GLOB_BRACKET_EXPRESSION = re.compile(r'\[[^\]]*\]?')
+
+
+def normalize_uuid_pattern(pattern):
+    """Normalize UUID pattern
+
+    Returns pattern without spaces and dashes in lower case, or None if pattern is
+    not a UUID or UUID prefix
+    """
+    value = ''.join(pattern.split()).replace('-', '').lower()
+    if len(value) < UUID_PREFIX_MIN_LENGTH or not UUID_CHARACTERS.issuperset(value):
+        return None
+    return value
+
+
+def glob_may_match_uuid(pattern):
+    """Check if glob pattern may match UUID
+
+    Returns False if the pattern contains characters not found in UUIDs
+    """
+    value = GLOB_BRACKET_EXPRESSION.sub('', pattern)
+    value = ''.join(value.split()).replace('-', '').replace('*', '').replace('?', '')
+    return UUID_CHARACTERS.issuperset(value)
+
+
+class VirtualMachineIndex(object):
+    """Index of virtual machine names and UUIDs
+
+    Index of VMs by name, lower case name and UUID prefix, with the position of the
+    VM in the indexed list
+    """
+    def __init__(self, virtualmachines):
+        self.virtualmachines = list(virtualmachines)
+        self.positions = {}
+        self.names = {}
+        self.folded_names = {}
+        self.uuid_prefixes = {}
+
+        for position, virtualmachine in enumerate(self.virtualmachines):
+            self.positions[id(virtualmachine)] = position
+            name = virtualmachine.name
+            if name is not None:
+                self.names.setdefault(name, []).append(virtualmachine)
+                self.folded_names.setdefault(name.lower(), []).append(virtualmachine)
+            uuid = virtualmachine.uuid
+            if uuid is not None and len(uuid) >= UUID_PREFIX_MIN_LENGTH:
+                self.uuid_prefixes.setdefault(uuid[:UUID_PREFIX_MIN_LENGTH].lower(), []).append(virtualmachine)
+
+    def __len__(self):
+        return len(self.virtualmachines)
+
+    def get_name(self, name, case_sensitive=False):
+        """Find VMs by name
+
+        Returns list of VMs with the name
+        """
+        if case_sensitive:
+            return self.names.get(name, [])
+        return self.folded_names.get(name.lower(), [])
+
+    def get_uuid(self, prefix):
+        """Find VMs by UUID prefix
+
+        Prefix must be normalized with normalize_uuid_pattern(). Returns list of VMs
+        with UUID starting with prefix.
+        """
+        return [
+            virtualmachine for virtualmachine in self.uuid_prefixes.get(prefix[:UUID_PREFIX_MIN_LENGTH], [])
+            if virtualmachine.uuid.lower().startswith(prefix)
+        ]
+
+    def position(self, virtualmachine):
+        return self.positions[id(virtualmachine)]
+
+
+class VirtualMachinePatterns(object):
+    """Compiled VM patterns
+
+    Patterns are glob patterns matched to VM names and UUIDs. Patterns without glob
+    characters are looked up from VirtualMachineIndex by name, and by UUID prefix if
+    the pattern is at least UUID_PREFIX_MIN_LENGTH hex digits. Glob patterns are
+    compiled to a single regular expression.
+
+    Matched VMs are returned in the order of the patterns, VMs matching the same
+    pattern in the order of the index. Each VM is returned only once.
+
+    match_values() matches single name and UUID, to select VMs before loading them.
+    matches_uuid is False if none of the patterns can match a UUID.
+    """
+    def __init__(self, patterns, case_sensitive=False):
+        self.patterns = list(patterns)
+        self.case_sensitive = case_sensitive
+        self.literals = []
+        self.names = set()
+        self.uuids = []
+        self.regexp = None
+        self.matches_uuid = False
+
+        globs = []
+        for order, pattern in enumerate(self.patterns):
+            if GLOB_CHARACTERS.intersection(pattern):
+                globs.append('(?P<p{}>{})'.format(order, fnmatch.translate(pattern)))
+                if glob_may_match_uuid(pattern):
+                    self.matches_uuid = True
+            else:
+                uuid = normalize_uuid_pattern(pattern)
+                self.literals.append((order, pattern, uuid))
+                self.names.add(pattern if case_sensitive else pattern.lower())
+                if uuid is not None:
+                    self.uuids.append(uuid)
+                    self.matches_uuid = True
+        if globs:
+            self.regexp = re.compile('|'.join(globs), 0 if case_sensitive else re.IGNORECASE)
+
+    def __repr__(self):
+        return ','.join(self.patterns)
+
+    def __match_order__(self, value):
+        if value is None:
+            return None
+        match = self.regexp.match(value)
+        if match is None:
+            return None
+        return int(match.lastgroup[1:])
+
+    def match_values(self, name=None, uuid=None):
+        """Match name and UUID
+
+        Returns True if name or UUID matches any pattern
+        """
+        if name is not None and (name if self.case_sensitive else name.lower()) in self.names:
+            return True
+
+        if uuid is not None:
+            uuid = uuid.replace('-', '').lower()
+            if any(uuid.startswith(prefix) for prefix in self.uuids):
+                return True
+
+        if self.regexp is not None:
+            return self.__match_order__(name) is not None or self.__match_order__(uuid) is not None
+
+        return False
+
+    def match(self, index):
+        """Match VMs in index
+
+        Returns list of matched VMs
+        """
+        orders = {}
+
+        def add(virtualmachine, order):
+            key = id(virtualmachine)
+            if key not in orders or order < orders[key][0]:
+                orders[key] = (order, index.position(virtualmachine), virtualmachine)
+
+        for order, pattern, uuid in self.literals:
+            for virtualmachine in index.get_name(pattern, self.case_sensitive):
+                add(virtualmachine, order)
+            if uuid is not None:
+                for virtualmachine in index.get_uuid(uuid):
+                    add(virtualmachine, order)
+
+        if self.regexp is not None:
+            for virtualmachine in index.virtualmachines:
+                matched = [
+                    order for order in (
+                        self.__match_order__(virtualmachine.name),
+                        self.__match_order__(virtualmachine.uuid),
+                    )
+                    if order is not None
+                ]
+                if matched:
+                    add(virtualmachine, min(matched))
+
+        return [item[2] for item in sorted(orders.values(), key=lambda item: item[:2])]
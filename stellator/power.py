@@ -0,0 +1,224 @@
+"""
+Run power operations for virtual machines in parallel
+"""
+
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .virtualmachine import VirtualMachineError
+from .vmrun import VMRunError
+
+# Default number of parallel power operations
+DEFAULT_JOBS = 1
+
+POWER_OPERATIONS = (
+    'start',
+    'stop',
+    'suspend',
+)
+
+# Operations changing VM configuration, run like power operations
+CONFIGURATION_OPERATIONS = (
+    'set_values',
+)
+
+
+class PowerOperationError(Exception):
+    pass
+
+
+class PowerOperationResult(object):
+    """Power operation result
+
+    Result and timing of a power operation for one virtual machine
+    """
+    def __init__(self, virtualmachine, operation, **kwargs):
+        self.virtualmachine = virtualmachine
+        self.operation = operation
+        self.kwargs = kwargs
+        self.submitted = None
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def __repr__(self):
+        return '{} {} {}'.format(self.operation, self.virtualmachine, self.status)
+
+    @property
+    def name(self):
+        return getattr(self.virtualmachine, 'name', None) or '{}'.format(self.virtualmachine)
+
+    @property
+    def duration(self):
+        """Duration in seconds
+
+        Returns None if operation has not finished
+        """
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    @property
+    def elapsed(self):
+        """Seconds from submitting to finishing the operation
+
+        This includes time waiting for other operations. For start it's the time
+        until the VM was running. Returns None if operation has not finished.
+        """
+        if self.submitted is None or self.finished is None:
+            return None
+        return self.finished - self.submitted
+
+    @property
+    def status(self):
+        if self.finished is None:
+            return 'pending'
+        if self.error is not None:
+            return 'error'
+        return 'ok'
+
+    def prepare(self):
+        """Prepare power operation
+
+        Called before the operation is reported to the callback and run. Subclasses
+        may change the operation here.
+        """
+        pass
+
+    def run(self):
+        """Run power operation
+
+        Errors from vmrun are stored in self.error
+        """
+        self.started = time.monotonic()
+        try:
+            getattr(self.virtualmachine, self.operation)(**self.kwargs)
+        except (VMRunError, VirtualMachineError) as e:
+            self.error = e
+        finally:
+            self.finished = time.monotonic()
+        return self
+
+
+class PowerOperationResults(list):
+    """Power operation results
+
+    Results in same order as the virtual machines given to PowerOperationEngine
+    """
+    @property
+    def errors(self):
+        return [result for result in self if result.error is not None]
+
+    @property
+    def duration(self):
+        """Wall clock time from first start to last finish
+
+        """
+        started = [result.started for result in self if result.started is not None]
+        finished = [result.finished for result in self if result.finished is not None]
+        if not started or not finished:
+            return 0.0
+        return max(finished) - min(started)
+
+    def format_summary(self):
+        """Format summary table
+
+        Returns list of lines
+        """
+        if not self:
+            return []
+
+        width = max([len('Name')] + [len(result.name) for result in self])
+        operation_width = max([len('Operation')] + [len(result.operation) for result in self])
+        lines = ['{:{width}} {:{operation_width}} {:7} {:>9} {:>9}'.format(
+            'Name', 'Operation', 'Status', 'Duration', 'Elapsed',
+            width=width,
+            operation_width=operation_width,
+        )]
+        for result in self:
+            lines.append('{:{width}} {:{operation_width}} {:7} {:8.2f}s {:8.2f}s'.format(
+                result.name,
+                result.operation,
+                result.status,
+                result.duration or 0.0,
+                result.elapsed or 0.0,
+                width=width,
+                operation_width=operation_width,
+            ))
+        lines.append('{} virtual machines, {} errors, {:.2f}s total'.format(
+            len(self),
+            len(self.errors),
+            self.duration,
+        ))
+        return lines
+
+
+class PowerOperationEngine(object):
+    """Parallel power operations
+
+    Runs a power operation for virtual machines with at most jobs operations running
+    at the same time. Errors are collected to results instead of aborting remaining
+    operations.
+    """
+    def __init__(self, jobs=DEFAULT_JOBS, callback=None):
+        if jobs is None:
+            jobs = DEFAULT_JOBS
+        try:
+            self.jobs = int(jobs)
+            if self.jobs < 1:
+                raise ValueError
+        except ValueError:
+            raise PowerOperationError('Invalid number of jobs: {}'.format(jobs))
+        self.callback = callback
+        self.__lock = threading.Lock()
+
+    def __run_operation__(self, result):
+        result.prepare()
+        if self.callback is not None:
+            with self.__lock:
+                self.callback(result)
+        return result.run()
+
+    def run(self, operation, virtualmachines, **kwargs):
+        """Run power operation
+
+        Callback is called with the PowerOperationResult before starting each operation,
+        after PowerOperationResult.prepare(). Returns PowerOperationResults.
+        """
+        return self.execute(
+            PowerOperationResult(virtualmachine, operation, **kwargs) for virtualmachine in virtualmachines
+        )
+
+    def execute(self, operations):
+        """Execute power operations
+
+        Operations are PowerOperationResult objects, started in given order. Each
+        operation is submitted when it's taken from operations, which may be a generator
+        yielding VMs as they are loaded. Returns PowerOperationResults.
+        """
+        results = PowerOperationResults()
+        executor = None
+        futures = []
+        try:
+            for result in operations:
+                if result.operation not in POWER_OPERATIONS + CONFIGURATION_OPERATIONS:
+                    raise PowerOperationError('Unknown power operation: {}'.format(result.operation))
+                result.submitted = time.monotonic()
+                results.append(result)
+
+                if self.jobs == 1:
+                    self.__run_operation__(result)
+                    continue
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=self.jobs)
+                futures.append(executor.submit(self.__run_operation__, result))
+
+            for future in futures:
+                future.result()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return results
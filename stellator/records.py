@@ -0,0 +1,138 @@
+"""
+Virtual machine records
+
+Plain data records of virtual machines, used by the daemon and its clients and for
+JSON output of commands
+"""
+
+import json
+
+# Output formats of list, status and details commands
+RECORD_FORMATS = (
+    'text',
+    'json',
+    'ndjson',
+)
+
+# Fields in list command records
+LIST_RECORD_FIELDS = (
+    'name',
+    'uuid',
+    'path',
+)
+
+# Fields in virtual machine summary records
+SUMMARY_RECORD_FIELDS = (
+    'name',
+    'path',
+    'uuid',
+    'status',
+    'cores',
+    'memory',
+    'headless',
+    'autoresume',
+)
+
+# Fields in details records, followed by interfaces, shares and description
+DETAILS_RECORD_FIELDS = SUMMARY_RECORD_FIELDS + (
+    'guest_os',
+    'enable_3d',
+    'sound_present',
+    'virtual_hypervisor_enable',
+    'compatibility_level',
+    'virtual_hw_version',
+)
+
+# Fields in network interface records and interface attributes for them
+INTERFACE_RECORD_FIELDS = (
+    ('index', 'index'),
+    ('autoconnect', 'autoconnect'),
+    ('connection_type', 'connection_type'),
+    ('driver', 'driver'),
+    ('address_type', 'address_type'),
+    ('mac_address', 'mac_address'),
+    ('ip_address', 'ip_address'),
+)
+
+# Fields in shared folder records and share attributes for them
+SHARE_RECORD_FIELDS = (
+    ('name', 'guest_folder_name'),
+    ('enabled', 'enabled'),
+    ('writable', 'guest_write_access'),
+    ('host_path', 'host_path'),
+)
+
+
+def virtualmachine_record(virtualmachine, fields=SUMMARY_RECORD_FIELDS):
+    """Virtual machine record
+
+    Returns dictionary of fields for VirtualMachine
+    """
+    return dict((field, getattr(virtualmachine, field)) for field in fields)
+
+
+def section_record(section, fields):
+    """Device section record
+
+    Returns dictionary of fields for section, fields is tuple of field and attribute
+    names. Unset attributes are None.
+    """
+    return dict((field, getattr(section, attribute, None)) for field, attribute in fields)
+
+
+def virtualmachine_details_record(virtualmachine):
+    """Virtual machine details record
+
+    Returns dictionary of DETAILS_RECORD_FIELDS with interfaces, shares and
+    description. IP addresses of interfaces are resolved from the ARP table.
+    """
+    record = virtualmachine_record(virtualmachine, DETAILS_RECORD_FIELDS)
+    record['interfaces'] = [
+        section_record(interface, INTERFACE_RECORD_FIELDS) for interface in virtualmachine.interfaces
+    ]
+    record['shares'] = [
+        section_record(share, SHARE_RECORD_FIELDS) for share in virtualmachine.shared_folders.shares
+    ]
+    record['description'] = virtualmachine.description
+    return record
+
+
+def format_records(records, output_format):
+    """Format records as JSON
+
+    Generator of output lines for records in json or ndjson format. Records are
+    formatted one by one as they are received: with ndjson each line is a record,
+    with json records are items of an array on their own lines.
+    """
+    if output_format == 'ndjson':
+        for record in records:
+            yield json.dumps(record)
+        return
+
+    if output_format != 'json':
+        raise ValueError('Unknown record format: {}'.format(output_format))
+
+    yield '['
+    previous = None
+    for record in records:
+        if previous is not None:
+            yield '  {},'.format(previous)
+        previous = json.dumps(record)
+    if previous is not None:
+        yield '  {}'.format(previous)
+    yield ']'
+
+
+class VirtualMachineRecord(dict):
+    """Virtual machine record
+
+    Record returned by daemon, with fields also available as attributes
+    """
+    def __repr__(self):
+        return self.get('path', '')
+
+    def __getattr__(self, attr):
+        try:
+            return self[attr]
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, attr))
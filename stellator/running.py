@@ -0,0 +1,320 @@
+"""
+Running virtual machine state
+"""
+
+import os
+import threading
+import time
+
+from subprocess import Popen, PIPE
+
+from .timing import span
+from .util import normalize_path
+from .vmrun import VMRunError
+
+# Default maximum age of running VMs snapshot in seconds
+DEFAULT_RUNNING_STATE_TTL = 5
+
+# Default running state detector
+DEFAULT_RUNNING_DETECTOR = 'vmrun'
+
+# Process running each VM
+VMWARE_VMX_PROCESS = 'vmware-vmx'
+
+# Command to list process command lines, used if /proc is not available
+PS_COMMAND = ('/bin/ps', '-axww', '-o', 'command=')
+
+# Linux proc filesystem
+PROC_DIRECTORY = '/proc'
+
+
+class RunningStateDetectorError(Exception):
+    pass
+
+
+class VMRunDetector(object):
+    """Running VMs from vmrun list
+
+    Authoritative, but runs the vmrun binary
+    """
+    name = 'vmrun'
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+
+    def running_vms(self):
+        return self.inventory.vmrun.running_vms()
+
+
+class LockFileDetector(object):
+    """Running VMs from lock directories
+
+    VMware creates .vmx.lck directory next to the .vmx file of a running VM. Only VMs
+    known to the inventory are checked.
+    """
+    name = 'lockfile'
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+
+    def running_vms(self):
+        return [path for path in self.inventory.known_vmx_paths if os.path.isdir('{}.lck'.format(path))]
+
+
+class ProcessDetector(object):
+    """Running VMs from process table
+
+    Each running VM has a vmware-vmx process with the .vmx path as last argument.
+    Process table is read from /proc if available, otherwise from ps output.
+    """
+    name = 'process'
+
+    def __init__(self, inventory, proc_directory=PROC_DIRECTORY, command=PS_COMMAND):
+        self.inventory = inventory
+        self.proc_directory = proc_directory
+        self.command = command
+
+    def __parse_proc_cmdline__(self, data):
+        args = data.rstrip(b'\0').split(b'\0')
+        if len(args) < 2 or os.path.basename(args[0]) != VMWARE_VMX_PROCESS.encode():
+            return None
+        path = str(args[-1], 'utf-8', 'replace')
+        return path if path.endswith('.vmx') else None
+
+    def __parse_ps_command__(self, line):
+        # Arguments are joined with spaces: path is the first argument starting with /
+        # after the executable, because .vmx paths may contain spaces
+        index = line.find(VMWARE_VMX_PROCESS)
+        if index < 0 or not line.endswith('.vmx'):
+            return None
+        path_index = line.find(' /', index)
+        if path_index < 0:
+            return None
+        return line[path_index + 1:]
+
+    def __read_proc__(self):
+        paths = []
+        for entry in os.scandir(self.proc_directory):
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(os.path.join(entry.path, 'cmdline'), 'rb') as fd:
+                    path = self.__parse_proc_cmdline__(fd.read())
+            except OSError:
+                continue
+            if path is not None:
+                paths.append(path)
+        return paths
+
+    def __read_ps__(self):
+        p = Popen(self.command, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        if p.returncode != 0:
+            raise RunningStateDetectorError('Error running {}: {}'.format(
+                ' '.join(self.command),
+                str(stderr, 'utf-8').rstrip()
+            ))
+        paths = []
+        for line in str(stdout, 'utf-8', 'replace').splitlines():
+            path = self.__parse_ps_command__(line.strip())
+            if path is not None:
+                paths.append(path)
+        return paths
+
+    def running_vms(self):
+        try:
+            if self.proc_directory is not None and os.path.isdir(self.proc_directory):
+                return self.__read_proc__()
+            return self.__read_ps__()
+        except OSError as e:
+            raise RunningStateDetectorError('Error reading process table: {}'.format(e))
+
+
+RUNNING_DETECTORS = {
+    VMRunDetector.name: VMRunDetector,
+    LockFileDetector.name: LockFileDetector,
+    ProcessDetector.name: ProcessDetector,
+}
+
+
+def get_running_detector(inventory, name):
+    """Get running state detector
+
+    Raises RunningStateDetectorError for unknown detector names
+    """
+    try:
+        return RUNNING_DETECTORS[name](inventory)
+    except KeyError:
+        raise RunningStateDetectorError('Unknown running state detector: {}'.format(name))
+
+
+def compare_running_detectors(inventory, names=None):
+    """Compare running state detectors
+
+    Returns dictionary of disagreements mapping .vmx paths to dictionary of detector
+    names and running states. Detectors failing with errors are not compared.
+    """
+    if names is None:
+        names = sorted(RUNNING_DETECTORS.keys())
+
+    states = {}
+    for name in names:
+        try:
+            paths = get_running_detector(inventory, name).running_vms()
+        except (RunningStateDetectorError, VMRunError):
+            continue
+        states[name] = set(normalize_path(path) for path in paths)
+
+    disagreements = {}
+    for path in set(path for paths in states.values() for path in paths):
+        running = dict((name, path in paths) for name, paths in states.items())
+        if len(set(running.values())) > 1:
+            disagreements[path] = running
+    return disagreements
+
+
+class RunningStateSnapshot(object):
+    """Running VMs snapshot
+
+    Set of normalized .vmx paths of running VMs reported by detector. The snapshot
+    is refreshed when it's older than ttl seconds or has been invalidated. If the
+    detector fails, fallback detector (vmrun list) is used.
+    """
+    def __init__(self, detector, ttl=DEFAULT_RUNNING_STATE_TTL, fallback=None):
+        self.detector = detector
+        self.fallback = fallback
+        self.ttl = ttl
+
+        self.__lock = threading.RLock()
+        self.__paths = None
+        self.__updated = None
+        self.__refresh_task = None
+
+    def __repr__(self):
+        return 'running VMs: {}'.format(' '.join(sorted(self.paths)))
+
+    def __contains__(self, path):
+        return self.is_running(path)
+
+    @property
+    def paths(self):
+        """Running VM paths
+
+        Returns set of normalized paths for running VMs, refreshing the snapshot if
+        it's expired
+        """
+        with self.__lock:
+            if self.expired:
+                self.refresh()
+            return self.__paths
+
+    @property
+    def expired(self):
+        """Is snapshot expired
+
+        True if snapshot was invalidated or is older than ttl seconds
+        """
+        with self.__lock:
+            return self.__paths is None or time.monotonic() - self.__updated > self.ttl
+
+    def update(self, paths):
+        """Update snapshot
+
+        Replace snapshot with running VM paths listed by vmrun. Returns the new set of
+        normalized paths.
+        """
+        with self.__lock:
+            self.__paths = set(normalize_path(path) for path in paths)
+            self.__updated = time.monotonic()
+            return self.__paths
+
+    def __running_vms__(self):
+        with span('running.refresh', detector=self.detector.name):
+            try:
+                return self.detector.running_vms()
+            except RunningStateDetectorError:
+                if self.fallback is None:
+                    raise
+                return self.fallback.running_vms()
+
+    def refresh(self):
+        """Refresh snapshot
+
+        Returns set of normalized paths for running VMs. Raises VMRunError if running
+        VMs can't be listed.
+        """
+        with self.__lock:
+            return self.update(self.__running_vms__())
+
+    async def __async_refresh__(self, vmrun, timeout):
+        if self.detector.name != VMRunDetector.name:
+            import asyncio
+            paths = await asyncio.get_running_loop().run_in_executor(None, self.__running_vms__)
+            return self.update(paths)
+        return self.update(await vmrun.running_vms(timeout=timeout))
+
+    async def async_refresh(self, vmrun, timeout=None):
+        """Refresh snapshot with AsyncVMRunWrapper
+
+        Concurrent calls share one refresh: only one vmrun list is run at a time.
+        Returns set of normalized paths for running VMs. Raises VMRunError if running
+        VMs can't be listed. Detectors other than vmrun are run in the default executor,
+        so they don't block the event loop.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        task = self.__refresh_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(self.__async_refresh__(vmrun, timeout))
+            self.__refresh_task = task
+        # Cancelling one caller must not cancel the refresh shared with others
+        return await asyncio.shield(task)
+
+    def refresh_if_older(self, timestamp):
+        """Refresh snapshot if it's older than timestamp
+
+        Timestamp is a time.monotonic() value. Returns set of normalized paths for
+        running VMs.
+        """
+        with self.__lock:
+            if self.__paths is None or self.__updated < timestamp:
+                return self.refresh()
+            return self.__paths
+
+    def invalidate(self):
+        """Invalidate snapshot
+
+        Snapshot is refreshed on next lookup
+        """
+        with self.__lock:
+            self.__paths = None
+
+    def set_running(self, path, running):
+        """Update state of a VM
+
+        Update state of a VM after power operation without refreshing the snapshot
+        """
+        with self.__lock:
+            if self.__paths is None:
+                return
+            if running:
+                self.__paths.add(normalize_path(path))
+            else:
+                self.__paths.discard(normalize_path(path))
+
+    def is_running(self, path):
+        """Check if VM is running
+
+        """
+        return normalize_path(path) in self.paths
+
+    async def async_is_running(self, path, vmrun, timeout=None):
+        """Check if VM is running with AsyncVMRunWrapper
+
+        Snapshot is refreshed with vmrun if it's expired
+        """
+        with self.__lock:
+            paths = None if self.expired else self.__paths
+        if paths is None:
+            paths = await self.async_refresh(vmrun, timeout=timeout)
+        return normalize_path(path) in paths
@@ -0,0 +1,332 @@
+"""
+Deadline aware suspend scheduling
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .power import PowerOperationEngine, PowerOperationError, PowerOperationResult, PowerOperationResults
+from .util import normalize_path
+
+# Number of suspend durations stored for each VM
+SUSPEND_HISTORY_SIZE = 5
+
+# Memory in MB assumed for VMs without memsize
+DEFAULT_MEMORY_MB = 1024
+
+# Cores assumed for VMs without numvcpus
+DEFAULT_CORES = 1
+
+
+class SuspendHistory(object):
+    """Observed suspend durations
+
+    Stores durations and memory sizes of recent suspends keyed by .vmx path. Used to
+    estimate how long suspending a VM takes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.modified = False
+
+        self.__lock = threading.Lock()
+
+        self.load()
+
+    def __repr__(self):
+        return self.path
+
+    def load(self):
+        """Load history file
+
+        Missing or unreadable history files are ignored.
+        """
+        try:
+            with open(self.path, 'r') as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict):
+            self.entries = data
+
+    def save(self):
+        """Save history file
+
+        Errors writing the file are ignored.
+        """
+        if not self.modified:
+            return
+
+        with self.__lock:
+            tmpfile = '{}.{}.tmp'.format(self.path, os.getpid())
+            try:
+                with open(tmpfile, 'w') as fd:
+                    json.dump(self.entries, fd)
+                os.replace(tmpfile, self.path)
+            except OSError:
+                try:
+                    os.unlink(tmpfile)
+                except OSError:
+                    pass
+                return
+
+            self.modified = False
+
+    def record(self, virtualmachine, memory, duration):
+        """Record suspend duration
+
+        """
+        with self.__lock:
+            samples = self.entries.setdefault(normalize_path(virtualmachine.path), [])
+            samples.append([memory, duration])
+            del samples[:-SUSPEND_HISTORY_SIZE]
+            self.modified = True
+
+    def seconds_per_mb(self, virtualmachine):
+        """Observed suspend rate
+
+        Returns average seconds per MB of memory from recorded suspends or None
+        """
+        samples = self.entries.get(normalize_path(virtualmachine.path), None)
+        if not samples:
+            return None
+        memory = sum(sample[0] for sample in samples)
+        if memory <= 0:
+            return None
+        return sum(sample[1] for sample in samples) / memory
+
+
+class ScheduledPowerOperation(PowerOperationResult):
+    """Scheduled suspend or stop
+
+    Suspend falls back to stop if the estimated suspend time does not fit before the
+    deadline when the operation is started. Fallback is decided in prepare(), so the
+    callback sees the operation that is run.
+
+    suspended is True after a suspend of a running VM, VMs that were not running are
+    not suspended.
+    """
+    def __init__(self, virtualmachine, operation, memory, estimate, deadline, **kwargs):
+        super(ScheduledPowerOperation, self).__init__(virtualmachine, operation, **kwargs)
+        self.memory = memory
+        self.estimate = estimate
+        self.deadline = deadline
+        self.suspended = False
+
+    def prepare(self):
+        if self.operation == 'suspend' and time.monotonic() + self.estimate > self.deadline:
+            self.operation = 'stop'
+
+    def run(self):
+        running = self.operation == 'suspend' and self.virtualmachine.is_running
+        super(ScheduledPowerOperation, self).run()
+        self.suspended = running and self.error is None
+        return self
+
+
+class DeadlineSuspendScheduler(object):
+    """Suspend VMs before a deadline
+
+    Suspend cost of each VM is estimated from memsize and observed suspend history.
+    Suspends are run in parallel, largest first, and VMs that are not expected to be
+    suspended before the deadline are stopped instead. A planned stop takes
+    suspend_stop_estimate seconds of its slot.
+    """
+    def __init__(self, config, deadline, jobs=None, callback=None):
+        self.deadline = float(deadline)
+        self.jobs = int(jobs if jobs is not None else config['suspend_jobs'])
+        self.seconds_per_mb = float(config['suspend_seconds_per_mb'])
+        self.overhead = float(config['suspend_overhead'])
+        self.stop_estimate = float(config['suspend_stop_estimate'])
+        self.history = SuspendHistory(config['suspend_history'])
+        self.engine = PowerOperationEngine(self.jobs, callback=callback)
+
+    def memory(self, virtualmachine):
+        """VM memory in MB
+
+        """
+        return getattr(virtualmachine, 'memory', None) or DEFAULT_MEMORY_MB
+
+    def estimate(self, virtualmachine):
+        """Estimate suspend time in seconds
+
+        Observed durations include the fixed overhead, the configured rate does not.
+        """
+        seconds_per_mb = self.history.seconds_per_mb(virtualmachine)
+        if seconds_per_mb is not None:
+            return seconds_per_mb * self.memory(virtualmachine)
+        return self.overhead + self.seconds_per_mb * self.memory(virtualmachine)
+
+    def plan(self, virtualmachines, autoresume=False):
+        """Plan operations
+
+        Returns ScheduledPowerOperation objects in the order they are started. VMs are
+        assigned to the least loaded of jobs parallel slots, largest first.
+        """
+        started = time.monotonic()
+        deadline = started + self.deadline
+
+        estimates = sorted(
+            ((self.estimate(vm), index, vm) for index, vm in enumerate(virtualmachines)),
+            key=lambda item: (-item[0], item[1]),
+        )
+
+        slots = [0.0] * max(1, self.jobs)
+        operations = []
+        for estimate, index, virtualmachine in estimates:
+            slot = heapq.heappop(slots)
+            if slot + estimate <= self.deadline:
+                operation = 'suspend'
+                slot += estimate
+            else:
+                operation = 'stop'
+                slot += self.stop_estimate
+            heapq.heappush(slots, slot)
+
+            operations.append(ScheduledPowerOperation(
+                virtualmachine,
+                operation,
+                memory=self.memory(virtualmachine),
+                estimate=estimate,
+                deadline=deadline,
+                autoresume=autoresume,
+            ))
+        return operations
+
+    def run(self, virtualmachines, autoresume=False):
+        """Suspend or stop VMs
+
+        Returns PowerOperationResults. Durations of successful suspends of running VMs
+        are saved to suspend history.
+        """
+        results = self.engine.execute(self.plan(virtualmachines, autoresume=autoresume))
+
+        for result in results:
+            if result.suspended and result.memory > 0:
+                self.history.record(result.virtualmachine, result.memory, result.duration)
+        self.history.save()
+
+        return results
+
+
+class StartScheduler(object):
+    """Admission controlled start
+
+    Starts VMs in priority order as host budgets allow. Budgets limit number of
+    concurrent starts, total memory and total cores of VMs being started at the same
+    time. Memory and cores budgets of 0 are unlimited. A VM larger than a budget is
+    started alone.
+
+    Priorities are read from start_priorities configuration section, mapping VM names
+    to integers. VMs with higher priority are started first, VMs with same priority in
+    given order.
+    """
+    def __init__(self, config, jobs=None, callback=None):
+        try:
+            self.max_starts = int(jobs if jobs is not None else config['max_concurrent_starts'])
+            self.memory_budget = int(config['start_memory_budget'])
+            self.cores_budget = int(config['start_cores_budget'])
+            self.priorities = dict(
+                (name.lower(), int(priority)) for name, priority in config['start_priorities'].items()
+            )
+        except (AttributeError, ValueError) as e:
+            raise PowerOperationError('Invalid start scheduler configuration: {}'.format(e))
+        if self.max_starts < 1:
+            raise PowerOperationError('Invalid number of jobs: {}'.format(self.max_starts))
+
+        self.callback = callback
+
+        self.__condition = threading.Condition()
+        self.__starting = 0
+        self.__memory = 0
+        self.__cores = 0
+
+    def priority(self, virtualmachine):
+        """VM start priority
+
+        """
+        return self.priorities.get('{}'.format(virtualmachine.name).lower(), 0)
+
+    def memory(self, virtualmachine):
+        return getattr(virtualmachine, 'memory', None) or DEFAULT_MEMORY_MB
+
+    def cores(self, virtualmachine):
+        return getattr(virtualmachine, 'cores', None) or DEFAULT_CORES
+
+    def order(self, virtualmachines):
+        """Order VMs by priority
+
+        Without configured priorities VMs are returned as given, so a generator of VMs
+        is not consumed before starting the first VM
+        """
+        if not self.priorities:
+            return virtualmachines
+        return [
+            vm for index, vm in sorted(
+                enumerate(virtualmachines),
+                key=lambda item: (-self.priority(item[1]), item[0]),
+            )
+        ]
+
+    def __fits__(self, memory, cores):
+        if self.__starting == 0:
+            return True
+        if self.__starting >= self.max_starts:
+            return False
+        if self.memory_budget and self.__memory + memory > self.memory_budget:
+            return False
+        if self.cores_budget and self.__cores + cores > self.cores_budget:
+            return False
+        return True
+
+    def __admit__(self, memory, cores):
+        with self.__condition:
+            while not self.__fits__(memory, cores):
+                self.__condition.wait()
+            self.__starting += 1
+            self.__memory += memory
+            self.__cores += cores
+
+    def __release__(self, memory, cores):
+        with self.__condition:
+            self.__starting -= 1
+            self.__memory -= memory
+            self.__cores -= cores
+            self.__condition.notify_all()
+
+    def __start__(self, result, memory, cores):
+        try:
+            return result.run()
+        finally:
+            self.__release__(memory, cores)
+
+    def run(self, virtualmachines, **kwargs):
+        """Start VMs
+
+        VMs are started in priority order when they fit in the budgets. Returns
+        PowerOperationResults, where elapsed is the time until each VM was running.
+        """
+        results = PowerOperationResults()
+        with ThreadPoolExecutor(max_workers=self.max_starts) as executor:
+            futures = []
+            for virtualmachine in self.order(virtualmachines):
+                result = PowerOperationResult(virtualmachine, 'start', **kwargs)
+                result.submitted = time.monotonic()
+                results.append(result)
+
+                memory = self.memory(virtualmachine)
+                cores = self.cores(virtualmachine)
+                self.__admit__(memory, cores)
+                if self.callback is not None:
+                    self.callback(result)
+                futures.append(executor.submit(self.__start__, result, memory, cores))
+            for future in futures:
+                future.result()
+
+        return results
@@ -0,0 +1,179 @@
+"""
+Timing instrumentation
+
+Spans measure phases like parsing the inventory, loading .vmx files and running
+vmrun. Spans are only recorded when timings are enabled, disabled spans do nothing.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Span(object):
+    """Recorded span
+
+    Context manager recording its duration to Timings
+    """
+    __slots__ = ('timings', 'name', 'args', 'thread', 'started', 'duration')
+
+    def __init__(self, timings, name, args):
+        self.timings = timings
+        self.name = name
+        self.args = args
+        self.thread = None
+        self.started = None
+        self.duration = None
+
+    def __enter__(self):
+        self.thread = threading.get_ident()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.started
+        self.timings.spans.append(self)
+        return False
+
+
+class DisabledSpan(object):
+    """Span when timings are disabled
+
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+DISABLED_SPAN = DisabledSpan()
+
+
+class Timings(object):
+    """Timing spans
+
+    Collects spans when enabled. Summary table aggregates spans by name, trace is
+    written in Chrome trace event format, viewable in chrome://tracing or Perfetto.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.summary = False
+        self.trace_path = None
+        self.started = None
+        self.spans = []
+
+    def enable(self, summary=True, trace_path=None):
+        """Enable timings
+
+        """
+        self.enabled = True
+        self.summary = summary
+        self.trace_path = trace_path
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        """Timing span
+
+        Returns context manager
+        """
+        if not self.enabled:
+            return DISABLED_SPAN
+        return Span(self, name, args)
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return 0.0
+        return time.perf_counter() - self.started
+
+    def format_summary(self):
+        """Format summary table
+
+        Returns list of lines. Spans are nested, so totals of different spans overlap.
+        """
+        totals = {}
+        for span in list(self.spans):
+            count, total, longest = totals.get(span.name, (0, 0.0, 0.0))
+            totals[span.name] = (count + 1, total + span.duration, max(longest, span.duration))
+
+        width = max([len('Span')] + [len(name) for name in totals])
+        lines = ['{:{width}} {:>7} {:>10} {:>10} {:>10}'.format(
+            'Span', 'Count', 'Total', 'Mean', 'Max',
+            width=width,
+        )]
+        for name, (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append('{:{width}} {:7d} {:9.4f}s {:9.4f}s {:9.4f}s'.format(
+                name, count, total, total / count, longest,
+                width=width,
+            ))
+        lines.append('{} spans, {:.4f}s total'.format(len(self.spans), self.duration))
+        return lines
+
+    def trace_events(self):
+        """Chrome trace events
+
+        Returns list of complete events with timestamps in microseconds
+        """
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for span in sorted(list(self.spans), key=lambda span: span.started):
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            events.append({
+                'name': span.name,
+                'cat': 'stellator',
+                'ph': 'X',
+                'ts': round((span.started - self.started) * 1000000, 1),
+                'dur': round(span.duration * 1000000, 1),
+                'pid': pid,
+                'tid': tid,
+                'args': dict((key, '{}'.format(value)) for key, value in span.args.items()),
+            })
+        return events
+
+    def write_trace(self, path):
+        """Write Chrome trace JSON file
+
+        """
+        with open(path, 'w') as fd:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, fd)
+
+    def report(self, stream=sys.stderr):
+        """Report enabled timings
+
+        Writes summary table to stream and trace file if requested
+        """
+        if not self.enabled:
+            return
+        self.disable()
+
+        if self.trace_path:
+            try:
+                self.write_trace(self.trace_path)
+            except OSError as e:
+                stream.write('Error writing trace {}: {}\n'.format(self.trace_path, e))
+        if self.summary:
+            stream.write('\n'.join(self.format_summary()) + '\n')
+
+
+# Timings of the process
+TIMINGS = Timings()
+
+
+def span(name, **args):
+    """Timing span
+
+    Span recorded in TIMINGS, does nothing unless timings are enabled
+    """
+    if not TIMINGS.enabled:
+        return DISABLED_SPAN
+    return Span(TIMINGS, name, args)
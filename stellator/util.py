@@ -2,23 +2,116 @@
 Utility functions
 """
 
+import os
+import threading
+import time
+
 from subprocess import Popen, PIPE
 
+from .timing import span
 
-def arp_resolve_ip_address(mac_address):
-    """ARP lookup
+# Command to list ARP table
+ARP_COMMAND = ('/usr/sbin/arp', '-an')
 
-    Lookup mac address from ARP table
+# ARP table in linux proc filesystem
+PROC_ARP_TABLE = '/proc/net/arp'
+
+# Default maximum age of ARP table in seconds
+DEFAULT_ARP_TABLE_TTL = 30
+
+
+def normalize_path(path):
+    """Normalize path
+
+    Returns absolute, normalized path used as key for files
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
+def normalize_mac_address(value):
+    """Normalize MAC address
+
+    Returns MAC address as lower case, zero padded hex octets, i.e. both 0:c:29:a:b:1
+    and 00:0C:29:0A:0B:01 return 00:0c:29:0a:0b:01. Returns None for invalid values.
+    """
+    try:
+        octets = [int(octet, 16) for octet in value.split(':')]
+    except (AttributeError, ValueError):
+        return None
+    if len(octets) != 6:
+        return None
+    return ':'.join('{:02x}'.format(octet) for octet in octets)
+
+
+class ARPTable(dict):
+    """ARP table
+
+    IP addresses from ARP table keyed by normalized MAC address. Table is read from
+    /proc/net/arp if available, otherwise from output of arp -an. The table is loaded
+    again when it's older than ttl seconds.
     """
+    def __init__(self, ttl=DEFAULT_ARP_TABLE_TTL, path=PROC_ARP_TABLE, command=ARP_COMMAND):
+        self.ttl = ttl
+        self.path = path
+        self.command = command
+        self.updated = None
+        self.__lock = threading.Lock()
+
+    def __parse_proc_arp_table__(self, lines):
+        # IP address, HW type, Flags, HW address, Mask, Device. First line is header.
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) >= 4:
+                yield fields[0], fields[3]
+
+    def __parse_arp_command__(self, lines):
+        # ? (192.168.1.1) at 0:1c:42:0:0:18 on en0 ifscope [ethernet]
+        for line in lines:
+            fields = line.split()
+            if len(fields) >= 4:
+                yield fields[1].strip('()'), fields[3]
+
+    def __read_entries__(self):
+        if self.path is not None and os.path.isfile(self.path):
+            with open(self.path, 'r') as fd:
+                return list(self.__parse_proc_arp_table__(fd.readlines()))
+
+        p = Popen(self.command, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return list(self.__parse_arp_command__(str(stdout, 'utf-8').splitlines()))
+
+    def load(self):
+        """Load ARP table
 
-    short_format = ':'.join('%x' % int(v, 16) for v in mac_address.split(':'))
+        Errors reading the table result in empty table
+        """
+        with self.__lock, span('arp.load'):
+            try:
+                entries = self.__read_entries__()
+            except OSError:
+                entries = []
 
-    p = Popen(['/usr/sbin/arp', '-an'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    stdout, stderr = p.communicate()
+            self.clear()
+            for address, mac_address in entries:
+                mac_address = normalize_mac_address(mac_address)
+                if mac_address is not None and mac_address != '00:00:00:00:00:00':
+                    self.setdefault(mac_address, address)
+            self.updated = time.monotonic()
 
-    for line in stdout.splitlines():
-        fields = line.split()
-        if fields[3] in (mac_address, short_format):
-            return fields[1].strip('()')
+    def resolve(self, mac_address):
+        """Resolve IP address
 
-    return None
+        Returns IP address for MAC address or None
+        """
+        if self.updated is None or time.monotonic() - self.updated > self.ttl:
+            self.load()
+        return self.get(normalize_mac_address(mac_address), None)
+
+
+def arp_resolve_ip_address(mac_address, arp_table):
+    """ARP lookup
+
+    Lookup mac address from ARP table
+    """
+    with span('arp.resolve', mac_address=mac_address):
+        return arp_table.resolve(mac_address)
@@ -2,54 +2,179 @@
 Virtual machine configuration
 """
 
-import glob
+import itertools
 import os
+import sys
+import threading
+import time
 
+from .cache import file_signature
 from .constants import (
+    CONFIG_META_KEYS,
     VMX_KEY_MAP,
     VMX_INTEGER_KEYS,
     VMX_BOOLEAN_KEYS,
+    VMX_DEVICE_BOOLEAN_KEYS,
+    VMX_DEVICE_INTEGER_KEYS,
+    VMX_DEVICE_INTERNED_KEYS,
+    VMX_DEVICE_KEY_MAP,
+    VMX_INTERNED_KEYS,
+    VMX_SUMMARY_ATTRIBUTES,
 )
 from .fileparser import (
     VMWareConfigFileParser,
     IndexedConfigEntry,
-    FileParserError
+    IndexedConfigEntries,
+    FileParserError,
+    compile_key_table,
+    decode_value,
+    split_indexed_key,
 )
+from .timing import span
 from .util import arp_resolve_ip_address
 from .vmrun import VMRunError
 
 
+# Power operation used for VM with autoresume flag
+AUTORESUME_MODE_SUSPEND = 'suspend'
+AUTORESUME_MODE_STOP = 'stop'
+
+
 class VirtualMachineError(Exception):
     pass
 
 
+def normalize_uuid(value):
+    """Normalize UUID
+
+    Removes spaces and dashes from UUID values
+    """
+    return ''.join(value.split()).replace('-', '')
+
+
+# Dispatch table for top level .vmx keys
+VMX_KEY_TABLE = compile_key_table(
+    VMX_KEY_MAP,
+    integer_keys=VMX_INTEGER_KEYS,
+    boolean_keys=VMX_BOOLEAN_KEYS,
+    converters={
+        'uuid.bios': normalize_uuid,
+        'uuid.location': normalize_uuid,
+    },
+    interned_keys=VMX_INTERNED_KEYS,
+)
+
+# Defaults of .vmx attributes, served by VMXAttribute descriptors of VirtualMachine
+VMX_ATTRIBUTE_DEFAULTS = dict(
+    (attribute, 0 if key in VMX_INTEGER_KEYS else None) for key, attribute in VMX_KEY_MAP.items()
+)
+
+# Attributes with interned values
+VMX_INTERNED_ATTRIBUTES = frozenset(
+    attribute for attribute, converter in VMX_KEY_TABLE.values() if converter is sys.intern
+)
+
+# Keys parsed for VM summary, mapped to attributes
+VMX_SUMMARY_KEYS = dict(
+    (key, attribute) for key, attribute in VMX_KEY_MAP.items()
+    if attribute in VMX_SUMMARY_ATTRIBUTES
+)
+
+# Keys read to match VMs to name and UUID patterns, mapped to attributes
+VMX_NAME_KEYS = dict(
+    (key, attribute) for key, attribute in VMX_KEY_MAP.items() if attribute == 'name'
+)
+VMX_UUID_KEYS = dict(
+    (key, attribute) for key, attribute in VMX_KEY_MAP.items() if attribute in ('uuid_bios', 'uuid_location')
+)
+
+# Attributes loaded on first access for VMs loaded as summary
+VMX_DETAIL_ATTRIBUTES = set(VMX_KEY_MAP.values()).difference(VMX_SUMMARY_ATTRIBUTES).union((
+    'interfaces',
+    'pci_bridges',
+    'vmci_interfaces',
+    'blockdevices',
+    'shared_folders',
+    'usb',
+))
+
+# Maximum number of bytes read from .vmx file when loading summary
+SUMMARY_BYTE_BUDGET = 64 * 1024
+
+# Dispatch table for keys common to all device sections
+VMX_DEVICE_KEY_TABLE = compile_key_table(
+    VMX_DEVICE_KEY_MAP,
+    integer_keys=VMX_DEVICE_INTEGER_KEYS,
+    boolean_keys=VMX_DEVICE_BOOLEAN_KEYS,
+    interned_keys=VMX_DEVICE_INTERNED_KEYS,
+)
+
 class VirtualMachineConfigurationSection(IndexedConfigEntry):
     """Common dot separated config section
 
-    Parse keys in configuration and set to attributes of the object.
+    Parse keys in configuration and set to attributes of the object. Keys are
+    dispatched with key_table, compiled from VMX_DEVICE_* constants and the
+    integer_keys, boolean_keys, interned_keys and key_map of each subclass.
     """
     integer_keys = ()
     boolean_keys = ()
+    interned_keys = ()
     key_map = {}
+    key_table = VMX_DEVICE_KEY_TABLE
+
+    # Attributes not stored in serialized state
+    unserialized_attributes = ('virtualmachine',)
+    interned_attributes = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.key_table = dict(VMX_DEVICE_KEY_TABLE)
+        cls.key_table.update(compile_key_table(
+            cls.key_map,
+            cls.integer_keys,
+            cls.boolean_keys,
+            interned_keys=tuple(cls.interned_keys) + tuple(
+                key for key in VMX_DEVICE_INTERNED_KEYS if key in cls.key_map
+            ),
+        ))
+        cls.interned_attributes = frozenset(
+            attribute for attribute, converter in cls.key_table.values() if converter is sys.intern
+        )
 
     def __init__(self, virtualmachine, index):
         super().__init__(index)
         self.virtualmachine = virtualmachine
 
-    def set(self, parts, value):
-        if len(parts) > 1:
-            return parts, value
+    def serialize(self):
+        """Serialize section
+
+        Returns parsed attributes of the section as dictionary
+        """
+        return dict(
+            (key, value) for key, value in vars(self).items()
+            if key not in self.unserialized_attributes
+        )
 
-        key = parts[0]
+    def restore(self, state):
+        """Restore section
 
-        if key in self.integer_keys:
-            value = int(value)
+        Restores attributes from dictionary returned by serialize()
+        """
+        for key, value in state.items():
+            if key in self.interned_attributes and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
 
-        if key in self.boolean_keys:
-            value = value == 'TRUE'
+    def set(self, key, value):
+        if '.' in key:
+            return key, value
 
-        if key in self.key_map:
-            key = self.key_map[key]
+        try:
+            key, converter = self.key_table[key]
+            if converter is not None:
+                value = converter(value)
+        except KeyError:
+            pass
 
         setattr(self, key, value)
         return key, value
@@ -62,6 +187,7 @@ class Interface(VirtualMachineConfigurationSection):
     """
     integer_keys = ('pciSlotNumber', 'generatedAddressOffset',)
     boolean_keys = ('present', 'startConnected', 'wakeOnPcktRcv',)
+    interned_keys = ('connectionType', 'addressType',)
     key_map = {
         'virtualDev': 'driver',
         'connectionType': 'connection_type',
@@ -89,7 +215,10 @@ class Interface(VirtualMachineConfigurationSection):
 
         Returns IP address from ARP table or None
         """
-        return arp_resolve_ip_address(self.mac_address)
+        mac_address = getattr(self, 'mac_address', None) or getattr(self, 'address', None)
+        if mac_address is None:
+            return None
+        return arp_resolve_ip_address(mac_address, self.virtualmachine.inventory.arp_table)
 
 
 class PCIBridge(VirtualMachineConfigurationSection):
@@ -127,10 +256,11 @@ class USB(VirtualMachineConfigurationSection):
     key_map = {
         'pciSlotNumber': 'pci_slot_number',
     }
+    unserialized_attributes = ('virtualmachine', 'interfaces',)
 
     def __init__(self, virtualmachine, index=0):
         super().__init__(virtualmachine, index)
-        self.interfaces = []
+        self.interfaces = IndexedConfigEntries(USBPort, virtualmachine)
 
 
 class Share(VirtualMachineConfigurationSection):
@@ -138,7 +268,9 @@ class Share(VirtualMachineConfigurationSection):
 
     """
     boolean_keys = ('enabled', 'present', 'readAccess', 'writeAccess',)
+    interned_keys = ('expiration',)
     key_map = {
+        'expiration': 'expiration',
         'hostPath': 'host_path',
         'guestName': 'guest_folder_name',
         'readAccess': 'guest_read_access',
@@ -150,14 +282,19 @@ class SharedFolders(VirtualMachineConfigurationSection):
     """Shared folder configuration
 
     """
-    def __init__(self, virtualmachine, index=0):
-        super().__init__(virtualmachine, index)
-        self.shares = []
-
     integer_keys = ('maxNum',)
     key_map = {
         'maxNum': 'max_number',
     }
+    unserialized_attributes = ('virtualmachine', 'shares',)
+
+    def __init__(self, virtualmachine, index=0):
+        super().__init__(virtualmachine, index)
+        self.shares = IndexedConfigEntries(Share, virtualmachine)
+
+    @property
+    def count(self):
+        return getattr(self, 'max_number', None)
 
 
 class VMCI(VirtualMachineConfigurationSection):
@@ -171,35 +308,169 @@ class VMCI(VirtualMachineConfigurationSection):
     }
 
 
+class DirectoryState(object):
+    """VM directory state
+
+    Files in VM directory telling the VM state: .vmem and .vmss files, .lck locks and
+    the autoresume flag file. Collected with single directory scan.
+    """
+    def __init__(self, path, autoresume_filename):
+        self.path = path
+        self.autoresume_filename = autoresume_filename
+        self.scan()
+
+    def __repr__(self):
+        return self.path
+
+    def scan(self):
+        """Scan directory
+
+        Missing or unreadable directory is handled as empty directory
+        """
+        self.vmem_files = []
+        self.vmss_files = []
+        self.lock_files = []
+        self.autoresume = False
+
+        try:
+            with span('directory.scan', path=self.path), os.scandir(self.path) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if name == self.autoresume_filename:
+                        self.autoresume = entry.is_file()
+                    elif name.endswith('.vmem'):
+                        self.vmem_files.append(entry.path)
+                    elif name.endswith('.vmss'):
+                        self.vmss_files.append(entry.path)
+                    elif name.endswith('.lck'):
+                        self.lock_files.append(entry.path)
+        except OSError:
+            pass
+
+    @property
+    def has_vmem(self):
+        return len(self.vmem_files) > 0
+
+    @property
+    def has_vmss(self):
+        return len(self.vmss_files) > 0
+
+    @property
+    def locked(self):
+        return len(self.lock_files) > 0
+
+
+class VMXAttribute(object):
+    """Attribute parsed from .vmx file
+
+    Descriptor returning the default value for attributes not set in the instance,
+    so defaults are stored once in the class. Parsed values are stored in instance
+    and override the descriptor. Accessing attributes not in summary for VM loaded
+    as summary loads the full configuration.
+    """
+    __slots__ = ('name', 'default', 'detail')
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+        self.detail = name in VMX_DETAIL_ATTRIBUTES
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.detail and instance.__dict__.get('summary', False):
+            instance.load_details()
+            return instance.__dict__.get(self.name, self.default)
+        return self.default
+
+
 class VirtualMachine(VMWareConfigFileParser):
     """Vmware .vmx parser
 
     Parse .vmx file and give some functionality to control the VM.
+
+    If summary is True, only the keys in VMX_SUMMARY_ATTRIBUTES are parsed and reading
+    the file stops when these have been seen. Rest of the configuration is loaded when
+    any other attribute is accessed. If SUMMARY_BYTE_BUDGET is used before all summary
+    attributes were seen, the full configuration is loaded instead.
     """
-    def __init__(self, inventory, path):
+    def __init__(self, inventory, path, summary=False):
         super().__init__(path)
 
         self.inventory = inventory
+        self.summary = summary
+        self.__details_lock = threading.Lock()
+        self.directory = os.path.dirname(self.path)
+        self.__directory_state = None
+
+        if not summary:
+            self.__init_details__()
+
+        try:
+            self.load()
+        except FileParserError as e:
+            raise VirtualMachineError('Error loading {}: {}'.format(self.path, e))
 
-        # Set defaults for keys
-        for key, value in VMX_KEY_MAP.items():
-            if key in VMX_INTEGER_KEYS:
-                setattr(self, value, 0)
-            else:
-                setattr(self, value, None)
+    def __getattr__(self, attr):
+        if attr in VMX_DETAIL_ATTRIBUTES and self.__dict__.get('summary', False):
+            self.load_details()
+            return getattr(self, attr)
+        raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, attr))
 
-        self.interfaces = []
-        self.pci_bridges = []
-        self.vmci_interfaces = []
+    def __init_details__(self):
+        """Initialize full configuration
+
+        Create empty device sections
+        """
+        self.interfaces = IndexedConfigEntries(Interface, self)
+        self.pci_bridges = IndexedConfigEntries(PCIBridge, self)
+        self.vmci_interfaces = IndexedConfigEntries(VMCI, self)
         self.blockdevices = []
 
         self.shared_folders = SharedFolders(self)
         self.usb = USB(self)
 
-        try:
-            self.load()
-        except FileParserError as e:
-            raise VirtualMachineError('Error loading {}: {}'.format(self.path, e))
+    def load_details(self):
+        """Load full configuration
+
+        Load full configuration for VMs loaded as summary. This is called automatically
+        when attributes not included in summary are accessed.
+
+        Details are loaded once even if several threads access the VM. Configuration
+        is loaded to a separate VirtualMachine and moved to this one when complete, and
+        summary stays True until then, so other threads accessing detail attributes
+        wait for the load instead of seeing partially loaded values.
+        """
+        if not self.summary:
+            return
+
+        with self.__details_lock:
+            if not self.summary:
+                return
+            self.__adopt_details__(VirtualMachine(self.inventory, self.path))
+
+    def __adopt_details__(self, details):
+        """Move full configuration from details
+
+        Device sections of details are moved to this VM
+        """
+        for entries in (
+                details.interfaces,
+                details.pci_bridges,
+                details.vmci_interfaces,
+                details.usb.interfaces,
+                details.shared_folders.shares):
+            entries.parent = self
+            for entry in entries:
+                entry.virtualmachine = self
+        details.usb.virtualmachine = self
+        details.shared_folders.virtualmachine = self
+
+        self.meta.update(details.meta)
+        for key, value in details.__dict__.items():
+            if key in VMX_ATTRIBUTE_DEFAULTS or key in VMX_DETAIL_ATTRIBUTES:
+                setattr(self, key, value)
+        self.summary = False
 
     def __repr__(self):
         return self.path
@@ -222,6 +493,92 @@ class VirtualMachine(VMWareConfigFileParser):
     def __ge__(self, other):
         return self.path >= other.path
 
+    def load(self):
+        """Load .vmx file
+
+        Parsed state is loaded from inventory cache if the file was not modified. Cached
+        summary is not used when full configuration is requested.
+        """
+        with span('vmx.load', path=self.path):
+            cache = self.inventory.cache
+            if cache is None:
+                with span('vmx.parse', path=self.path):
+                    return super().load()
+
+            signature = file_signature(self.path)
+            state = cache.get(self.path, signature)
+            if state is not None and (self.summary or not state['summary']):
+                self.restore(state)
+                return
+
+            with span('vmx.parse', path=self.path):
+                super().load()
+            if signature is not None:
+                cache.set(self.path, signature, self.serialize())
+
+    def serialize(self):
+        """Serialize VM configuration
+
+        Returns parsed configuration, including device sections, as dictionary
+        """
+        if self.summary:
+            return {
+                'summary': True,
+                'meta': self.meta,
+                'values': dict((key, getattr(self, key)) for key in VMX_SUMMARY_ATTRIBUTES),
+            }
+
+        return {
+            'summary': False,
+            'meta': self.meta,
+            'values': dict((key, getattr(self, key)) for key in set(VMX_KEY_MAP.values())),
+            'interfaces': [interface.serialize() for interface in self.interfaces],
+            'pci_bridges': [bridge.serialize() for bridge in self.pci_bridges],
+            'vmci_interfaces': [vmci.serialize() for vmci in self.vmci_interfaces],
+            'usb': self.usb.serialize(),
+            'usb_interfaces': [interface.serialize() for interface in self.usb.interfaces],
+            'shared_folders': self.shared_folders.serialize(),
+            'shares': [share.serialize() for share in self.shared_folders.shares],
+        }
+
+    def restore(self, state):
+        """Restore VM configuration
+
+        Restores configuration from dictionary returned by serialize()
+        """
+        if self.summary and not state['summary']:
+            self.summary = False
+            self.__init_details__()
+
+        self.meta.update(state['meta'])
+        for key, value in state['values'].items():
+            default = VMX_ATTRIBUTE_DEFAULTS.get(key, None)
+            if value == default and type(value) is type(default):
+                # Default value is served by VMXAttribute
+                self.__dict__.pop(key, None)
+                continue
+            if key in VMX_INTERNED_ATTRIBUTES and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+
+        if state['summary']:
+            return
+
+        for item in state['interfaces']:
+            self.__get_interface__(item['index']).restore(item)
+        for item in state['pci_bridges']:
+            self.__get_pci_bridge__(item['index']).restore(item)
+        for item in state['vmci_interfaces']:
+            self.__get_vmci__(item['index']).restore(item)
+
+        self.usb.restore(state['usb'])
+        for item in state['usb_interfaces']:
+            self.__get_usb_interface__(item['index']).restore(item)
+
+        self.shared_folders.restore(state['shared_folders'])
+        for item in state['shares']:
+            self.__get_share__(item['index']).restore(item)
+
     @property
     def uuid(self):
         uuid = getattr(self, 'uuid_location', None)
@@ -237,15 +594,7 @@ class VirtualMachine(VMWareConfigFileParser):
         value = self.annotation
         if value is None:
             return ''
-        return '\n'.join(value.split('|0A'))
-
-    @property
-    def directory(self):
-        """Return .vmx directory
-
-        Return directory where .vmx file is
-        """
-        return os.path.dirname(self.path)
+        return decode_value(value)
 
     @property
     def headless(self):
@@ -259,16 +608,15 @@ class VirtualMachine(VMWareConfigFileParser):
     def is_running(self):
         """Is VM running
 
+        Uses running VMs snapshot shared by the inventory
         """
 
         try:
-            running_vms = self.inventory.vmrun.running_vms()
+            return self.inventory.is_running(self)
         except VMRunError as e:
             # TODO - maybe we want something else here?
             raise VirtualMachineError(e)
 
-        return self.path in running_vms
-
     @property
     def autoresume_file(self):
         """Filename for autoresume
@@ -277,13 +625,48 @@ class VirtualMachine(VMWareConfigFileParser):
         """
         return os.path.join(self.directory, self.inventory.config['autoresume_filename'])
 
+    @property
+    def directory_state(self):
+        """VM directory state
+
+        Directory is scanned on first access and after power operations
+        """
+        if self.__directory_state is None:
+            self.__directory_state = DirectoryState(self.directory, self.inventory.config['autoresume_filename'])
+        return self.__directory_state
+
+    def refresh_directory_state(self):
+        """Refresh VM directory state
+
+        Directory is scanned again on next access
+        """
+        self.__directory_state = None
+
     @property
     def autoresume(self):
         """Is VM autoresuming
 
         True if self.autoresume_file exists
         """
-        return os.path.isfile(self.autoresume_file)
+        return self.directory_state.autoresume
+
+    @property
+    def autoresume_mode(self):
+        """Autoresume mode
+
+        Returns AUTORESUME_MODE_SUSPEND or AUTORESUME_MODE_STOP depending on how the VM
+        was powered off with autoresume flag, or None if autoresume is not set.
+        """
+        if not self.autoresume:
+            return None
+        try:
+            with open(self.autoresume_file, 'r') as fd:
+                mode = fd.read().strip()
+        except OSError:
+            return None
+        if mode == AUTORESUME_MODE_STOP:
+            return AUTORESUME_MODE_STOP
+        return AUTORESUME_MODE_SUSPEND
 
     @property
     def has_vmem(self):
@@ -291,7 +674,21 @@ class VirtualMachine(VMWareConfigFileParser):
 
         If VM is not running and has .vmem files, it is suspended.
         """
-        return len(glob.glob('{}/*.vmem'.format(self.directory))) > 0
+        return self.directory_state.has_vmem
+
+    @property
+    def has_vmss(self):
+        """Has .vmss file
+
+        """
+        return self.directory_state.has_vmss
+
+    @property
+    def locked(self):
+        """Has .lck locks
+
+        """
+        return self.directory_state.locked
 
     @property
     def status(self):
@@ -307,6 +704,50 @@ class VirtualMachine(VMWareConfigFileParser):
 
         return 'stopped'
 
+    def __vmrun__(self, command, running, **kwargs):
+        """Run vmrun power operation
+
+        Updates state of the VM in running VMs snapshot after the operation. Snapshot
+        is invalidated if the operation fails.
+        """
+        try:
+            getattr(self.inventory.vmrun, command)(self.path, **kwargs)
+        except VMRunError:
+            self.inventory.running.invalidate()
+            raise
+        finally:
+            self.refresh_directory_state()
+        self.inventory.running.set_running(self.path, running)
+
+    async def __async_vmrun__(self, command, running, **kwargs):
+        """Run vmrun power operation with AsyncVMRunWrapper
+
+        Like __vmrun__. Snapshot is also invalidated if the operation is cancelled.
+        """
+        try:
+            await getattr(self.inventory.async_vmrun, command)(self.path, **kwargs)
+        except BaseException:
+            self.inventory.running.invalidate()
+            raise
+        finally:
+            self.refresh_directory_state()
+        self.inventory.running.set_running(self.path, running)
+
+    def __remove_autoresume_file__(self):
+        if self.autoresume:
+            try:
+                os.unlink(self.autoresume_file)
+            except OSError:
+                pass
+            self.refresh_directory_state()
+
+    def __write_autoresume_file__(self, mode=AUTORESUME_MODE_SUSPEND):
+        try:
+            open(self.autoresume_file, 'w').write('{}\n'.format(mode))
+        except OSError:
+            pass
+        self.refresh_directory_state()
+
     def start(self, headless=None):
         """Start VM
 
@@ -317,13 +758,8 @@ class VirtualMachine(VMWareConfigFileParser):
         if headless is None:
             headless = self.headless
 
-        self.inventory.vmrun.start(self.path, headless=headless)
-
-        if os.path.isfile(self.autoresume_file):
-            try:
-                os.unlink(self.autoresume_file)
-            except OSError:
-                pass
+        self.__vmrun__('start', True, headless=headless)
+        self.__remove_autoresume_file__()
 
     def suspend(self, autoresume=False):
         """Suspend VM
@@ -336,130 +772,285 @@ class VirtualMachine(VMWareConfigFileParser):
         if not self.is_running:
             return
 
-        self.inventory.vmrun.suspend(self.path)
+        self.__vmrun__('suspend', False)
 
         if autoresume and self.headless:
-            try:
-                open(self.autoresume_file, 'w').write('\n')
-            except OSError:
-                pass
+            self.__write_autoresume_file__()
 
-    def stop(self):
+    def stop(self, autoresume=False):
         """Stop VM
 
-        Stop (shutdown) the VM
+        Stop (shutdown) the VM. With autoresume, autoresume flag is set like with
+        suspend and the autoresume mode records the VM was stopped.
         """
         if not self.is_running:
             return
 
-        self.inventory.vmrun.stop(self.path)
+        self.__vmrun__('stop', False)
 
-    def __get_interface__(self, index):
-        for interface in self.interfaces:
-            if interface == index:
-                return interface
+        if autoresume and self.headless:
+            self.__write_autoresume_file__(AUTORESUME_MODE_STOP)
 
-        interface = Interface(self, index)
-        self.interfaces.append(interface)
-        return interface
+    def set_values(self, values, since=None):
+        """Set .vmx values
 
-    def __get_vmci__(self, index):
-        for vmci in self.vmci_interfaces:
-            if vmci == index:
-                return vmci
+        Values is dictionary of .vmx keys and values. Only changed lines of the .vmx
+        file are rewritten, see VMWareConfigFileParser.update_values. Running and
+        suspended VMs are not modified. Parsed configuration and the .vmx cache are
+        updated with the changed lines without parsing the file again.
 
-        vmci = VMCI(self, index)
-        self.vmci_interfaces.append(vmci)
-        return vmci
+        Running state is checked from a running VMs snapshot taken after since, a
+        time.monotonic() value defaulting to now. Give the same value to VMs modified
+        together to list the running VMs only once.
 
-    def __get_pci_bridge__(self, index):
-        for bridge in self.pci_bridges:
-            if bridge == index:
-                return bridge
+        Returns list of changed lines
+        """
+        self.inventory.running.refresh_if_older(since if since is not None else time.monotonic())
+        self.refresh_directory_state()
+        status = self.status
+        if status != 'stopped':
+            raise VirtualMachineError('Refusing to modify {} VM {}'.format(status, self.path))
 
-        bridge = PCIBridge(self, index)
-        self.pci_bridges.append(bridge)
-        return bridge
+        try:
+            with span('vmx.write', path=self.path):
+                changed = self.update_values(values)
+        except FileParserError as e:
+            raise VirtualMachineError(e)
 
-    def __get_usb_interface__(self, index):
-        for interface in self.usb.interfaces:
-            if interface == index:
-                return interface
+        for line in changed:
+            key = line.split('=', 1)[0].rstrip()
+            # Summary VMs load other values from the file when accessed
+            if not self.summary or key in VMX_SUMMARY_KEYS:
+                self.parse_line(line)
+
+        cache = self.inventory.cache
+        signature = file_signature(self.path)
+        if changed and cache is not None and signature is not None:
+            cache.set(self.path, signature, self.serialize())
+
+        return changed
+
+    async def async_is_running(self, timeout=None):
+        """Is VM running
+
+        Coroutine version of is_running
+        """
+        try:
+            return await self.inventory.async_is_running(self, timeout=timeout)
+        except VMRunError as e:
+            raise VirtualMachineError(e)
+
+    async def async_start(self, headless=None, timeout=None):
+        """Start VM
+
+        Coroutine version of start. Timeout applies to each vmrun call.
+        """
+        if await self.async_is_running(timeout=timeout):
+            return
+
+        if headless is None:
+            headless = self.headless
+
+        await self.__async_vmrun__('start', True, headless=headless, timeout=timeout)
+        self.__remove_autoresume_file__()
+
+    async def async_suspend(self, autoresume=False, timeout=None):
+        """Suspend VM
+
+        Coroutine version of suspend. Timeout applies to each vmrun call.
+        """
+        if not await self.async_is_running(timeout=timeout):
+            return
+
+        await self.__async_vmrun__('suspend', False, timeout=timeout)
+
+        if autoresume and self.headless:
+            self.__write_autoresume_file__()
+
+    async def async_stop(self, autoresume=False, timeout=None):
+        """Stop VM
+
+        Coroutine version of stop. Timeout applies to each vmrun call.
+        """
+        if not await self.async_is_running(timeout=timeout):
+            return
+
+        await self.__async_vmrun__('stop', False, timeout=timeout)
+
+        if autoresume and self.headless:
+            self.__write_autoresume_file__(AUTORESUME_MODE_STOP)
+
+    def __get_interface__(self, index):
+        return self.interfaces.get(index)
 
-        interface = USBPort(self, index)
-        self.usb.interfaces.append(interface)
-        return interface
+    def __get_vmci__(self, index):
+        return self.vmci_interfaces.get(index)
+
+    def __get_pci_bridge__(self, index):
+        return self.pci_bridges.get(index)
+
+    def __get_usb_interface__(self, index):
+        return self.usb.interfaces.get(index)
 
     def __get_share__(self, index):
-        for share in self.shared_folders.shares:
-            if share.index == index:
-                return share
+        return self.shared_folders.shares.get(index)
+
+    # Indexed device sections by key prefix
+    indexed_sections = {
+        'ethernet': __get_interface__,
+        'vmci': __get_vmci__,
+        'pciBridge': __get_pci_bridge__,
+        'usb:': __get_usb_interface__,
+        'sharedFolder': __get_share__,
+    }
+    # Device sections without index by key prefix
+    sections = {
+        'usb': 'usb',
+        'sharedFolder': 'shared_folders',
+    }
 
-        share = Share(self, index)
-        self.shared_folders.shares.append(share)
-        return share
+    def parse_lines(self, lines):
+        """Parse lines
+
+        When loading summary, only summary keys are parsed and reading stops when all
+        summary attributes have been seen. If SUMMARY_BYTE_BUDGET is used first, the
+        summary attributes may be later in the file: VM is loaded with full
+        configuration, parsing again the lines read so far and the rest of the file.
+        """
+        if not self.summary:
+            return super().parse_lines(lines)
+
+        pending = set(VMX_SUMMARY_ATTRIBUTES)
+        budget = SUMMARY_BYTE_BUDGET
+        read = []
+        for line in lines:
+            read.append(line)
+            key = line.split('=', 1)[0].rstrip()
+            if key in VMX_SUMMARY_KEYS:
+                self.parse_line(line)
+                pending.discard(VMX_SUMMARY_KEYS[key])
+                if not pending:
+                    break
+            elif key in CONFIG_META_KEYS:
+                self.parse_line(line)
+
+            budget -= len(line) + 1
+            if budget <= 0:
+                self.summary = False
+                self.__init_details__()
+                return super().parse_lines(itertools.chain(read, lines))
 
     def parse_value(self, key, value):
         """Parse values
 
-        Right now we skip most keys: implement rest if you are interested.
+        Keys are looked up from VMX_KEY_TABLE, device section keys dispatched by
+        the key prefix. Right now we skip most keys: implement rest if you are
+        interested.
         """
         if super().parse_value(key, value):
             return
 
-        if key in VMX_BOOLEAN_KEYS:
-            value = value == 'TRUE'
+        try:
+            attribute, converter = VMX_KEY_TABLE[key]
+        except KeyError:
+            return self.__parse_section_value__(key, value)
 
-        if key in VMX_INTEGER_KEYS:
-            value = int(value)
+        if converter is not None:
+            value = converter(value)
+        setattr(self, attribute, value)
+
+    def __parse_section_value__(self, key, value):
+        """Parse device section values
+
+        """
+        prefix, index, key = split_indexed_key(key)
+        if index is None:
+            if prefix in self.sections:
+                getattr(self, self.sections[prefix]).set(key, value)
+        elif prefix in self.indexed_sections:
+            self.indexed_sections[prefix](self, index).set(key, value)
+
+
+class VirtualMachineName(VMWareConfigFileParser):
+    """Name and UUID of .vmx file
+
+    Reads displayName, and UUIDs if uuid is True, from .vmx file to match VMs to
+    patterns before loading them. Values are taken from the .vmx cache if it's up to
+    date. Reading stops when the keys have been seen or SUMMARY_BYTE_BUDGET is used:
+    truncated is True if the budget was used before all keys were seen.
+    """
+    def __init__(self, inventory, path, uuid=False):
+        super().__init__(path)
+
+        self.inventory = inventory
+        self.keys = dict(VMX_NAME_KEYS, **VMX_UUID_KEYS) if uuid else VMX_NAME_KEYS
+        self.name = None
+        self.uuid_bios = None
+        self.uuid_location = None
+        self.truncated = False
+
+        try:
+            self.load()
+        except FileParserError as e:
+            raise VirtualMachineError('Error loading {}: {}'.format(self.path, e))
+
+    def __repr__(self):
+        return self.path
+
+    @property
+    def uuid(self):
+        if self.uuid_location is not None:
+            return self.uuid_location
+        return self.uuid_bios
+
+    def load(self):
+        cache = self.inventory.cache
+        if cache is not None:
+            state = cache.get(self.path, file_signature(self.path))
+            if state is not None:
+                for attribute in set(self.keys.values()):
+                    setattr(self, attribute, state['values'].get(attribute, None))
+                return
+
+        with span('vmx.peek', path=self.path):
+            super().load()
+
+    def parse_lines(self, lines):
+        pending = set(self.keys.values())
+        budget = SUMMARY_BYTE_BUDGET
+        for line in lines:
+            key = line.split('=', 1)[0].rstrip()
+            if key in self.keys:
+                self.parse_line(line)
+                pending.discard(self.keys[key])
+                if not pending:
+                    break
+            elif key in CONFIG_META_KEYS:
+                self.parse_line(line)
+
+            budget -= len(line) + 1
+            if budget <= 0:
+                self.truncated = True
+                break
+
+    def parse_value(self, key, value):
+        if super().parse_value(key, value):
+            return
+
+        attribute, converter = VMX_KEY_TABLE[key]
+        if converter is not None:
+            value = converter(value)
+        setattr(self, attribute, value)
+
+
+def add_vmx_attributes(cls):
+    """Add .vmx attribute descriptors
+
+    Adds VMXAttribute for each attribute in VMX_ATTRIBUTE_DEFAULTS to class
+    """
+    for attribute, default in VMX_ATTRIBUTE_DEFAULTS.items():
+        setattr(cls, attribute, VMXAttribute(attribute, default))
+    return cls
 
-        if key in VMX_KEY_MAP:
-            key = VMX_KEY_MAP[key]
-            if key in ('uuid_bios', 'uuid_location'):
-                value = ''.join(value.split()).replace('-', '')
-            setattr(self, key, value)
 
-        else:
-            parts = key.split('.')
-
-            if parts[0] == 'usb':
-                self.usb.set(parts[1:], value)
-
-            elif parts[0][:4] == 'vmci':
-                index = int(parts[0][4:])
-                parts = parts[1:]
-                vmci = self.__get_vmci__(index)
-                vmci.set(parts, value)
-
-            elif parts[0][:8] == 'ethernet':
-                index = int(parts[0][8:])
-                parts = parts[1:]
-                interface = self.__get_interface__(index)
-                interface.set(parts, value)
-
-            elif parts[0][:9] == 'pciBridge':
-                index = int(parts[0][9:])
-                parts = parts[1:]
-                bridge = self.__get_pci_bridge__(index)
-                bridge.set(parts, value)
-
-            elif parts[0][:4] == 'usb:':
-                try:
-                    index = int(parts[0][4:])
-                    parts = parts[1:]
-                    usb = self.__get_usb_interface__(index)
-                    usb.set(parts, value)
-                except ValueError as e:
-                    print(parts, e)
-
-            elif key == 'sharedFolder.maxNum':
-                self.shared_folders.count = value
-
-            elif parts[0][:12] == 'sharedFolder':
-                try:
-                    index = int(parts[0][12:])
-                    parts = parts[1:]
-                    share = self.__get_share__(index)
-                    share.set(parts, value)
-                except ValueError as e:
-                    print(parts, e)
+add_vmx_attributes(VirtualMachine)
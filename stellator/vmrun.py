@@ -5,6 +5,9 @@ Wrap vmrun calls
 import os
 from subprocess import Popen, PIPE
 
+from .config import StellatorConfigError
+from .timing import span
+
 VMRUN_RELATIVE_PATH = 'Contents/Library/vmrun'
 
 
@@ -19,15 +22,19 @@ class VMRunWrapper(object):
     """
 
     def __init__(self, config):
-        self.path = os.path.join(config['application_path'], VMRUN_RELATIVE_PATH)
+        try:
+            self.path = os.path.join(config['application_path'], VMRUN_RELATIVE_PATH)
+        except StellatorConfigError as e:
+            raise VMRunError(e)
         if not os.access(self.path, os.X_OK):
             raise VMRunError('Not executable: {}'.format(self.path))
 
     def __run__(self, args):
-        command = [self.path] + args
-        p = Popen(command, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-        stdout, stderr = p.communicate()
-        return p.returncode, stdout, stderr
+        with span('vmrun', command=args[0]):
+            command = [self.path] + args
+            p = Popen(command, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+            stdout, stderr = p.communicate()
+            return p.returncode, stdout, stderr
 
     def __format_stdout_stderr__(self, stdout, stderr):
         stdout = str(stdout, 'utf-8').rstrip()
@@ -39,40 +46,110 @@ class VMRunWrapper(object):
             message += '{}\n'.format(stderr)
         return message
 
-    def running_vms(self):
-        rv, stdout, stderr = self.__run__(['list'])
+    def __start_args__(self, vmx_path, headless):
+        if headless:
+            return ['start', vmx_path, 'nogui']
+        return ['start', vmx_path]
+
+    def __parse_running_vms__(self, rv, stdout, stderr):
         if rv != 0:
             raise VMRunError('Error running vmrun list: {}'.format(stderr))
 
         stdout = str(stdout, 'utf-8').rstrip()
         return stdout.splitlines()[1:]
 
-    def start(self, vmx_path, headless=False):
-        if headless:
-            rv, stdout, stderr = self.__run__(['start', vmx_path, 'nogui'])
-        else:
-            rv, stdout, stderr = self.__run__(['start', vmx_path])
-
+    def __check_result__(self, action, vmx_path, rv, stdout, stderr):
         if rv != 0:
-            raise VMRunError('Error starting {}: {}'.format(
+            raise VMRunError('Error {} {}: {}'.format(
+                action,
                 vmx_path,
                 self.__format_stdout_stderr__(stdout, stderr)
             ))
 
+    def running_vms(self):
+        return self.__parse_running_vms__(*self.__run__(['list']))
+
+    def start(self, vmx_path, headless=False):
+        rv, stdout, stderr = self.__run__(self.__start_args__(vmx_path, headless))
+        self.__check_result__('starting', vmx_path, rv, stdout, stderr)
+
     def suspend(self, vmx_path):
         rv, stdout, stderr = self.__run__(['suspend', vmx_path])
-
-        if rv != 0:
-            raise VMRunError('Error suspending {}: {}'.format(
-                vmx_path,
-                self.__format_stdout_stderr__(stdout, stderr)
-            ))
+        self.__check_result__('suspending', vmx_path, rv, stdout, stderr)
 
     def stop(self, vmx_path):
         rv, stdout, stderr = self.__run__(['stop', vmx_path])
+        self.__check_result__('stopping', vmx_path, rv, stdout, stderr)
 
-        if rv != 0:
-            raise VMRunError('Error stopping {}: {}'.format(
-                vmx_path,
-                self.__format_stdout_stderr__(stdout, stderr)
-            ))
+
+class AsyncVMRunWrapper(VMRunWrapper):
+    """Wrap vmrun with asyncio
+
+    Same commands as VMRunWrapper as coroutines. Each call accepts a timeout in
+    seconds. The vmrun process is killed if the call times out or is cancelled.
+
+    If max_processes is set, at most max_processes vmrun commands are run at the
+    same time.
+
+    asyncio is imported on first use to keep it out of CLI startup.
+    """
+
+    def __init__(self, config, max_processes=None):
+        super(AsyncVMRunWrapper, self).__init__(config)
+        self.max_processes = max_processes
+        self.__semaphore = None
+
+    @property
+    def semaphore(self):
+        if self.__semaphore is None and self.max_processes is not None:
+            import asyncio
+            self.__semaphore = asyncio.Semaphore(self.max_processes)
+        return self.__semaphore
+
+    async def __kill__(self, process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def __execute__(self, args, timeout):
+        import asyncio
+        with span('vmrun', command=args[0]):
+            process = await asyncio.create_subprocess_exec(
+                self.path, *args,
+                stdin=PIPE,
+                stdout=PIPE,
+                stderr=PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                await self.__kill__(process)
+                raise VMRunError('Timeout running vmrun {} after {} seconds'.format(' '.join(args), timeout))
+            except asyncio.CancelledError:
+                await asyncio.shield(self.__kill__(process))
+                raise
+            return process.returncode, stdout, stderr
+
+    async def __run__(self, args, timeout=None):
+        if self.semaphore is None:
+            return await self.__execute__(args, timeout)
+        async with self.semaphore:
+            return await self.__execute__(args, timeout)
+
+    async def running_vms(self, timeout=None):
+        return self.__parse_running_vms__(*await self.__run__(['list'], timeout))
+
+    async def start(self, vmx_path, headless=False, timeout=None):
+        rv, stdout, stderr = await self.__run__(self.__start_args__(vmx_path, headless), timeout)
+        self.__check_result__('starting', vmx_path, rv, stdout, stderr)
+
+    async def suspend(self, vmx_path, timeout=None):
+        rv, stdout, stderr = await self.__run__(['suspend', vmx_path], timeout)
+        self.__check_result__('suspending', vmx_path, rv, stdout, stderr)
+
+    async def stop(self, vmx_path, timeout=None):
+        rv, stdout, stderr = await self.__run__(['stop', vmx_path], timeout)
+        self.__check_result__('stopping', vmx_path, rv, stdout, stderr)
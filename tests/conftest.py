@@ -0,0 +1,58 @@
+"""
+Test fixtures
+
+Tests run against a synthetic fleet generated with benchmarks.fleet. HOME is set to
+a temporary directory before stellator is imported, so the default configuration
+paths do not point to the user's files.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+os.environ['HOME'] = tempfile.mkdtemp(prefix='stellator-tests-')
+os.environ.pop('VMWARE_INVENTORY', None)
+os.environ.pop('VMWARE_DIRECTORY', None)
+
+import pytest  # noqa: E402
+
+from benchmarks.fleet import FleetGenerator  # noqa: E402
+from stellator.config import StellatorConfig  # noqa: E402
+from stellator.inventory import VirtualMachineFinder  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def fleet(tmp_path):
+    return FleetGenerator(str(tmp_path / 'fleet'), count=6, interfaces=2, shares=1, usb_ports=2,
+                          pci_bridges=2, folders=2).generate()
+
+
+@pytest.fixture
+def config(fleet):
+    return StellatorConfig(fleet.config_path)
+
+
+@pytest.fixture
+def finder(config):
+    return VirtualMachineFinder(config)
+
+
+@pytest.fixture
+def run_stellator(fleet):
+    """Run stellator command with the fleet
+
+    Returns CompletedProcess with output as text
+    """
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, '-c', 'from stellator.bin.stellator import main; main()', '--no-daemon'] + list(args),
+            cwd=ROOT,
+            env=fleet.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+    return run
@@ -0,0 +1,147 @@
+"""
+Test stellator daemon
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from stellator.bin import stellator
+from stellator.inventory import VirtualMachineFinder
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeDaemonClient(object):
+    path = __file__
+    commands = []
+
+    def run_command(self, argv, config_path):
+        self.commands.append(argv)
+        return 0, '', ''
+
+
+def test_daemon_bypass(monkeypatch):
+    monkeypatch.setattr(stellator, 'DaemonClient', FakeDaemonClient)
+    FakeDaemonClient.commands[:] = []
+
+    assert stellator.run_in_daemon(['daemon']) is None
+    assert stellator.run_in_daemon(['--config', 'daemon', 'daemon', '--watcher', 'poll']) is None
+    assert stellator.run_in_daemon(['--no-daemon', 'status']) is None
+    assert stellator.run_in_daemon(['status', '--trace=trace.json']) is None
+
+    # VM named daemon
+    assert stellator.run_in_daemon(['status', 'daemon']) == 0
+    assert stellator.run_in_daemon(['--config', 'daemon', 'start', 'daemon']) == 0
+    assert FakeDaemonClient.commands == [['status', 'daemon'], ['--config', 'daemon', 'start', 'daemon']]
+
+
+def test_concurrent_load_details(fleet, config):
+    finder = VirtualMachineFinder(config, summary=True)
+    virtualmachine = finder[0]
+    assert virtualmachine.summary
+
+    barrier = threading.Barrier(8)
+    interfaces = []
+
+    def load():
+        barrier.wait()
+        interfaces.append(len(virtualmachine.interfaces))
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert interfaces == [fleet.interfaces] * 8
+    assert not virtualmachine.summary
+    assert virtualmachine.svga_graphics_memory_kb == 786432
+    assert all(interface.virtualmachine is virtualmachine for interface in virtualmachine.interfaces)
+    assert all(share.virtualmachine is virtualmachine for share in virtualmachine.shared_folders.shares)
+
+
+# Fake vmrun blocking starts until killed
+SLOW_VMRUN = '''#!/bin/sh
+if [ "$1" = start ]; then
+    touch "{marker}"
+    sleep 30
+fi
+exec "{vmrun}" "$@"
+'''
+
+
+def start_daemon(fleet):
+    p = subprocess.Popen(
+        [sys.executable, '-c', 'from stellator.bin.stellator import main; main()', 'daemon'],
+        cwd=ROOT,
+        env=fleet.env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    socket_path = fleet.env['STELLATOR_SOCKET']
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return p
+
+
+def stop_process(p):
+    if p.poll() is None:
+        p.kill()
+        p.wait()
+    for fd in (p.stdout, p.stderr):
+        if fd is not None:
+            fd.close()
+
+
+def test_daemon_sigterm(fleet):
+    socket_path = fleet.env['STELLATOR_SOCKET']
+    p = start_daemon(fleet)
+    try:
+        assert os.path.exists(socket_path)
+
+        p.send_signal(signal.SIGTERM)
+        assert p.wait(timeout=10) == 0
+        assert not os.path.exists(socket_path)
+    finally:
+        stop_process(p)
+
+
+def test_daemon_sigterm_during_request(fleet, tmp_path):
+    marker = str(tmp_path / 'vmrun-start')
+    original = '{}.orig'.format(fleet.vmrun_path)
+    os.rename(fleet.vmrun_path, original)
+    with open(fleet.vmrun_path, 'w') as fd:
+        fd.write(SLOW_VMRUN.format(marker=marker, vmrun=original))
+    os.chmod(fleet.vmrun_path, 0o755)
+
+    socket_path = fleet.env['STELLATOR_SOCKET']
+    p = start_daemon(fleet)
+    client = None
+    try:
+        assert os.path.exists(socket_path)
+        client = subprocess.Popen(
+            [sys.executable, '-c', 'from stellator.bin.stellator import main; main()', 'start', fleet.name(1)],
+            cwd=ROOT,
+            env=fleet.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 10
+        while not os.path.exists(marker) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert os.path.exists(marker)
+
+        started = time.monotonic()
+        p.send_signal(signal.SIGTERM)
+        assert p.wait(timeout=10) == 0
+        assert time.monotonic() - started < 5
+        assert not os.path.exists(socket_path)
+    finally:
+        stop_process(p)
+        if client is not None:
+            stop_process(client)
@@ -0,0 +1,99 @@
+"""
+Test configuration file updates
+"""
+
+import os
+
+import pytest
+
+from stellator.fileparser import FileParserError, VMWareConfigFileParser, decode_value
+
+
+def write_file(tmp_path, data, mode=0o644):
+    path = str(tmp_path / 'test.vmx')
+    with open(path, 'wb') as fd:
+        fd.write(data)
+    os.chmod(path, mode)
+    return path
+
+
+def read_file(path):
+    with open(path, 'rb') as fd:
+        return fd.read()
+
+
+def test_update_values(tmp_path):
+    path = write_file(tmp_path, (
+        b'.encoding = "UTF-8"\n'
+        b'# comment = "kept"\n'
+        b'displayName = "old"\n'
+        b'memsize="1024"\n'
+        b'numvcpus = "2"\n'
+    ), mode=0o600)
+
+    changed = VMWareConfigFileParser(path).update_values({
+        'DISPLAYNAME': 'new',
+        'memsize': 4096,
+        'numvcpus': '2',
+        'annotation': 'first "line"|0Asecond\nthird',
+    })
+    assert changed == [
+        'displayName = "new"',
+        'memsize="4096"',
+        'annotation = "first |22line|22|7C0Asecond|0Athird"',
+    ]
+    assert read_file(path) == (
+        b'.encoding = "UTF-8"\n'
+        b'# comment = "kept"\n'
+        b'displayName = "new"\n'
+        b'memsize="4096"\n'
+        b'numvcpus = "2"\n'
+        b'annotation = "first |22line|22|7C0Asecond|0Athird"\n'
+    )
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert decode_value('first |22line|22|7C0Asecond|0Athird') == 'first "line"|0Asecond\nthird'
+
+
+def test_update_values_unchanged(tmp_path):
+    path = write_file(tmp_path, b'.encoding = "UTF-8"\nmemsize = "1024"\n')
+    inode = os.stat(path).st_ino
+
+    assert VMWareConfigFileParser(path).update_values({'memsize': '1024'}) == []
+    assert os.stat(path).st_ino == inode
+    assert os.listdir(str(tmp_path)) == ['test.vmx']
+
+
+def test_update_values_encoding(tmp_path):
+    path = write_file(tmp_path, (
+        '.encoding = "windows-1252"\r\n'
+        'displayName = "Caf\xe9"\r\n'
+        'memsize = "1024"\r\n'
+    ).encode('windows-1252'))
+
+    changed = VMWareConfigFileParser(path).update_values({'displayName': 'Cr\xe8me', 'numvcpus': 4})
+    assert changed == ['displayName = "Cr\xe8me"', 'numvcpus = "4"']
+    assert read_file(path) == (
+        '.encoding = "windows-1252"\r\n'
+        'displayName = "Cr\xe8me"\r\n'
+        'memsize = "1024"\r\n'
+        'numvcpus = "4"\r\n'
+    ).encode('windows-1252')
+
+
+def test_update_values_errors(tmp_path):
+    path = write_file(tmp_path, b'.encoding = "windows-1252"\nmemsize = "1024"\n')
+    data = read_file(path)
+
+    for key in ('', 'mem size', 'memsize = "1"\nnumvcpus', '.encoding'):
+        with pytest.raises(FileParserError):
+            VMWareConfigFileParser(path).update_values({key: '1'})
+
+    # Value can't be encoded with the file encoding
+    with pytest.raises(FileParserError):
+        VMWareConfigFileParser(path).update_values({'displayName': '☃'})
+
+    with pytest.raises(FileParserError):
+        VMWareConfigFileParser(str(tmp_path / 'missing.vmx')).update_values({'memsize': '1'})
+
+    assert read_file(path) == data
+    assert os.listdir(str(tmp_path)) == ['test.vmx']
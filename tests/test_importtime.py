@@ -0,0 +1,26 @@
+"""
+Test modules imported at startup
+"""
+
+import pytest
+
+from benchmarks.importtime import IMPORT_BUDGETS, forbidden_imports, importtime
+
+# Budgets are multiplied for tests, test runs are noisy and may run in parallel
+BUDGET_SCALE = 3
+
+# Import rounds, fastest is compared to the budget
+ROUNDS = 3
+
+
+@pytest.mark.parametrize('module,forbidden', [(module, forbidden) for module, _, forbidden in IMPORT_BUDGETS])
+def test_forbidden_imports(tmp_path, module, forbidden):
+    modules = importtime(module, str(tmp_path))
+    assert module in modules
+    assert forbidden_imports(modules, forbidden) == []
+
+
+@pytest.mark.parametrize('module,budget', [(module, budget) for module, budget, _ in IMPORT_BUDGETS])
+def test_import_budget(tmp_path, module, budget):
+    duration = min(importtime(module, str(tmp_path))[module] for _ in range(ROUNDS)) / 1000.0
+    assert duration <= budget * BUDGET_SCALE
@@ -0,0 +1,151 @@
+"""
+Test inventory reloading and VM finder
+"""
+
+import json
+
+import pytest
+
+from stellator.daemon import FleetModel
+from stellator.fileparser import FileParserError
+from stellator.inventory import Inventory, VirtualMachineFinder
+
+
+def read_inventory(fleet):
+    with open(fleet.inventory_path, 'rb') as fd:
+        return [str(line, 'utf-8', 'replace') for line in fd.read().splitlines()]
+
+
+def write_inventory(fleet, lines):
+    with open(fleet.inventory_path, 'w') as fd:
+        fd.write('\n'.join(lines) + '\n')
+
+
+def break_inventory(fleet):
+    with open(fleet.inventory_path, 'ab') as fd:
+        fd.write(b'broken = "\xff\xfe"\n')
+
+
+def remove_vm(lines, path):
+    """Remove inventory entries of VM
+
+    """
+    prefixes = set('{}.'.format(line.split('.', 1)[0]) for line in lines if path in line)
+    return [line for line in lines if not any(line.startswith(prefix) for prefix in prefixes)]
+
+
+def test_reload_unchanged(config):
+    inventory = Inventory(config)
+    diff = inventory.reload()
+    assert not diff
+    assert diff.vmx_paths == []
+
+
+def test_reload_diff(fleet, config):
+    lines = read_inventory(fleet)
+    path = fleet.vmx_paths[5]
+    write_inventory(fleet, remove_vm(lines, path))
+
+    inventory = Inventory(config)
+    assert len(inventory.vmx_configs) == 5
+    entries = dict((entry.vmx_path, entry) for entry in inventory.vmx_configs)
+    virtualmachine = entries[fleet.vmx_paths[1]].virtualmachine
+
+    renamed = [
+        line.replace('"{}"'.format(fleet.name(1)), '"renamed vm"') if 'DisplayName' in line else line
+        for line in lines
+    ]
+    write_inventory(fleet, renamed)
+    diff = inventory.reload()
+    assert diff
+    assert [entry.vmx_path for entry in diff.added] == [path, path]
+    assert diff.removed == []
+    assert diff.changed == [entries[fleet.vmx_paths[1]]]
+    assert diff.vmx_paths == sorted([path, fleet.vmx_paths[1]])
+
+    # Changed entries are updated in place, loaded VMs are kept
+    assert entries[fleet.vmx_paths[1]].config['name'] == 'renamed vm'
+    assert entries[fleet.vmx_paths[1]].virtualmachine is virtualmachine
+    assert len(inventory.vmx_configs) == 6
+
+    write_inventory(fleet, remove_vm(renamed, fleet.vmx_paths[2]))
+    diff = inventory.reload()
+    assert diff.added == []
+    assert len(diff.removed) == 2
+    assert diff.vmx_paths == [fleet.vmx_paths[2]]
+    assert inventory.find_vmx(fleet.vmx_paths[2]) is None
+    assert len(inventory.vmx_configs) == 5
+
+
+def test_reload_error(fleet, config):
+    inventory = Inventory(config)
+    signature = inventory.signature
+    vmx_configs = list(inventory.vmx_configs)
+
+    break_inventory(fleet)
+    with pytest.raises(FileParserError):
+        inventory.reload()
+    assert inventory.signature == signature
+    assert list(inventory.vmx_configs) == vmx_configs
+    assert inventory.find_vmx(fleet.vmx_paths[0]) is vmx_configs[0]
+
+    # Failed reload is retried
+    with pytest.raises(FileParserError):
+        inventory.reload()
+
+    write_inventory(fleet, read_inventory(fleet)[:-1])
+    diff = inventory.reload()
+    assert not diff
+    assert inventory.signature != signature
+
+
+def test_fleet_model_reload_error(fleet, config, capsys):
+    model = FleetModel(config)
+    finder = model.get_finder()
+
+    break_inventory(fleet)
+    model.refresh()
+    assert model.get_finder() is finder
+    assert 'Error reloading {}'.format(fleet.inventory_path) in capsys.readouterr().err
+
+    write_inventory(fleet, read_inventory(fleet)[:-1])
+    model.refresh(fleet.vmx_paths[:1])
+    assert model.get_finder() is not finder
+    assert len(model.get_finder()) == len(finder)
+
+
+def test_iter_load(config):
+    paths = [vm.path for vm in VirtualMachineFinder(config)]
+
+    finder = VirtualMachineFinder(config, lazy=True)
+    assert len(finder) == 0
+    virtualmachines = finder.iter_load()
+    first = next(virtualmachines)
+    assert list(finder) == [first]
+    assert [vm.path for vm in [first] + list(virtualmachines)] == paths
+    assert [vm.path for vm in finder] == paths
+    assert finder.match_vm_names([first.name]) == [first]
+
+
+def test_iter_load_patterns(fleet, config):
+    # Bundle directory and inventory still have the old name
+    with open(fleet.vmx_paths[3], 'r') as fd:
+        content = fd.read()
+    with open(fleet.vmx_paths[3], 'w') as fd:
+        fd.write(content.replace('displayName = "{}"'.format(fleet.name(3)), 'displayName = "renamed"'))
+
+    patterns = [fleet.name(4), fleet.name(3), fleet.name(1)]
+    finder = VirtualMachineFinder(config, patterns=patterns, lazy=True)
+    virtualmachines = list(finder.iter_load())
+    assert [vm.name for vm in virtualmachines] == [fleet.name(1), fleet.name(4)]
+    assert sorted(vm.name for vm in finder) == ['renamed', fleet.name(1), fleet.name(4)]
+    assert [vm.name for vm in finder.match_vm_names(patterns)] == [fleet.name(4), fleet.name(1)]
+
+
+@pytest.mark.parametrize('command', ('list', 'status', 'details'))
+def test_ndjson_records(run_stellator, command):
+    p = run_stellator(command, '--format', 'ndjson')
+    assert p.returncode == 0
+    records = [json.loads(line) for line in p.stdout.splitlines()]
+    assert len(records) == 6
+    assert records == json.loads(run_stellator(command, '--format', 'json').stdout)
@@ -0,0 +1,99 @@
+"""
+Test VM pattern matching
+"""
+
+from stellator.matcher import (
+    VirtualMachineIndex,
+    VirtualMachinePatterns,
+    glob_may_match_uuid,
+    normalize_uuid_pattern,
+)
+
+
+class FakeVirtualMachine(object):
+    def __init__(self, name, uuid):
+        self.name = name
+        self.uuid = uuid
+
+    def __repr__(self):
+        return '{}'.format(self.name)
+
+
+VIRTUALMACHINES = (
+    FakeVirtualMachine('build-1', '564d1f2a3b4c5d6e7f8091a2b3c4d5e6'),
+    FakeVirtualMachine('Build-2', '564d1f2a99999999aaaaaaaaaaaaaaaa'),
+    FakeVirtualMachine('test', 'aabbccddeeff00112233445566778899'),
+    FakeVirtualMachine('no-uuid', None),
+    FakeVirtualMachine(None, '0123456789abcdef0123456789abcdef'),
+    FakeVirtualMachine('test', None),
+)
+
+
+def match(patterns, case_sensitive=False):
+    index = VirtualMachineIndex(VIRTUALMACHINES)
+    return VirtualMachinePatterns(patterns, case_sensitive=case_sensitive).match(index)
+
+
+def vm(index):
+    return VIRTUALMACHINES[index]
+
+
+def test_normalize_uuid_pattern():
+    assert normalize_uuid_pattern('56 4d 1f 2a-3B') == '564d1f2a3b'
+    assert normalize_uuid_pattern('564d1f2') is None
+    assert normalize_uuid_pattern('build-1234') is None
+
+
+def test_glob_may_match_uuid():
+    assert glob_may_match_uuid('564d*')
+    assert glob_may_match_uuid('*[ab]?-1')
+    assert not glob_may_match_uuid('build*')
+
+
+def test_match_names():
+    assert match(['test']) == [vm(2), vm(5)]
+    assert match(['BUILD-1', 'missing']) == [vm(0)]
+    assert match(['build*']) == [vm(0), vm(1)]
+    assert match(['*-?']) == [vm(0), vm(1)]
+
+
+def test_match_order():
+    # Order of patterns, VMs matching same pattern in index order, no duplicates
+    assert match(['test', 'build*', 'build-1']) == [vm(2), vm(5), vm(0), vm(1)]
+    assert match(['Build-2', 'b*']) == [vm(1), vm(0)]
+
+
+def test_match_case_sensitive():
+    # Case sensitive matching crashed with undefined variable before
+    assert match(['Build*'], case_sensitive=True) == [vm(1)]
+    assert match(['build-2'], case_sensitive=True) == []
+    assert match(['Build-2'], case_sensitive=True) == [vm(1)]
+    assert match(['564D1F2A3B4C'], case_sensitive=True) == [vm(0)]
+
+
+def test_match_uuid():
+    assert match(['564d1f2a']) == [vm(0), vm(1)]
+    assert match(['56 4d 1f 2a 3b 4c 5d 6e-7f 80 91 a2 b3 c4 d5 e6']) == [vm(0)]
+    assert match(['0123*']) == [vm(4)]
+    assert match(['564d1f2']) == []
+
+
+def test_match_missing_values():
+    # VMs without name or UUID crashed matching before
+    assert match(['*']) == list(VIRTUALMACHINES)
+    assert match(['no-*', '*cdef']) == [vm(3), vm(4)]
+
+
+def test_match_values():
+    patterns = VirtualMachinePatterns(['build*', 'test', '564d1f2a'])
+    assert patterns.matches_uuid
+    assert patterns.match_values('Build-3')
+    assert patterns.match_values('TEST')
+    assert patterns.match_values(None, '564D1F2A-0000')
+    assert patterns.match_values(uuid=None, name='build')
+    assert not patterns.match_values('other', None)
+    assert not patterns.match_values()
+
+    patterns = VirtualMachinePatterns(['build*'], case_sensitive=True)
+    assert not patterns.matches_uuid
+    assert not patterns.match_values('Build-1')
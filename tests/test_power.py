@@ -0,0 +1,111 @@
+"""
+Test parallel power operations
+"""
+
+import os
+
+import pytest
+
+from stellator.power import PowerOperationEngine, PowerOperationError
+
+# Fake vmrun failing starts of VMs with name in the script
+FAILING_VMRUN = '''#!/bin/sh
+if [ "$1" = start ] && grep -qF "$(basename "$2")" "$0"; then
+    echo "Error: failed to start $2" >&2
+    exit 1
+fi
+exec "{vmrun}" "$@"
+'''
+
+
+def fail_starts(fleet, names):
+    original = '{}.orig'.format(fleet.vmrun_path)
+    os.rename(fleet.vmrun_path, original)
+    with open(fleet.vmrun_path, 'w') as fd:
+        fd.write(FAILING_VMRUN.format(vmrun=original))
+        fd.write(''.join('# {}.vmx\n'.format(name) for name in names))
+    os.chmod(fleet.vmrun_path, 0o755)
+
+
+def test_invalid_jobs():
+    for jobs in (0, -1, 'many'):
+        with pytest.raises(PowerOperationError):
+            PowerOperationEngine(jobs=jobs)
+
+
+def test_unknown_operation(finder):
+    with pytest.raises(PowerOperationError):
+        PowerOperationEngine().run('reboot', list(finder))
+
+
+def test_empty_results():
+    results = PowerOperationEngine(jobs=4).run('start', [])
+    assert results == []
+    assert results.errors == []
+    assert results.duration == 0.0
+    assert results.format_summary() == []
+
+
+@pytest.mark.parametrize('jobs', (1, 4))
+def test_start_stop(finder, jobs):
+    virtualmachines = list(finder)
+    called = []
+    engine = PowerOperationEngine(jobs=jobs, callback=called.append)
+
+    results = engine.run('start', virtualmachines)
+    assert [result.virtualmachine for result in results] == virtualmachines
+    assert [result.status for result in results] == ['ok'] * len(virtualmachines)
+    assert sorted(called, key=lambda result: result.name) == sorted(results, key=lambda result: result.name)
+    assert results.errors == []
+    finder.inventory.running.invalidate()
+    assert all(virtualmachine.is_running for virtualmachine in virtualmachines)
+    for result in results:
+        assert result.submitted <= result.started <= result.finished
+        assert result.elapsed >= result.duration
+
+    results = engine.run('stop', virtualmachines)
+    assert results.errors == []
+    finder.inventory.running.invalidate()
+    assert not any(virtualmachine.is_running for virtualmachine in virtualmachines)
+
+
+@pytest.mark.parametrize('jobs', (1, 4))
+def test_streamed_operations(finder, jobs):
+    events = []
+
+    def virtualmachines():
+        for virtualmachine in finder:
+            events.append(('loaded', virtualmachine.name))
+            yield virtualmachine
+
+    engine = PowerOperationEngine(jobs=jobs, callback=lambda result: events.append(('start', result.name)))
+    results = engine.run('start', virtualmachines())
+    assert results.errors == []
+    assert len(results) == len(finder)
+    # First VM is started before the rest are loaded
+    assert events.index(('start', finder[0].name)) < events.index(('loaded', finder[-1].name))
+
+
+def test_errors(fleet, finder):
+    fail_starts(fleet, (fleet.name(1), fleet.name(4)))
+    virtualmachines = sorted(finder, key=lambda virtualmachine: virtualmachine.name)
+
+    results = PowerOperationEngine(jobs=3).run('start', virtualmachines)
+    assert [result.name for result in results.errors] == [fleet.name(1), fleet.name(4)]
+    assert [result.status for result in results] == ['ok', 'error', 'ok', 'ok', 'error', 'ok']
+    assert 'failed to start' in '{}'.format(results.errors[0].error)
+
+    summary = results.format_summary()
+    assert len(summary) == len(virtualmachines) + 2
+    assert summary[-1].startswith('6 virtual machines, 2 errors')
+
+
+def test_error_exit(fleet, run_stellator):
+    fail_starts(fleet, (fleet.name(2),))
+
+    p = run_stellator('start', '--jobs', '2', fleet.name(1), fleet.name(2))
+    assert p.returncode == 1
+    assert '2 virtual machines, 1 errors' in p.stdout + p.stderr
+
+    p = run_stellator('start', fleet.name(1))
+    assert p.returncode == 0
@@ -0,0 +1,92 @@
+"""
+Test running VMs snapshot
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from stellator.config import StellatorConfig, StellatorConfigError
+from stellator.running import RunningStateSnapshot, VMRunDetector
+
+RUNNING_VMS = (
+    '/vms/one.vmwarevm/one.vmx',
+    '/vms/two.vmwarevm/two.vmx',
+)
+
+
+class FakeAsyncVMRun(object):
+    def __init__(self, paths, delay=0.05):
+        self.paths = list(paths)
+        self.delay = delay
+        self.calls = 0
+
+    async def running_vms(self, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.paths
+
+
+def test_async_refresh_single_flight():
+    vmrun = FakeAsyncVMRun(RUNNING_VMS)
+    snapshot = RunningStateSnapshot(VMRunDetector(None))
+
+    async def check(paths):
+        return await asyncio.gather(*[snapshot.async_is_running(path, vmrun) for path in paths])
+
+    paths = list(RUNNING_VMS) * 5 + ['/vms/three.vmwarevm/three.vmx']
+    assert asyncio.run(check(paths)) == [True] * 10 + [False]
+    assert vmrun.calls == 1
+
+    assert asyncio.run(check(paths)) == [True] * 10 + [False]
+    assert vmrun.calls == 1
+
+    snapshot.invalidate()
+    assert asyncio.run(check(paths)) == [True] * 10 + [False]
+    assert vmrun.calls == 2
+
+
+def test_async_is_running_expired():
+    # Snapshot expires immediately: result must come from the refreshed paths, not
+    # from a synchronous refresh with the detector
+    vmrun = FakeAsyncVMRun(RUNNING_VMS, delay=0)
+    snapshot = RunningStateSnapshot(VMRunDetector(None), ttl=-1)
+
+    assert asyncio.run(snapshot.async_is_running(RUNNING_VMS[0], vmrun)) is True
+    assert asyncio.run(snapshot.async_is_running('/vms/three.vmwarevm/three.vmx', vmrun)) is False
+    assert vmrun.calls == 2
+
+
+class ThreadRecordingDetector(object):
+    name = 'lockfile'
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.threads = []
+
+    def running_vms(self):
+        self.threads.append(threading.current_thread())
+        return self.paths
+
+
+def test_async_refresh_executor():
+    detector = ThreadRecordingDetector(RUNNING_VMS)
+    snapshot = RunningStateSnapshot(detector)
+
+    assert asyncio.run(snapshot.async_is_running(RUNNING_VMS[1], None)) is True
+    assert len(detector.threads) == 1
+    assert detector.threads[0] is not threading.current_thread()
+
+
+def test_unknown_running_detector(fleet, run_stellator):
+    with open(fleet.config_path, 'a') as fd:
+        fd.write('running_detector = "psutil"\n')
+
+    with pytest.raises(StellatorConfigError):
+        StellatorConfig(fleet.config_path)
+
+    p = run_stellator('status')
+    assert p.returncode == 1
+    assert 'Unknown running_detector psutil' in p.stdout + p.stderr
+    assert 'Traceback' not in p.stderr
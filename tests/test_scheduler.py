@@ -0,0 +1,100 @@
+"""
+Test deadline aware suspend scheduling
+"""
+
+import time
+
+from stellator.power import PowerOperationEngine
+from stellator.scheduler import DeadlineSuspendScheduler, ScheduledPowerOperation, StartScheduler
+
+
+class FakeVirtualMachine(object):
+    def __init__(self, name, memory=1024, is_running=True):
+        self.name = name
+        self.path = '/vms/{}.vmwarevm/{}.vmx'.format(name, name)
+        self.memory = memory
+        self.is_running = is_running
+        self.operations = []
+
+    def start(self):
+        self.operations.append('start')
+
+    def suspend(self, autoresume=False):
+        self.operations.append('suspend')
+
+    def stop(self, autoresume=False):
+        self.operations.append('stop')
+
+
+def test_fallback_before_callback():
+    virtualmachines = [FakeVirtualMachine('fast'), FakeVirtualMachine('slow')]
+    deadline = time.monotonic() + 60
+    operations = [
+        ScheduledPowerOperation(virtualmachines[0], 'suspend', memory=1024, estimate=1, deadline=deadline),
+        ScheduledPowerOperation(virtualmachines[1], 'suspend', memory=1024, estimate=120, deadline=deadline),
+    ]
+
+    reported = []
+    results = PowerOperationEngine(callback=lambda result: reported.append(result.operation)).execute(operations)
+    assert reported == ['suspend', 'stop']
+    assert [result.operation for result in results] == ['suspend', 'stop']
+    assert [vm.operations for vm in virtualmachines] == [['suspend'], ['stop']]
+
+
+def scheduler_config(tmp_path):
+    return {
+        'suspend_jobs': 1,
+        'suspend_seconds_per_mb': 0.01,
+        'suspend_overhead': 2,
+        'suspend_stop_estimate': 10,
+        'suspend_history': str(tmp_path / 'suspend-history.json'),
+    }
+
+
+def test_plan_stop_estimate(tmp_path):
+    virtualmachines = [
+        FakeVirtualMachine('large', memory=2048),
+        FakeVirtualMachine('medium', memory=1024),
+        FakeVirtualMachine('small', memory=256),
+    ]
+    scheduler = DeadlineSuspendScheduler(scheduler_config(tmp_path), deadline=30)
+
+    # large takes 22.48s of the slot and medium does not fit. The planned stop of
+    # medium takes 10s, leaving no time to suspend small before the deadline.
+    operations = scheduler.plan(virtualmachines)
+    assert [operation.virtualmachine.name for operation in operations] == ['large', 'medium', 'small']
+    assert [operation.operation for operation in operations] == ['suspend', 'stop', 'stop']
+
+    scheduler.stop_estimate = 2
+    assert [operation.operation for operation in scheduler.plan(virtualmachines)] == ['suspend', 'stop', 'suspend']
+
+
+def test_history_skips_stopped_vms(tmp_path):
+    virtualmachines = [FakeVirtualMachine('running'), FakeVirtualMachine('stopped', is_running=False)]
+    scheduler = DeadlineSuspendScheduler(scheduler_config(tmp_path), deadline=60)
+
+    results = scheduler.run(virtualmachines)
+    assert [result.operation for result in results] == ['suspend', 'suspend']
+    assert [result.suspended for result in results] == [True, False]
+    assert scheduler.history.seconds_per_mb(virtualmachines[0]) is not None
+    assert scheduler.history.seconds_per_mb(virtualmachines[1]) is None
+
+
+def test_start_streamed_vms():
+    virtualmachines = [FakeVirtualMachine('first'), FakeVirtualMachine('second')]
+    config = {
+        'max_concurrent_starts': 1,
+        'start_memory_budget': 0,
+        'start_cores_budget': 0,
+        'start_priorities': {},
+    }
+    events = []
+
+    def loaded():
+        for virtualmachine in virtualmachines:
+            events.append(('loaded', virtualmachine.name))
+            yield virtualmachine
+
+    results = StartScheduler(config, callback=lambda result: events.append(('start', result.name))).run(loaded())
+    assert [result.status for result in results] == ['ok', 'ok']
+    assert events == [('loaded', 'first'), ('start', 'first'), ('loaded', 'second'), ('start', 'second')]
@@ -0,0 +1,75 @@
+"""
+Test setting .vmx values
+"""
+
+import pytest
+
+from stellator.bin.commands.daemon import run_daemon_command
+from stellator.inventory import VirtualMachineFinder
+from stellator.virtualmachine import VirtualMachineError
+
+
+def read_vmx(fleet, index):
+    with open(fleet.vmx_paths[index], 'r') as fd:
+        return fd.read().splitlines()
+
+
+def test_set_command(fleet, run_stellator):
+    p = run_stellator('set', fleet.name(1), fleet.name(2), 'memsize=8192', 'annotation=a=b')
+    assert p.returncode == 0, p.stdout + p.stderr
+    for index in (1, 2):
+        lines = read_vmx(fleet, index)
+        assert 'memsize = "8192"' in lines
+        assert 'annotation = "a=b"' in lines
+    assert 'memsize = "8192"' not in read_vmx(fleet, 0)
+
+    # Operation column fits set_values
+    summary = [line for line in p.stdout.splitlines() if line.startswith((fleet.name(1), fleet.name(2), 'Name'))]
+    assert len(summary) == 3
+    assert len(set(line.index(' ok ') for line in summary[1:])) == 1
+    assert summary[0].index('Status') == summary[1].index(' ok ') + 1
+
+    p = run_stellator('set', '-s', 'numvcpus=4', '--set', 'memsize=4096', fleet.name(3))
+    assert p.returncode == 0, p.stdout + p.stderr
+    lines = read_vmx(fleet, 3)
+    assert 'numvcpus = "4"' in lines
+    assert 'memsize = "4096"' in lines
+
+    p = run_stellator('set', '-s', 'memsize', fleet.name(1))
+    assert p.returncode == 1
+    assert 'expected KEY=VALUE' in p.stdout + p.stderr
+
+    p = run_stellator('set', fleet.name(1))
+    assert p.returncode == 1
+    assert 'No values to set' in p.stdout + p.stderr
+
+    p = run_stellator('set', 'memsize=8192')
+    assert p.returncode == 1
+    assert 'No VM patterns given' in p.stdout + p.stderr
+
+
+def test_set_running_state(fleet, config):
+    finder = VirtualMachineFinder(config, summary=True)
+    virtualmachine = finder.match_vm_names([fleet.name(3)])[0]
+    assert virtualmachine.status == 'stopped'
+
+    # Snapshot is refreshed for the check, although it's not expired
+    fleet.set_running([virtualmachine.path])
+    with pytest.raises(VirtualMachineError):
+        virtualmachine.set_values({'memsize': '2048'})
+    assert 'memsize = "2048"' not in read_vmx(fleet, 3)
+
+    fleet.set_running(())
+    assert virtualmachine.set_values({'memsize': '2048'}) == ['memsize = "2048"']
+    assert virtualmachine.memory == 2048
+
+
+def test_set_name_index(fleet, config):
+    finder = VirtualMachineFinder(config, summary=True)
+    virtualmachine = finder.match_vm_names([fleet.name(4)])[0]
+
+    status, stdout, stderr = run_daemon_command(['set', '-s', 'displayName=renamed', fleet.name(4)], finder)
+    assert status == 0, stdout + stderr
+    assert virtualmachine.name == 'renamed'
+    assert finder.match_vm_names(['renamed']) == [virtualmachine]
+    assert finder.match_vm_names([fleet.name(4)]) == []
@@ -0,0 +1,66 @@
+"""
+Test loading VM configuration
+"""
+
+from stellator.config import StellatorConfig
+from stellator.inventory import Inventory
+from stellator.util import DEFAULT_ARP_TABLE_TTL
+from stellator.virtualmachine import SUMMARY_BYTE_BUDGET, VirtualMachine
+
+
+def pad_vmx(path, size):
+    """Move displayName after size bytes of other keys
+
+    """
+    with open(path, 'r') as fd:
+        lines = fd.read().splitlines()
+    name = [line for line in lines if line.startswith('displayName')]
+    lines = [line for line in lines if not line.startswith('displayName')]
+    padding = ['comment{} = "{}"'.format(index, 'x' * 100) for index in range(size // 100)]
+    with open(path, 'w') as fd:
+        fd.write('\n'.join(lines[:1] + padding + lines[1:] + name) + '\n')
+
+
+def test_summary(fleet, config):
+    inventory = Inventory(config, use_cache=False)
+    virtualmachine = VirtualMachine(inventory, fleet.vmx_paths[0], summary=True)
+    assert virtualmachine.summary
+    assert virtualmachine.name == fleet.name(0)
+    assert 'interfaces' not in virtualmachine.__dict__
+
+    assert len(virtualmachine.interfaces) == fleet.interfaces
+    assert not virtualmachine.summary
+
+
+def test_summary_budget(fleet, config):
+    pad_vmx(fleet.vmx_paths[0], SUMMARY_BYTE_BUDGET)
+
+    for use_cache in (False, True, True):
+        inventory = Inventory(config, use_cache=use_cache)
+        virtualmachine = VirtualMachine(inventory, fleet.vmx_paths[0], summary=True)
+        assert virtualmachine.name == fleet.name(0)
+        assert not virtualmachine.summary
+        assert len(virtualmachine.interfaces) == fleet.interfaces
+        assert virtualmachine.guest_os is not None
+        if inventory.cache is not None:
+            inventory.cache.save()
+
+
+def test_arp_table_ttl(fleet):
+    assert Inventory(StellatorConfig(fleet.config_path)).arp_table.ttl == DEFAULT_ARP_TABLE_TTL
+
+    with open(fleet.config_path, 'a') as fd:
+        fd.write('arp_table_ttl = 120\n')
+    inventory = Inventory(StellatorConfig(fleet.config_path))
+    assert inventory.arp_table.ttl == 120
+    assert inventory.arp_table is inventory.arp_table
+
+
+def test_arp_command(fleet, config):
+    inventory = Inventory(config)
+    assert inventory.arp_table.command == (fleet.arp_path, '-an')
+
+    virtualmachine = VirtualMachine(inventory, fleet.vmx_paths[2])
+    assert [interface.ip_address for interface in virtualmachine.interfaces] == [
+        fleet.ip_address(2, interface) for interface in range(fleet.interfaces)
+    ]